@@ -8,7 +8,8 @@ a = Analysis(['jvereinmultiuser/app.py'],
              datas=[
                 ('jvereinmultiuser/resources', 'jvereinmultiuser/resources')
              ],
-             hiddenimports=[],
+             # imported lazily, inside functions
+             hiddenimports=['jks', 'Crypto.PublicKey.RSA', 'requests'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
@@ -3,24 +3,40 @@
 import os
 import sys
 import json
+import time
+import shutil
 import pkgutil
 import logging
 import argparse
-import requests
+import threading
+import subprocess
+import logging.handlers
 import textwrap
 import traceback
+import contextlib
+import hashlib
 import configparser
-from typing import Optional, Type
+from typing import Callable, List, Optional, Type
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from concurrent.futures import ThreadPoolExecutor
 from getpass import getpass
 import jvereinmultiuser.hooks as hooks
-from jvereinmultiuser.gitlocker import GitLocker, GitError, IsLockedError
+import jvereinmultiuser.csvdelta as csvdelta
+import jvereinmultiuser.lockstats as lockstats
+from jvereinmultiuser.metrics import Metrics
+from jvereinmultiuser.gitlocker import (
+    GitLocker, GitError, IsLockedError, HistoryRewrittenError, GitProgress, CommitStats, BUNDLE_UPLOAD)
 from jvereinmultiuser.jvereinmanager import (
-    JVereinManager, JameicaVersionDiffersError, DecryptionError,
-    DEFAULT_JAMEICA_EXEC_PATH, DEFAULT_PLUGIN_XML_PATH, DEFAULT_JAVA_PATH, DEFAULT_H2_DIR)
+    JVereinManager, JameicaVersionDiffersError, DecryptionError, CsvExport, DEFAULT_EXPORTS, DEFAULT_CSV_OPTIONS,
+    DEFAULT_JAMEICA_EXEC_PATH, DEFAULT_PLUGIN_XML_PATH, DEFAULT_JAVA_PATH, DEFAULT_H2_DIR, JVEREIN_DUMP_PATH)
 
 
 VERSION = "1.1.1"
 
+# for the time to the first prompt in the log
+_START_TIME = time.monotonic()
+
 _VERSION_URL = "https://github.com/fkuersch/jverein-multiuser/releases/latest/download/VERSION"
 _RELEASE_URL = "https://github.com/fkuersch/jverein-multiuser/releases/latest"
 
@@ -32,6 +48,9 @@ _DEFAULT_USER_CONFIG = textwrap.dedent(f"""\
     
     [Repository]
     #remote = ssh://user@git.example.org:~/jverein.git
+    # Gemeinsamer Objektspeicher für mehrere Vereine (Arbeitsverzeichnisse),
+    # identische Dateien werden nur einmal gespeichert. Nicht löschen, solange er benutzt wird!
+    #shared_objects = ~/.jverein-multiuser/objects
     
     # Wenn Jameica mit Hibiscus-Mashup installiert wurde,
     # kann Folgendes ignoriert werden:
@@ -40,6 +59,12 @@ _DEFAULT_USER_CONFIG = textwrap.dedent(f"""\
     #plugin_xml = {DEFAULT_PLUGIN_XML_PATH}
     #java = {DEFAULT_JAVA_PATH}
     #h2_dir = {DEFAULT_H2_DIR}
+    
+    #[Hooks]
+    # Maximale Laufzeit eines Hook-Scripts in Sekunden
+    #timeout = {hooks.DEFAULT_TIMEOUT:.0f}
+    # Hook post_upload im Hintergrund ausführen, das Fenster kann dann sofort geschlossen werden
+    #detached_post_upload = false
 """)
 
 if sys.platform.startswith("win32") or sys.platform.startswith("cygwin"):
@@ -54,6 +79,59 @@ else:
 
 _GITIGNORE_RESOURCE = os.path.join("resources", "jverein.gitignore")
 
+# compressed bytes a single commit may add to the repository before a warning is printed,
+# can be set in the repo config: [Repository] commit_budget_mb
+DEFAULT_COMMIT_BUDGET_MB = 5.0
+
+# (name, path prefix, path suffix) of the paths reported separately in the commit size accounting,
+# the first match wins
+_SIZE_GROUPS = [
+    ("Plugins", "jameica/plugins/", ""),
+    ("Datenbank-Dumps", "jameica/", ".sql"),
+    ("Jameica", "jameica/", ""),
+    ("Exporte", "dump/", ""),
+]
+
+# in the working directory, for the textfile collector of the Prometheus node exporter
+_METRICS_FILE = "jverein_multiuser.prom"
+
+_EXPORT_SECTION_PREFIX = "Export:"
+
+# the added and removed addresses are written next to the email export, for mailing list syncs
+_EMAIL_EXPORT_FILE = "mitglieder-emails.csv"
+_EMAIL_ADDED_FILE = "mitglieder-emails-added.csv"
+_EMAIL_REMOVED_FILE = "mitglieder-emails-removed.csv"
+
+COMMANDS = ["status", "lock", "unlock", "push", "export", "sync", "lock-stats", "compact",
+            "export-bundle", "import-bundle"]
+
+# 'compact' archives the history older than this by default
+DEFAULT_COMPACT_AGE_DAYS = 2 * 365
+
+# marker of the last compaction in config.ini, other users adopt the rewritten history with its help
+_HISTORY_SECTION = "History"
+
+# session log: a new file for every session, each file is limited in size
+_LOG_DIR_NAME = "logs"
+_LOG_FILE_NAME = "jverein-multiuser.log"
+# commands without user interaction (ie. 'status' from cron) share one log, it's only rotated by size
+_COMMAND_LOG_FILE_NAME = "commands.log"
+_LOG_MAX_BYTES = 5 * 1024 * 1024
+_LOG_BACKUP_COUNT = 5
+
+# hidden command: runs a hook in the background, started by the app itself
+_RUN_HOOK_COMMAND = "_run-hook"
+
+# Windows API, see App._is_process_running()
+_PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+_ERROR_ACCESS_DENIED = 5
+_STILL_ACTIVE = 259
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+# 2: invalid arguments (argparse)
+EXIT_LOCKED = 3
+
 
 class CancelAppException(Exception):
     """ App cancelled """
@@ -61,19 +139,34 @@ class CancelAppException(Exception):
 
 class App:
 
-    def __init__(self, working_dir: str, check_for_updates: bool = True):
+    def __init__(self, working_dir: str, check_for_updates: bool = True, max_wait: Optional[float] = None):
+        """
+        Args:
+            working_dir: Working directory for the repository and the configuration files
+            check_for_updates: Check for new releases of jverein-multiuser
+            max_wait: If the repository is locked by someone else, wait up to max_wait seconds
+                for the lock to be released, then lock and start jVerein
+        """
         self._working_dir = working_dir
         self._allow_check_for_updates = check_for_updates
+        self._update_check_thread: Optional[threading.Thread] = None
+        self._update_check_messages: List[str] = []
+        self._prompted = False
+        self._max_wait = max_wait
         self._user_config_path = os.path.join(self._working_dir, "user_config.ini")
         self._jameica_config_path = os.path.join(self._working_dir, "jameica_config.json")
         self._local_repo_dir = os.path.join(self._working_dir, "repo")
         self._repo_config_path = os.path.join(self._local_repo_dir, "config.ini")
+        self._teardown_journal_path = os.path.join(self._working_dir, "teardown_journal.json")
 
         self._user_config = configparser.ConfigParser()
         self._author_name = ""
         self._author_email = ""
         self._author_computer = ""
         self._remote_repo = ""
+        self._shared_objects_dir: Optional[str] = None
+        self._hook_timeout = hooks.DEFAULT_TIMEOUT
+        self._detached_post_upload = False
 
         self._jameica_user_properties = {}
 
@@ -82,21 +175,47 @@ class App:
 
         self._repo_config = configparser.ConfigParser()
 
-    def _check_for_updates(self):
+        self._metrics = Metrics(os.path.join(self._working_dir, _METRICS_FILE))
+
+    def _start_update_check(self):
+        """
+        Check for updates in the background, the result is printed before the next prompt.
+        """
         if not self._allow_check_for_updates:
             return
-        print("Suche nach Updates")
+        self._update_check_thread = threading.Thread(target=self._check_for_updates, daemon=True)
+        self._update_check_thread.start()
+
+    def _check_for_updates(self):
+        messages = []
         try:
+            import requests  # imported here: slow to import and only needed for the update check
             r = requests.get(_VERSION_URL, timeout=5.0)
             update_version = r.text.strip()
             if update_version != VERSION:
-                print(f"Es ist ein Update für jverein-multiuser verfügbar: {update_version}")
-                print(f"Installiert ist: {VERSION}")
-                print(f"Jetzt herunterladen: {_RELEASE_URL}")
+                messages.append(f"Es ist ein Update für jverein-multiuser verfügbar: {update_version}")
+                messages.append(f"Installiert ist: {VERSION}")
+                messages.append(f"Jetzt herunterladen: {_RELEASE_URL}")
             else:
-                print("jverein-multiuser ist auf dem aktuellen Stand")
+                logging.getLogger(__name__).info("jverein-multiuser is up to date")
         except Exception as e:
-            print(f"Suche nach Updates fehlgeschlagen: {e}")
+            messages.append(f"Suche nach Updates fehlgeschlagen: {e}")
+        self._update_check_messages = messages
+
+    def _before_prompt(self, wait_for_update_check: bool = False):
+        if wait_for_update_check and self._update_check_thread:
+            self._update_check_thread.join(timeout=5.0)
+        if not self._prompted:
+            self._prompted = True
+            logging.getLogger(__name__).info(f"first prompt after {time.monotonic() - _START_TIME:.2f} s")
+
+        # a pending update check doesn't delay the prompt, it's reported before the next one
+        if self._update_check_thread and not self._update_check_thread.is_alive():
+            self._update_check_thread = None
+            for message in self._update_check_messages:
+                print(message)
+            if self._update_check_messages:
+                print("")
 
     def _check_expected_jvereinmultiuser_version(self):
         if not self._expected_jvereinmultiuser_version:
@@ -106,6 +225,7 @@ class App:
         if self._expected_jvereinmultiuser_version == VERSION:
             return
 
+        self._before_prompt(wait_for_update_check=True)  # the update is the solution
         print("Die Version von jverein-multiuser hat sich geändert!")
         print(f"Erwartet:           {self._expected_jvereinmultiuser_version}")
         print(f"Auf deinem System:  {VERSION}")
@@ -163,11 +283,14 @@ class App:
         self._author_email = self._user_config["Author"]["email"]
         self._author_computer = self._user_config["Author"]["computer"]
         self._remote_repo = self._user_config["Repository"]["remote"]
+        self._shared_objects_dir = self._user_config.get("Repository", "shared_objects", fallback=None) or None
 
         self._path_jameica_exec = self._user_config.get("Paths", "jameica_exec", fallback=None)
         self._path_plugin_xml = self._user_config.get("Paths", "plugin_xml", fallback=None)
         self._path_java = self._user_config.get("Paths", "java", fallback=None)
         self._path_h2_dir = self._user_config.get("Paths", "h2_dir", fallback=None)
+        self._hook_timeout = self._user_config.getfloat("Hooks", "timeout", fallback=hooks.DEFAULT_TIMEOUT)
+        self._detached_post_upload = self._user_config.getboolean("Hooks", "detached_post_upload", fallback=False)
 
     def _read_repo_config_file(self):
         self._repo_config.read(self._repo_config_path)
@@ -178,6 +301,8 @@ class App:
 
     @_expected_jameica_version.setter
     def _expected_jameica_version(self, value):
+        if not self._repo_config.has_section("Jameica"):
+            self._repo_config.add_section("Jameica")
         self._repo_config.set("Jameica", "expectedversion", value)
 
     @property
@@ -190,6 +315,41 @@ class App:
             self._repo_config.add_section("JvereinMultiuser")
         self._repo_config.set("JvereinMultiuser", "expectedversion", value)
 
+    @property
+    def _commit_budget_bytes(self) -> int:
+        budget_mb = self._repo_config.getfloat("Repository", "commit_budget_mb", fallback=DEFAULT_COMMIT_BUDGET_MB)
+        return int(budget_mb * 1024 * 1024)
+
+    @staticmethod
+    def _get_exports(repo_config: configparser.ConfigParser) -> List[CsvExport]:
+        """
+        Returns:
+            The built-in exports, extended or overridden by the [Export:<name>] sections of the repo config
+        """
+        exports = {export.name: export for export in DEFAULT_EXPORTS}
+        for section in repo_config.sections():
+            if not section.startswith(_EXPORT_SECTION_PREFIX):
+                continue
+            name = section[len(_EXPORT_SECTION_PREFIX):].strip()
+            if not repo_config.getboolean(section, "enabled", fallback=True):
+                exports.pop(name, None)
+                continue
+
+            default = exports.get(name)
+            # raw: '%' is common in SQL (LIKE)
+            sql = repo_config.get(section, "sql", raw=True, fallback=default.sql if default else None)
+            if not sql:
+                print(f"Export '{name}' wird ignoriert: 'sql' fehlt in config.ini")
+                continue
+            exports[name] = CsvExport(
+                name=name,
+                file=repo_config.get(section, "file", raw=True, fallback=default.file if default else f"{name}.csv"),
+                sql=sql,
+                options=repo_config.get(section, "options", raw=True,
+                                        fallback=default.options if default else DEFAULT_CSV_OPTIONS)
+            )
+        return list(exports.values())
+
     def _write_repo_config_file(self):
         if (not self._expected_jameica_version
                 and self._jverein_manager and self._jverein_manager.current_jameica_version):
@@ -240,13 +400,16 @@ class App:
             with open(repo_gitignore_path, "wb") as f:
                 f.write(gitignore_data)
 
-    def _run_hook_and_retry_on_failure(self, hook: Type[hooks.GenericHook]):
+    def _run_hook_and_retry_on_failure(self, hook: Type[hooks.GenericHook], interactive: bool = True):
         response = "j"
         while response == "j":
             try:
-                hooks.run_hook(hook, self._local_repo_dir)
+                self._record_hook_results(hook, hooks.run_hook(hook, self._local_repo_dir, timeout=self._hook_timeout))
                 break
             except hooks.HookExecutionError as e:
+                self._record_hook_results(hook, e.results)
+                if not interactive:
+                    raise
                 print(textwrap.dedent(f"""\
                     Es ist ein Fehler beim Ausführen des Hook-Scripts aufgetreten ({e.message}).
                     Möchtest Du das Script erneut starten?
@@ -256,12 +419,264 @@ class App:
                 """))
                 response = self._user_input(["j", "n"])
 
+    def _record_hook_results(self, hook: Type[hooks.GenericHook], results: List[hooks.HookResult]):
+        for result in results:
+            script = os.path.relpath(result.script_path, os.path.join(self._local_repo_dir, "hooks"))
+            self._metrics.set("jverein_multiuser_hook_duration_seconds", round(result.duration, 3),
+                              hook=hook.name, script=script)
+
+    def _release_lock(self, release: Callable[[], None]):
+        """
+        Run GitLocker.unlock() or push_and_unlock() and record how long the lock has been held.
+        """
+        held = self._gitlocker.get_lock_held_seconds()
+        release()
+        if held is not None:
+            self._metrics.set("jverein_multiuser_lock_hold_seconds", round(held))
+            self._metrics.add("jverein_multiuser_lock_hold_seconds_total", round(held))
+            self._metrics.add("jverein_multiuser_locks_total", 1)
+
+    def _record_dump_stats(self):
+        for stats in self._jverein_manager.get_dump_stats():
+            self._metrics.set("jverein_multiuser_dump_bytes", stats.bytes, database=stats.database)
+            self._metrics.set("jverein_multiuser_dump_rows", stats.rows, database=stats.database)
+
+    def _write_metrics(self):
+        if self._gitlocker and self._gitlocker.pushed_bytes:
+            self._metrics.set("jverein_multiuser_push_bytes", self._gitlocker.pushed_bytes)
+            self._metrics.add("jverein_multiuser_push_bytes_total", self._gitlocker.pushed_bytes)
+        self._metrics.write()
+
+    def _run_post_upload_hook(self, interactive: bool = True):
+        if self._detached_post_upload:
+            self._start_detached_hook(hooks.PostUploadHook)
+        else:
+            self._run_hook_and_retry_on_failure(hooks.PostUploadHook, interactive=interactive)
+
+    def _start_detached_hook(self, hook: Type[hooks.GenericHook]):
+        """
+        Run the hook in a background process which outlives the app.
+        The result is written to the hook status file and reported at the next start.
+        """
+        if not hooks.get_hook_scripts(hook, self._local_repo_dir):
+            return
+
+        if getattr(sys, "frozen", False):  # PyInstaller
+            args = [sys.executable]
+        else:
+            args = [sys.executable, "-m", "jvereinmultiuser"]
+        args += ["--working-dir", self._working_dir, _RUN_HOOK_COMMAND, hook.name]
+
+        if sys.platform.startswith("win32") or sys.platform.startswith("cygwin"):
+            detach_kwargs = {"creationflags": subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+        else:
+            detach_kwargs = {"start_new_session": True}  # don't get killed when the terminal is closed
+        subprocess.Popen(args,
+                         stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL,
+                         close_fds=True,
+                         **detach_kwargs)
+        print(f"Hook {hook.name} läuft im Hintergrund, das Fenster kann geschlossen werden.")
+        print("Das Ergebnis wird beim nächsten Start angezeigt.")
+
+    def _get_hook_status_path(self, hook: Type[hooks.GenericHook]) -> str:
+        return os.path.join(self._working_dir, f"hook_status_{hook.name}.json")
+
+    def _read_hook_status(self, hook: Type[hooks.GenericHook]) -> Optional[dict]:
+        try:
+            with open(self._get_hook_status_path(hook), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+    def _write_hook_status(self, hook: Type[hooks.GenericHook], status: dict):
+        status_path = self._get_hook_status_path(hook)
+        with open(f"{status_path}.tmp", "w") as f:
+            json.dump(status, f, indent=2)
+        os.replace(f"{status_path}.tmp", status_path)
+
+    @staticmethod
+    def _is_process_running(pid: int) -> bool:
+        if sys.platform.startswith("win32"):
+            # os.kill() would terminate the process, ask the process handle instead
+            import ctypes  # imported here: only needed on Windows
+            from ctypes import wintypes
+            kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+            handle = kernel32.OpenProcess(_PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+            if not handle:
+                # the process doesn't exist anymore, unless it belongs to someone else
+                return ctypes.get_last_error() == _ERROR_ACCESS_DENIED
+            try:
+                exit_code = wintypes.DWORD()
+                if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+                    return True
+                return exit_code.value == _STILL_ACTIVE
+            finally:
+                kernel32.CloseHandle(handle)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def run_detached_hook(self, hook_name: str) -> int:
+        """
+        Run a hook in the background (see _start_detached_hook) and write its result to the hook status file.
+
+        Returns:
+            exit code
+        """
+        hook = hooks.get_hook(hook_name)
+        self._read_user_config_file()
+        status = {
+            "hook": hook.name,
+            "pid": os.getpid(),
+            "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "finished": None,
+            "ok": None,
+        }
+        self._write_hook_status(hook, status)
+
+        results = []
+        try:
+            results = hooks.run_hook(hook, self._local_repo_dir, timeout=self._hook_timeout)
+            status["ok"] = True
+        except hooks.HookExecutionError as e:
+            results = e.results
+            status["ok"] = False
+            status["error"] = e.message
+        except Exception as e:
+            logging.exception("hook failed")
+            status["ok"] = False
+            status["error"] = str(e)
+
+        status["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        status["scripts"] = [result._asdict() for result in results]
+        self._write_hook_status(hook, status)
+        self._record_hook_results(hook, results)
+        self._metrics.write()
+        return EXIT_OK if status["ok"] else EXIT_ERROR
+
+    def _report_detached_hook(self, hook: Type[hooks.GenericHook]):
+        status = self._read_hook_status(hook)
+        if status is None or status.get("reported"):
+            return
+
+        if status["ok"] is None:
+            if self._is_process_running(status["pid"]):
+                print(f"Hook {hook.name} läuft noch im Hintergrund (gestartet: {status['started']}).")
+                print("")
+                return
+            status["ok"] = False
+            status["error"] = "abgebrochen"
+
+        if not status["ok"]:
+            print("ACHTUNG! Der Hook im Hintergrund ist fehlgeschlagen!")
+            print("")
+            print(f"    Hook:      {hook.name}")
+            print(f"    Gestartet: {status['started']}")
+            print(f"    Fehler:    {status.get('error')}")
+            for script in status.get("scripts", []):
+                if script["returncode"] != 0 and script["output"]:
+                    print(f"    Ausgabe von {os.path.basename(script['script_path'])}:")
+                    print(textwrap.indent(script["output"], "        "))
+            print("")
+            print(f"    Details: {self._get_hook_status_path(hook)}")
+            print("")
+
+        status["reported"] = True
+        self._write_hook_status(hook, status)
+
+    @staticmethod
+    def _print_git_progress(progress: GitProgress):
+        if not sys.stdout.isatty():
+            return  # no live progress if the output is redirected
+
+        line = f"{progress.phase}: {progress.percent}% ({progress.done}/{progress.total})"
+        if progress.transferred:
+            line += f", {progress.transferred}"
+            if progress.rate:
+                line += f" | {progress.rate}"
+        if progress.finished:
+            line += ", fertig."
+        # overwrite the previous progress line (padded, escape sequences aren't supported by every Windows console)
+        print(f"\r{line:<79}", end="\n" if progress.finished else "", flush=True)
+
+    def _create_gitlocker(self, show_progress: bool = True):
+        self._gitlocker = GitLocker(
+            git_cmd=_DEFAULT_GIT_CMD,
+            local_repo=self._local_repo_dir,
+            remote_repo=self._remote_repo,
+            author_name=self._author_name,
+            author_email=self._author_email,
+            instance_name=self._author_computer,
+            ssh_control_dir=self._working_dir,
+            progress_callback=self._print_git_progress if show_progress else None,
+            reference_repo=self._shared_objects_dir,
+            remote_state_path=os.path.join(self._working_dir, "remote_state.json")
+        )
+
+    def _create_gitlocker_and_jverein_manager(self):
+        self._create_gitlocker()
+        self._create_jverein_manager()
+
+    def _create_jverein_manager(self):
+        self._jverein_manager = JVereinManager(
+            local_repo_dir=self._local_repo_dir,
+            user_properties=self._jameica_user_properties,
+            jameica_exec_path=self._path_jameica_exec,
+            plugin_xml_path=self._path_plugin_xml,
+            java_path=self._path_java,
+            h2_jar_dir=self._path_h2_dir,
+            cds_dir=os.path.join(self._working_dir, "cds"),
+            teardown_journal_path=self._teardown_journal_path
+        )
+
+    def _update_if_clean_and_not_locked_by_me(self):
+        locked_by_me = self._gitlocker.is_locked_by_me()
+        clean = self._gitlocker.is_synced_with_remote_repo()
+        if clean and not locked_by_me:
+            self._pull_adopting_compacted_history(self._gitlocker.pull)  # get current state
+
+    def _pull_adopting_compacted_history(self, pull: Callable[[], None]):
+        """
+        Run GitLocker.pull() or pull_and_lock(). If the history of the remote repository has been rewritten
+        by 'compact', the local repository is switched to the new history and the pull is repeated.
+        """
+        try:
+            pull()
+        except HistoryRewrittenError:
+            self._adopt_compacted_history()
+            self._gitlocker.pull()
+
+    def _adopt_compacted_history(self):
+        with TemporaryDirectory() as temp_dir:
+            repo_config = configparser.ConfigParser()
+            repo_config_path = os.path.join(temp_dir, "config.ini")
+            if self._gitlocker.export_file("@{upstream}", "config.ini", repo_config_path):
+                repo_config.read(repo_config_path)
+        compacted_from = repo_config.get(_HISTORY_SECTION, "compacted_from", fallback=None)
+        if not compacted_from:
+            raise GitError("Der Verlauf im Remote Repository wurde ersetzt, aber nicht mit 'compact'. "
+                           "Bitte das Repository neu einrichten.")
+
+        print(f"Der Verlauf vor {repo_config.get(_HISTORY_SECTION, 'before', fallback='?')} wurde archiviert "
+              f"({repo_config.get(_HISTORY_SECTION, 'archive', fallback='?')}). "
+              "Das lokale Repository wird auf den gekürzten Verlauf umgestellt.")
+        self._gitlocker.adopt_rewritten_history(compacted_from)
+        self._read_repo_config_file()
+
     def run(self):
         try:
-            self._check_for_updates()
+            self._start_update_check()
             self._setup_working_dir()
+            _add_log_file(self._working_dir, new_session=True)
             self._read_user_config_file()
             self._read_jameica_config_file()
+            self._report_detached_hook(hooks.PostUploadHook)
 
             print("Du arbeitest als")
             print(f"Name/E-Mail:        {self._author_name} <{self._author_email}>")
@@ -270,35 +685,17 @@ class App:
             print(f"Remote Repository:  {self._remote_repo}")
             print("")
 
-            self._gitlocker = GitLocker(
-                git_cmd=_DEFAULT_GIT_CMD,
-                local_repo=self._local_repo_dir,
-                remote_repo=self._remote_repo,
-                author_name=self._author_name,
-                author_email=self._author_email,
-                instance_name=self._author_computer
-            )
-
-            self._jverein_manager = JVereinManager(
-                local_repo_dir=self._local_repo_dir,
-                user_properties=self._jameica_user_properties,
-                jameica_exec_path=self._path_jameica_exec,
-                plugin_xml_path=self._path_plugin_xml,
-                java_path=self._path_java,
-                h2_jar_dir=self._path_h2_dir
-            )
-
+            self._create_gitlocker_and_jverein_manager()
             self._clone_repo_if_necessary()
 
             # now, the repo exists
             self._read_repo_config_file()
             self._check_expected_jvereinmultiuser_version()
             self._jverein_manager.expected_jameica_version = self._expected_jameica_version
+            self._resume_teardown_if_necessary()
 
-            locked_by_me = self._gitlocker.is_locked_by_me()
-            clean = self._gitlocker.is_synced_with_remote_repo()
-            if clean and not locked_by_me:
-                self._gitlocker.pull()  # get current state
+            self._check_exported_bundle()
+            self._update_if_clean_and_not_locked_by_me()
 
             locked_by_me = self._gitlocker.is_locked_by_me()
             locked = self._gitlocker.get_lock_info() is not None
@@ -327,40 +724,538 @@ class App:
             print("FEHLER!")
             print(e)
             raise CancelAppException()
+        finally:
+            self._write_metrics()
+            if self._gitlocker:
+                self._gitlocker.push_lock_journal()
+                self._gitlocker.close()
+            # ie. locked by others: the session ends without a prompt of the app
+            self._before_prompt(wait_for_update_check=True)
+
+    def run_command(self,
+                    command: str,
+                    commit_message: Optional[str] = None,
+                    keep_lock: bool = False,
+                    output_dir: Optional[str] = None,
+                    refresh: bool = False,
+                    before: Optional[datetime] = None,
+                    archive_dir: Optional[str] = None,
+                    bundle_path: Optional[str] = None,
+                    since: Optional[str] = None) -> int:
+        """
+        Run a single command without any user interaction.
+        The result is written to stdout as JSON, all other output goes to stderr.
+
+        Args:
+            command: One of COMMANDS
+            commit_message: Commit message for the 'push' and 'export-bundle' commands
+            keep_lock: Don't release the lock after the 'push' command (or after applying the bundle)
+            output_dir: Directory for the CSV files of the 'export' command, default: <working_dir>/export
+            refresh: Query the remote repository for the 'status' command instead of answering from the cache
+            before: The 'compact' command archives the history before this time,
+                default: DEFAULT_COMPACT_AGE_DAYS ago
+            archive_dir: Directory for the bundle of the 'compact' command, default: <working_dir>/archive
+            bundle_path: The bundle of the 'export-bundle' and 'import-bundle' commands
+            since: A commit the importing repository already has, for 'export-bundle' without the lock
+        Returns:
+            Exit code, see EXIT_*
+        """
+        result = {"command": command}
+        exit_code = EXIT_OK
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                try:
+                    result.update(self._run_command(command, commit_message, keep_lock, output_dir, refresh,
+                                                    before, archive_dir, bundle_path, since))
+                finally:
+                    self._write_metrics()
+                    if self._gitlocker:
+                        self._gitlocker.push_lock_journal()
+                        self._gitlocker.close()
+        except IsLockedError as e:
+            exit_code = EXIT_LOCKED
+            result["error"] = str(e)
+        except CancelAppException:
+            exit_code = EXIT_ERROR
+            result["error"] = "Abbruch"
+        except Exception as e:
+            logging.getLogger(__name__).exception(e)
+            exit_code = EXIT_ERROR
+            result["error"] = str(e)
+
+        result["ok"] = exit_code == EXIT_OK
+        print(json.dumps(result, ensure_ascii=False))
+        return exit_code
+
+    def _run_command(self,
+                     command: str,
+                     commit_message: Optional[str],
+                     keep_lock: bool,
+                     output_dir: Optional[str],
+                     refresh: bool = False,
+                     before: Optional[datetime] = None,
+                     archive_dir: Optional[str] = None,
+                     bundle_path: Optional[str] = None,
+                     since: Optional[str] = None) -> dict:
+        self._read_user_config_file()
+        if not os.path.isdir(self._local_repo_dir):
+            raise GitError("Das Repository ist noch nicht eingerichtet. Bitte zuerst interaktiv starten.")
+        self._create_gitlocker()
+        if not self._gitlocker.is_local_repo_available():
+            raise GitError("Das Repository ist noch nicht eingerichtet. Bitte zuerst interaktiv starten.")
+
+        # answered without Jameica (and 'status' without running git)
+        if command == "status":
+            return self._get_cached_status(refresh)
+        if command == "lock-stats":
+            return lockstats.aggregate(self._gitlocker.get_lock_events())
+
+        self._read_repo_config_file()
+        if self._expected_jvereinmultiuser_version not in (None, VERSION):
+            raise RuntimeError(f"Das Repository erwartet jverein-multiuser {self._expected_jvereinmultiuser_version}, "
+                               f"installiert ist {VERSION}")
+
+        # the JVereinManager (Jameica, H2) is only created by the commands which need it, see _create_jverein_manager()
+        if os.path.exists(self._teardown_journal_path):
+            raise RuntimeError("Die letzte Vorbereitung für den Upload wurde unterbrochen. "
+                               "Bitte zuerst interaktiv starten.")
+
+        if command in ("sync", "lock", "unlock", "push"):
+            self._check_exported_bundle()
+
+        if command == "sync":
+            if not self._gitlocker.is_locked_by_me():
+                if not self._gitlocker.is_synced_with_remote_repo():
+                    raise GitError("Es gibt lokale Änderungen, obwohl Du nicht den exklusiven Zugriff hast.")
+                with self._metrics.measure("sync"):
+                    self._pull_adopting_compacted_history(self._gitlocker.pull)
+        elif command == "lock":
+            # the own lock isn't an error (EXIT_LOCKED means locked by someone else), it's kept as it is
+            if not self._gitlocker.is_locked_by_me():
+                self._run_hook_and_retry_on_failure(hooks.PreLockHook, interactive=False)
+                try:
+                    with self._metrics.measure("lock"):
+                        self._pull_adopting_compacted_history(self._gitlocker.pull_and_lock)
+                except IsLockedError:
+                    if not self._gitlocker.is_locked_by_me():  # ie. locked by another process of this instance
+                        raise
+            self._create_gitignore_if_necessary()
+            hooks.create_example_files_if_necessary(self._local_repo_dir)
+        elif command == "unlock":
+            if not self._gitlocker.is_locked_by_me():
+                raise GitError("Du hast nicht den exklusiven Zugriff.")
+            if not self._gitlocker.is_synced_with_remote_repo():
+                raise GitError("Es gibt lokale Änderungen. Bitte 'push' verwenden.")
+            with self._metrics.measure("unlock"):
+                self._release_lock(self._gitlocker.unlock)
+            self._run_hook_and_retry_on_failure(hooks.PostUnlockHook, interactive=False)
+        elif command == "push":
+            if not self._gitlocker.is_locked_by_me():
+                raise GitError("Du hast nicht den exklusiven Zugriff.")
+            self._write_repo_config_file()
+            commit_stats = None
+            if self._gitlocker.need_to_commit():
+                commit_stats = self._report_commit_stats(self._gitlocker.stage_and_commit(commit_message))
+            if self._gitlocker.is_synced_with_remote_repo():
+                # nothing to upload, ie. a scheduled 'lock' and 'push' on a day without changes
+                if not keep_lock:
+                    with self._metrics.measure("unlock"):
+                        self._release_lock(self._gitlocker.unlock)
+                    self._run_hook_and_retry_on_failure(hooks.PostUnlockHook, interactive=False)
+            elif keep_lock:
+                with self._metrics.measure("upload"):
+                    self._gitlocker.push()
+            else:
+                with self._metrics.measure("upload"):
+                    self._release_lock(self._gitlocker.push_and_unlock)
+                self._run_post_upload_hook(interactive=False)
+                self._run_hook_and_retry_on_failure(hooks.PostUnlockHook, interactive=False)
+            result = self._get_status()
+            if commit_stats:
+                result["commit_stats"] = commit_stats
+            return result
+        elif command == "export":
+            self._read_jameica_config_file()
+            try:
+                self._create_jverein_manager()
+            except OSError as e:
+                raise RuntimeError(f"H2 nicht gefunden, bitte [Paths] h2_dir in der user_config.ini prüfen: {e}")
+            self._jverein_manager.expected_jameica_version = self._expected_jameica_version
+            with self._metrics.measure("export"):
+                return self._export_from_remote(output_dir or os.path.join(self._working_dir, "export"))
+        elif command == "compact":
+            with self._metrics.measure("compact"):
+                return self._compact_history(
+                    before or datetime.now() - timedelta(days=DEFAULT_COMPACT_AGE_DAYS),
+                    archive_dir or os.path.join(self._working_dir, "archive"))
+        elif command == "export-bundle":
+            with self._metrics.measure("export-bundle"):
+                return self._export_bundle(bundle_path, commit_message, keep_lock, since)
+        elif command == "import-bundle":
+            with self._metrics.measure("import-bundle"):
+                info = self._gitlocker.import_bundle(bundle_path)
+            result = self._get_status()
+            result.update({"bundle_kind": info.kind, "bundle_head": info.head, "applied": info.applied})
+            return result
+        else:
+            raise ValueError(f"unknown command: {command}")
+
+        return self._get_status()
+
+    def _export_from_remote(self, output_dir: str) -> dict:
+        """
+        Export the CSV files from the current state of the remote repository.
+        Neither a lock is acquired nor the local repository is changed.
+        """
+        self._gitlocker.fetch()
+        with TemporaryDirectory() as temp_dir:
+            sql_path = os.path.join(temp_dir, "jverein.sql")
+            if not self._gitlocker.export_file("@{upstream}", JVEREIN_DUMP_PATH, sql_path):
+                raise GitError(f"Datei nicht im Repository gefunden: {JVEREIN_DUMP_PATH}")
+
+            # use the exports of the same commit as the dump
+            repo_config = configparser.ConfigParser()
+            repo_config_path = os.path.join(temp_dir, "config.ini")
+            if self._gitlocker.export_file("@{upstream}", "config.ini", repo_config_path):
+                repo_config.read(repo_config_path)
+            self._jverein_manager.exports = self._get_exports(repo_config)
+
+            # the delta refers to the previous export
+            previous_email_path = None
+            if os.path.exists(os.path.join(output_dir, _EMAIL_EXPORT_FILE)):
+                previous_email_path = shutil.copy(os.path.join(output_dir, _EMAIL_EXPORT_FILE), temp_dir)
+
+            files = self._jverein_manager.export_from_dump(sql_path, output_dir)
+            delta = self._write_email_delta(previous_email_path, output_dir)
+
+        result = {
+            "commit": self._gitlocker.get_commit("@{upstream}"),
+            "output_dir": output_dir,
+            "files": files,
+        }
+        if delta:
+            result["emails_added"] = delta.added
+            result["emails_removed"] = delta.removed
+        return result
+
+    def _compact_history(self, before: datetime, archive_dir: str) -> dict:
+        """
+        Archive the history before the given time to a bundle in archive_dir and replace the history
+        of the remote repository by the shortened one. The lock is held meanwhile and released afterwards,
+        unless it has already been held before. The other users switch to the new history on their next pull,
+        see _adopt_compacted_history().
+        """
+        was_locked = self._gitlocker.is_locked_by_me()
+        if was_locked:
+            if not self._gitlocker.is_synced_with_remote_repo():
+                raise GitError("Es gibt lokale Änderungen. Bitte zuerst 'push' verwenden.")
+        else:
+            self._pull_adopting_compacted_history(self._gitlocker.pull_and_lock)
+
+        remote_head = self._gitlocker.get_commit("@{upstream}")
+        os.makedirs(archive_dir, exist_ok=True)
+        bundle_path = os.path.join(
+            archive_dir, f"history-before-{before:%Y-%m-%d}-{datetime.now():%Y%m%d-%H%M%S}.bundle")
+        print(f"Verlauf vor {before:%Y-%m-%d} wird archiviert")
+        compacted = self._gitlocker.compact_history(before, bundle_path)
+        if compacted is None:
+            print("Es gibt keinen Verlauf vor diesem Datum, der archiviert werden kann.")
+            if not was_locked:
+                self._release_lock(self._gitlocker.unlock)
+            return {"compacted": False}
+
+        sha256 = hashlib.sha256()
+        with open(bundle_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        bundle_sha256 = sha256.hexdigest()
+        try:
+            if not self._repo_config.has_section(_HISTORY_SECTION):
+                self._repo_config.add_section(_HISTORY_SECTION)
+            self._repo_config.set(_HISTORY_SECTION, "compacted_from", compacted.old_head)
+            self._repo_config.set(_HISTORY_SECTION, "archived_head", compacted.archived_head)
+            self._repo_config.set(_HISTORY_SECTION, "before", f"{before:%Y-%m-%d}")
+            self._repo_config.set(_HISTORY_SECTION, "archive", os.path.basename(bundle_path))
+            self._repo_config.set(_HISTORY_SECTION, "archive_sha256", bundle_sha256)
+            self._write_repo_config_file()
+            self._gitlocker.stage_and_commit(f"Verlauf vor {before:%Y-%m-%d} archiviert")
+            if was_locked:
+                print("Der gekürzte Verlauf wird hochgeladen, exklusiver Zugriff bleibt erhalten")
+                self._gitlocker.push_rewritten_history(remote_head)
+            else:
+                print("Der gekürzte Verlauf wird hochgeladen, exklusiver Zugriff wird freigegeben")
+                self._release_lock(lambda: self._gitlocker.push_rewritten_history_and_unlock(remote_head))
+        except GitError:
+            # keep the old history, the lock is still held
+            self._gitlocker.delete_local_changes()
+            self._read_repo_config_file()
+            raise
+        self._gitlocker.prune_unreachable_objects()
+
+        print(f"Archiv: {bundle_path}")
+        print("Bitte das Archiv sicher aufbewahren, der alte Verlauf ist nur noch darin enthalten.")
+        return {
+            "compacted": True,
+            "archive": bundle_path,
+            "archive_bytes": os.path.getsize(bundle_path),
+            "archive_sha256": bundle_sha256,
+            "archived_commits": compacted.archived_commits,
+            "kept_commits": compacted.kept_commits,
+            "head": self._gitlocker.get_commit("HEAD"),
+        }
+
+    def _export_bundle(self, bundle_path: str, commit_message: Optional[str], keep_lock: bool,
+                       since: Optional[str]) -> dict:
+        """
+        With the lock: commit and write the own changes together with the lock to the bundle,
+        'import-bundle' uploads them and releases the lock (like 'push').
+        Without the lock: write the state of the remote repository to the bundle,
+        'import-bundle' updates the local repository with it (like 'sync').
+        """
+        commit_stats = None
+        if self._gitlocker.is_locked_by_me():
+            self._write_repo_config_file()
+            if self._gitlocker.need_to_commit():
+                if not commit_message:
+                    raise GitError("Es gibt lokale Änderungen. Bitte eine Commit-Message angeben (-m).")
+                commit_stats = self._report_commit_stats(self._gitlocker.stage_and_commit(commit_message))
+            info = self._gitlocker.export_bundle(bundle_path, release=not keep_lock)
+            print("Der exklusive Zugriff bleibt bestehen, bis das Bundle mit 'import-bundle' hochgeladen wurde.")
+        else:
+            info = self._gitlocker.export_remote_bundle(bundle_path, since)
+
+        result = {
+            "bundle": bundle_path,
+            "bundle_bytes": os.path.getsize(bundle_path),
+            "bundle_kind": info.kind,
+            "bundle_head": info.head,
+            "bundle_lock_holder": GitLocker.format_lock_names(info.lock_names),
+        }
+        if info.kind == BUNDLE_UPLOAD:
+            result["release"] = info.release
+        if commit_stats:
+            result["commit_stats"] = commit_stats
+        return result
+
+    def _check_exported_bundle(self):
+        """
+        If an exported bundle has been applied in the meantime (ie. on another computer),
+        the own lock is released locally as well.
+        """
+        if not self._gitlocker.has_exported_bundle():
+            return
+        try:
+            applied = self._gitlocker.check_exported_bundle()
+        except GitError:
+            print("Das exportierte Bundle konnte nicht geprüft werden. Ist das Remote Repository erreichbar?")
+            return
+        if applied:
+            print("Das exportierte Bundle wurde inzwischen hochgeladen.")
+        else:
+            print("Das exportierte Bundle wurde noch nicht hochgeladen.")
+
+    def _write_email_delta(self, previous_path: Optional[str], output_dir: str) -> Optional[csvdelta.Delta]:
+        """
+        Write the email addresses added and removed since previous_path next to the email export.
+
+        Returns:
+            None if there's no email export
+        """
+        email_path = os.path.join(output_dir, _EMAIL_EXPORT_FILE)
+        if not os.path.exists(email_path):
+            return None
+        delta = csvdelta.write_delta(
+            previous_path,
+            email_path,
+            os.path.join(output_dir, _EMAIL_ADDED_FILE),
+            os.path.join(output_dir, _EMAIL_REMOVED_FILE)
+        )
+        print(f"E-Mail-Adressen: {delta.added} hinzugefügt, {delta.removed} entfernt")
+        return delta
+
+    def probe_status(self) -> dict:
+        """
+        Query the lock and synchronization state for 'status --all', without any user interaction.
+        Only the remote-tracking branches of the local repository are updated.
+
+        Returns:
+            The state, or the key 'error' if the state couldn't be determined
+        """
+        result = {"working_dir": self._working_dir}
+        try:
+            self._read_user_config_file()
+            result["remote"] = self._remote_repo
+            self._create_gitlocker(show_progress=False)  # the progress of concurrent probes would be garbled
+            if not self._gitlocker.is_local_repo_available():
+                raise GitError("Das Repository ist noch nicht eingerichtet.")
+
+            lock_holder = self._gitlocker.get_remote_lock_info()
+            self._gitlocker.fetch()
+            ahead, behind = self._gitlocker.get_ahead_behind()
+            result.update({
+                "locked": lock_holder is not None,
+                "lock_holder": lock_holder,
+                "locked_by_me": self._gitlocker.is_locked_by_me(),
+                "local_changes": self._gitlocker.need_to_commit(),
+                "ahead": ahead,
+                "behind": behind,
+                "last_commit": self._gitlocker.get_commit_summary("@{upstream}"),
+            })
+        except CancelAppException:
+            result["error"] = "Konfiguration nicht vollständig"
+        except Exception as e:
+            logging.getLogger(__name__).exception(e)
+            result["error"] = str(e)
+        finally:
+            if self._gitlocker:
+                self._gitlocker.close()
+        return result
+
+    def _get_status(self) -> dict:
+        lock_info = self._gitlocker.get_lock_info()
+        return {
+            "locked": lock_info is not None,
+            "lock_holder": lock_info,
+            "locked_by_me": self._gitlocker.is_locked_by_me(),
+            "synced": self._gitlocker.is_synced_with_remote_repo(),
+            "head": self._gitlocker.get_commit("HEAD"),
+            "post_upload_hook": self._read_hook_status(hooks.PostUploadHook),
+        }
+
+    def _get_cached_status(self, refresh: bool) -> dict:
+        """
+        Answer 'status' from the remote state cached by the last git operation and the refs of the local repository,
+        without running git. Only if there's no cache yet or refresh is set, the remote refs are queried
+        (nothing is downloaded) and the working directory is checked for uncommitted changes.
+        """
+        state = None if refresh else self._gitlocker.get_cached_remote_state()
+        if state is None or state.checked is None:
+            state = self._gitlocker.refresh_remote_state()
+            refresh = True
+
+        lock_info = GitLocker.format_lock_names(state.lock_names)
+        branch = self._gitlocker.read_current_branch()
+        remote_head = self._gitlocker.get_remote_head(state)
+        head = self._gitlocker.read_ref("HEAD")
+        upstream = self._gitlocker.read_ref(f"refs/remotes/origin/{branch}") if branch else None
+        return {
+            "locked": lock_info is not None,
+            "lock_holder": lock_info,
+            "locked_by_me": any(self._gitlocker.is_own_lock(name) for name in state.lock_names),
+            # without refresh: only the commits are compared, uncommitted changes aren't detected
+            "synced": self._gitlocker.is_synced_with_remote_repo() if refresh else head is not None and head == upstream,
+            "behind": remote_head is not None and remote_head != upstream,
+            "head": head,
+            "remote_head": remote_head,
+            "checked": datetime.fromtimestamp(state.checked).isoformat(timespec="seconds"),
+            "age_seconds": round(max(0.0, time.time() - state.checked)),
+            "teardown_unfinished": os.path.exists(self._teardown_journal_path),
+            "post_upload_hook": self._read_hook_status(hooks.PostUploadHook),
+        }
 
     def _user_input(self, options):
+        self._before_prompt()
         response = ""
         while response not in options:
             response = input(f"[{'/'.join(options)}] ").lower()
         print("")
         return response
 
+    @staticmethod
+    def _format_size(num_bytes: int) -> str:
+        if num_bytes >= 1024 * 1024:
+            return f"{num_bytes / 1024 / 1024:.1f} MB"
+        if num_bytes >= 1024:
+            return f"{num_bytes / 1024:.0f} KB"
+        return f"{num_bytes} Bytes"
+
+    @staticmethod
+    def _get_size_group(path: str) -> str:
+        for name, prefix, suffix in _SIZE_GROUPS:
+            if path.startswith(prefix) and path.endswith(suffix):
+                return name
+        return "Sonstige"
+
+    def _report_commit_stats(self, stats: CommitStats) -> dict:
+        """
+        Print how much the commit adds to the repository, broken down by _SIZE_GROUPS,
+        and warn if it exceeds the commit budget.
+
+        Returns:
+            The stats for the JSON result of the 'push' command
+        """
+        groups = {}
+        for path, num_bytes in stats.added_bytes.items():
+            group = self._get_size_group(path)
+            groups[group] = groups.get(group, 0) + num_bytes
+
+        details = ", ".join(f"{group}: {self._format_size(num_bytes)}"
+                            for group, num_bytes in sorted(groups.items(), key=lambda g: -g[1]) if num_bytes)
+        print(f"Commit: {stats.files} {'Datei' if stats.files == 1 else 'Dateien'} geändert, "
+              f"{self._format_size(stats.total_bytes)} neu"
+              + (f" ({details})" if details else ""))
+
+        budget = self._commit_budget_bytes
+        over_budget = stats.total_bytes > budget
+        if over_budget:
+            print(f"WARNUNG! Der Commit vergrößert das Repository um {self._format_size(stats.total_bytes)}, "
+                  f"mehr als die erlaubten {self._format_size(budget)}. Das Hochladen kann lange dauern.")
+            print("Größte Dateien:")
+            for path, num_bytes in sorted(stats.added_bytes.items(), key=lambda p: -p[1])[:5]:
+                print(f"    {self._format_size(num_bytes):>10}  {path}")
+            print("Bitte prüfen, ob diese Dateien ins Repository gehören (sonst in .gitignore eintragen).")
+            print("")
+
+        return {
+            "files": stats.files,
+            "added_bytes": stats.total_bytes,
+            "groups": groups,
+            "budget_bytes": budget,
+            "over_budget": over_budget,
+        }
+
     def _pull_and_lock(self):
+        self._run_hook_and_retry_on_failure(hooks.PreLockHook)
         print("Lade Änderungen herunter und fordere exklusiven Zugriff an.")
-        self._gitlocker.pull_and_lock()
+        with self._metrics.measure("lock"):
+            self._pull_adopting_compacted_history(self._gitlocker.pull_and_lock)
         self._create_gitignore_if_necessary()
         hooks.create_example_files_if_necessary(self._local_repo_dir)
 
-    def _upload_changes(self):
+    def _commit_changes(self):
         self._write_repo_config_file()
 
         if self._gitlocker.need_to_commit():
             commit_message = ""
             while len(commit_message) <= 0:
+                self._before_prompt()
                 commit_message = input("Was hast du getan? (kurze commit-Message): ")
-            self._gitlocker.stage_and_commit(commit_message)
+            self._report_commit_stats(self._gitlocker.stage_and_commit(commit_message))
+
+    def _upload_changes(self):
+        self._commit_changes()
 
         print("Lokale Änderungen werden hochgeladen")
-        self._gitlocker.push()
+        with self._metrics.measure("upload"):
+            self._gitlocker.push()
 
         self._run_hook_and_retry_on_failure(hooks.PostUploadHook)
 
+    def _upload_changes_and_unlock(self):
+        self._commit_changes()
+
+        print("Lokale Änderungen werden hochgeladen, exklusiver Zugriff wird freigegeben")
+        with self._metrics.measure("upload"):
+            self._release_lock(self._gitlocker.push_and_unlock)
+
+        self._run_post_upload_hook()
+        self._run_hook_and_retry_on_failure(hooks.PostUnlockHook)
+
     def _ask_and_upload(self):
         print("    Möchtest Du jetzt die Änderungen hochladen?")
         response = self._user_input(["j", "n"])
         if response == "j":
-            self._upload_changes()
-            self._unlock()
+            self._upload_changes_and_unlock()
             return True
         else:
             print("    Du  hast immer noch den exklusiven Zugriff!")
@@ -371,7 +1266,9 @@ class App:
 
     def _unlock(self):
         print("Exklusiver Zugriff wird freigegeben")
-        self._gitlocker.unlock()
+        with self._metrics.measure("unlock"):
+            self._release_lock(self._gitlocker.unlock)
+        self._run_hook_and_retry_on_failure(hooks.PostUnlockHook)
 
     def _discard_changes(self):
         print("Lokale Änderungen werden gelöscht")
@@ -404,6 +1301,7 @@ class App:
     def _ask_for_master_password(self) -> str:
         master_password = ""
         while len(master_password) <= 0:
+            self._before_prompt()
             master_password = getpass(prompt="Master-Passwort für Jameica: ")
         return master_password
 
@@ -412,7 +1310,8 @@ class App:
 
         print("jVerein wird für Dich eingerichtet")
         try:
-            self._jverein_manager.setup(master_password)
+            with self._metrics.measure("setup"):
+                self._jverein_manager.setup(master_password)
         except JameicaVersionDiffersError as e:
             self._handle_different_jameica_version(
                 e.expected_version, e.current_version)
@@ -420,6 +1319,7 @@ class App:
             print("FEHLER!")
             print("Master-Passwort falsch?")
             raise CancelAppException()
+        self._run_hook_and_retry_on_failure(hooks.PostSetupHook)
 
         running = True
         while running:
@@ -440,7 +1340,43 @@ class App:
                 running = False
 
         print("jVerein wird für den Upload vorbereitet")
-        self._jverein_manager.teardown()
+        self._jverein_manager.exports = self._get_exports(self._repo_config)
+        with self._metrics.measure("teardown"):
+            self._jverein_manager.teardown()
+        self._after_teardown()
+
+    def _resume_teardown_if_necessary(self):
+        if not self._jverein_manager.has_unfinished_teardown():
+            return
+
+        print("ACHTUNG! Die letzte Vorbereitung für den Upload wurde unterbrochen.")
+        print("Sie wird jetzt fortgesetzt, bereits erledigte Schritte werden übersprungen.")
+        print("")
+        master_password = self._ask_for_master_password()
+        self._jverein_manager.exports = self._get_exports(self._repo_config)
+        try:
+            with self._metrics.measure("teardown"):
+                self._jverein_manager.resume_teardown(master_password)
+        except DecryptionError:
+            print("FEHLER!")
+            print("Master-Passwort falsch?")
+            raise CancelAppException()
+        self._after_teardown()
+        print("Vorbereitung für den Upload abgeschlossen.")
+        print("")
+
+    def _after_teardown(self):
+        self._record_dump_stats()
+
+        # compare the email addresses with the last commit
+        dump_dir = os.path.join(self._local_repo_dir, "dump")
+        with TemporaryDirectory() as temp_dir:
+            previous_email_path = os.path.join(temp_dir, _EMAIL_EXPORT_FILE)
+            if not self._gitlocker.export_file("HEAD", f"dump/{_EMAIL_EXPORT_FILE}", previous_email_path):
+                previous_email_path = None
+            self._write_email_delta(previous_email_path, dump_dir)
+
+        self._run_hook_and_retry_on_failure(hooks.PostTeardownHook)
 
     def _manage_locked_by_me_and_clean(self):
         if self._gitlocker.is_locked_by_me():
@@ -469,8 +1405,40 @@ class App:
         print("")
         print(f"    {self._gitlocker.get_lock_info()}")
         print("")
-        print("    Bitte versuche es später noch einmal.")
+        if self._max_wait is None:
+            print("    Bitte versuche es später noch einmal.")
+            print("")
+            return
+
+        if self._wait_for_unlock_and_lock():
+            self._run_jverein()
+            self._ask_and_upload()
+
+    def _wait_for_unlock_and_lock(self) -> bool:
+        self._before_prompt(wait_for_update_check=True)  # there's no prompt for a long time
+        deadline = time.monotonic() + self._max_wait
+        print(f"    Warte bis zu {self._max_wait / 60:.0f} Minuten auf die Freigabe (Abbrechen mit Strg+C).")
         print("")
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._gitlocker.wait_for_unlock(max_wait=remaining):
+                    print("    Der exklusive Zugriff wurde nicht rechtzeitig freigegeben.")
+                    print("    Bitte versuche es später noch einmal.")
+                    print("")
+                    return False
+
+                print("Der exklusive Zugriff wurde freigegeben.")
+                try:
+                    self._pull_and_lock()
+                    return True
+                except IsLockedError as e:
+                    # someone else has been faster, keep on waiting
+                    print(e)
+        except KeyboardInterrupt:
+            print("")
+            print("Warten abgebrochen.")
+            return False
 
     def _manage_unlocked_and_clean(self):
         print("    Arbeitsverzeichnis sauber, kein exklusiver Zugriff angefordert.")
@@ -507,8 +1475,7 @@ class App:
 
         response = self._user_input(["p", "s", "verwerfen", "q"])
         if response == "p":
-            self._upload_changes()
-            self._unlock()
+            self._upload_changes_and_unlock()
             print("Erfolg: Änderungen hochgeladen, exklusiver Zugriff freigegeben")
         elif response == "s":
             self._run_jverein()
@@ -567,6 +1534,133 @@ class App:
         return
 
 
+_LOG_FORMATTER = logging.Formatter(fmt="[%(asctime)s] %(levelname)s: %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+
+def _setup_logging(console_log_level: int):
+    """
+    Log to the console with the given level, see _add_log_file() for the log file.
+    """
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(console_log_level)
+    console_handler.setFormatter(_LOG_FORMATTER)
+    root_logger.addHandler(console_handler)
+
+
+def _add_log_file(working_dir: str, log_file_name: str = _LOG_FILE_NAME, new_session: bool = False):
+    """
+    Log everything (including the output of git and H2) to a rotating log in the working directory.
+    Nothing is logged to a file if the working directory doesn't exist (yet).
+
+    Args:
+        new_session: start a new file, ie. for every interactive session
+    """
+    if not os.path.isdir(working_dir):
+        return
+    log_path = os.path.join(working_dir, _LOG_DIR_NAME, log_file_name)
+    root_logger = logging.getLogger()
+    if any(getattr(h, "baseFilename", None) == os.path.abspath(log_path) for h in root_logger.handlers):
+        return
+    try:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_path, maxBytes=_LOG_MAX_BYTES, backupCount=_LOG_BACKUP_COUNT, encoding="utf-8", delay=True)
+        if new_session and os.path.exists(log_path) and os.path.getsize(log_path) > 0:
+            file_handler.doRollover()
+    except OSError as e:
+        logging.warning(f"unable to write log file: {e}")
+        return
+    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(_LOG_FORMATTER)
+    root_logger.addHandler(file_handler)
+
+
+def discover_working_dirs(working_dir: str) -> List[str]:
+    """
+    Returns:
+        The working dir, its subdirectories and its sibling directories, as far as they contain
+        a configuration file, ie. '~/.jverein-multiuser' and '~/.jverein-multiuser-verein2'
+    """
+    working_dir = os.path.abspath(working_dir)
+    candidates = [working_dir]
+    for parent_dir in (working_dir, os.path.dirname(working_dir)):
+        try:
+            candidates += sorted(os.path.join(parent_dir, name) for name in os.listdir(parent_dir))
+        except OSError:
+            continue
+
+    working_dirs = []
+    seen = set()
+    for candidate in candidates:
+        real_path = os.path.realpath(candidate)
+        if real_path not in seen and os.path.isfile(os.path.join(candidate, "user_config.ini")):
+            seen.add(real_path)
+            working_dirs.append(candidate)
+    return working_dirs
+
+
+def _format_status_row(status: dict) -> List[str]:
+    name = os.path.basename(os.path.normpath(status["working_dir"]))
+    if "error" in status:
+        return [name, "?", f"FEHLER: {status['error']}", ""]
+
+    if not status["locked"]:
+        lock = "frei"
+    elif status["locked_by_me"]:
+        lock = f"Du: {status['lock_holder']}"
+    else:
+        lock = status["lock_holder"]
+
+    state = []
+    if status["local_changes"]:
+        state.append("lokale Änderungen")
+    if status["ahead"]:
+        state.append(f"{status['ahead']} nicht hochgeladen")
+    if status["behind"]:
+        state.append(f"{status['behind']} neu")
+    return [name, lock, ", ".join(state) if state else "aktuell", status["last_commit"] or ""]
+
+
+def run_status_all(working_dirs: List[str], as_json: bool = False) -> int:
+    """
+    Query the state of several working dirs (ie. of several clubs) concurrently and print it as a table.
+
+    Args:
+        as_json: print a JSON list instead of the table
+    Returns:
+        Exit code, EXIT_ERROR if the state of a working dir couldn't be determined
+    """
+    if not working_dirs:
+        print("Keine Arbeitsverzeichnisse gefunden.", file=sys.stderr)
+        return EXIT_ERROR
+
+    # all remote repositories are queried at the same time
+    with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=min(len(working_dirs), 8)) as executor:
+        results = list(executor.map(
+            lambda working_dir: App(working_dir=working_dir, check_for_updates=False).probe_status(),
+            working_dirs))
+
+    if as_json:
+        print(json.dumps(results, ensure_ascii=False))
+    else:
+        rows = [["Verein", "Lock", "Stand", "Letzter Commit"]] + [_format_status_row(r) for r in results]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+    return EXIT_ERROR if any("error" in r for r in results) else EXIT_OK
+
+
+def _parse_date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ungültiges Datum: {value} (erwartet: JJJJ-MM-TT)")
+
+
 def run():
     default_working_dir = os.path.join(os.path.expanduser("~"), ".jverein-multiuser")
     parser = argparse.ArgumentParser(
@@ -580,8 +1674,64 @@ def run():
                         help=f"Arbeitsverzeichnis für Repository und Konfiguration (default: {default_working_dir})")
     parser.add_argument("-n", "--no-update", dest="check_for_updates", action="store_false",
                         help="Nicht nach Updates von jverein-multiuser suchen")
+    parser.add_argument("-w", "--wait", dest="wait", action="store_true",
+                        help="Wenn gesperrt: auf die Freigabe warten, dann sperren und jVerein starten")
+    parser.add_argument("--max-wait", dest="max_wait", type=float, default=60, metavar="MINUTEN",
+                        help="Maximale Wartezeit für --wait in Minuten (default: 60)")
     parser.add_argument('-v', '--verbose', dest="verbose", action='count', default=0,
                         help="Log-Level; -v: INFO, -vv: DEBUG")
+
+    subparsers = parser.add_subparsers(
+        dest="command", metavar="BEFEHL",
+        description="Ohne Befehl startet das interaktive Menü. Befehle arbeiten ohne Rückfragen, "
+                    "geben das Ergebnis als JSON aus und beenden sich mit Exit-Code "
+                    f"{EXIT_OK} (Erfolg), {EXIT_ERROR} (Fehler) oder {EXIT_LOCKED} (von jemand anderem gesperrt).")
+    status_parser = subparsers.add_parser("status", help="Lock- und Synchronisations-Status anzeigen")
+    status_parser.add_argument("--all", dest="all_working_dirs", nargs="*", metavar="ARBEITSVERZEICHNIS",
+                               help="Status mehrerer Arbeitsverzeichnisse gleichzeitig abfragen und als Tabelle "
+                                    "anzeigen (default: alle Arbeitsverzeichnisse neben und unter --working-dir)")
+    status_parser.add_argument("--json", dest="json", action="store_true",
+                               help="Mit --all: als JSON statt als Tabelle ausgeben")
+    status_parser.add_argument("--refresh", dest="refresh", action="store_true",
+                               help="Lock und Branches im Remote Repository abfragen, statt den zuletzt "
+                                    "bekannten Stand anzuzeigen")
+    subparsers.add_parser("lock", help="Änderungen herunterladen und exklusiven Zugriff anfordern "
+                                      "(ein bereits eigener Zugriff bleibt unverändert)")
+    subparsers.add_parser("unlock", help="Exklusiven Zugriff freigeben (ohne lokale Änderungen)")
+    push_parser = subparsers.add_parser("push", help="Änderungen committen, hochladen und Zugriff freigeben")
+    push_parser.add_argument("-m", "--message", dest="message", required=True, help="Commit-Message")
+    push_parser.add_argument("--keep-lock", dest="keep_lock", action="store_true",
+                             help="Exklusiven Zugriff nach dem Hochladen behalten")
+    export_parser = subparsers.add_parser(
+        "export", help="CSV-Exporte aus dem aktuellen Stand des Remote Repository erzeugen (ohne Lock und Jameica)")
+    export_parser.add_argument("-o", "--output-dir", dest="output_dir",
+                               help="Zielverzeichnis (default: <Arbeitsverzeichnis>/export)")
+    subparsers.add_parser("sync", help="Aktuellen Stand herunterladen, z. B. für Backups")
+    subparsers.add_parser("lock-stats", help="Auswertung des Lock-Journals: Sperrzeiten und Konflikte pro Person")
+    compact_parser = subparsers.add_parser(
+        "compact", help="Alten Verlauf in ein Bundle archivieren und aus dem Repository entfernen "
+                        "(ein bereits eigener exklusiver Zugriff bleibt danach erhalten)")
+    compact_parser.add_argument("--before", dest="before", type=_parse_date, metavar="JJJJ-MM-TT",
+                                help="Verlauf vor diesem Datum archivieren "
+                                     f"(default: vor {DEFAULT_COMPACT_AGE_DAYS} Tagen)")
+    compact_parser.add_argument("--archive-dir", dest="archive_dir",
+                                help="Zielverzeichnis für das Bundle (default: <Arbeitsverzeichnis>/archive)")
+    export_bundle_parser = subparsers.add_parser(
+        "export-bundle", help="Bundle für die Übertragung per USB-Stick schreiben: mit exklusivem Zugriff die "
+                              "eigenen Änderungen (wie push), sonst den Stand des Remote Repository (wie sync)")
+    export_bundle_parser.add_argument("bundle_path", metavar="DATEI")
+    export_bundle_parser.add_argument("-m", "--message", dest="message",
+                                      help="Commit-Message, falls es lokale Änderungen gibt")
+    export_bundle_parser.add_argument("--keep-lock", dest="keep_lock", action="store_true",
+                                      help="Exklusiven Zugriff nach dem Hochladen des Bundles behalten")
+    export_bundle_parser.add_argument("--since", dest="since", metavar="COMMIT",
+                                      help="Ohne exklusiven Zugriff: nur die Commits nach diesem Commit "
+                                           "(z. B. 'head' aus 'status' des anderen Computers)")
+    import_bundle_parser = subparsers.add_parser(
+        "import-bundle", help="Bundle von export-bundle hochladen bzw. den Stand daraus übernehmen")
+    import_bundle_parser.add_argument("bundle_path", metavar="DATEI")
+    run_hook_parser = subparsers.add_parser(_RUN_HOOK_COMMAND)  # hidden: no help
+    run_hook_parser.add_argument("hook_name")
     args = parser.parse_args()
 
     if args.verbose == 0:
@@ -591,13 +1741,34 @@ def run():
     else:
         log_level = logging.DEBUG
 
-    logging.basicConfig(format="[%(asctime)s] %(levelname)s: %(message)s",
-                        datefmt="%Y-%m-%d %H:%M:%S",
-                        level=log_level)
+    _setup_logging(log_level)
+
+    if args.command == _RUN_HOOK_COMMAND:
+        _add_log_file(args.working_dir, f"hook_{args.hook_name}.log", new_session=True)
+        sys.exit(App(working_dir=args.working_dir, check_for_updates=False).run_detached_hook(args.hook_name))
+
+    if args.command:
+        _add_log_file(args.working_dir, _COMMAND_LOG_FILE_NAME)
+
+    if args.command == "status" and args.all_working_dirs is not None:
+        sys.exit(run_status_all(args.all_working_dirs or discover_working_dirs(args.working_dir), as_json=args.json))
+
+    if args.command:
+        app = App(working_dir=args.working_dir, check_for_updates=False)
+        sys.exit(app.run_command(args.command,
+                                 commit_message=getattr(args, "message", None),
+                                 keep_lock=getattr(args, "keep_lock", False),
+                                 output_dir=getattr(args, "output_dir", None),
+                                 refresh=getattr(args, "refresh", False),
+                                 before=getattr(args, "before", None),
+                                 archive_dir=getattr(args, "archive_dir", None),
+                                 bundle_path=getattr(args, "bundle_path", None),
+                                 since=getattr(args, "since", None)))
 
     try:
         app = App(working_dir=args.working_dir,
-                  check_for_updates=args.check_for_updates)
+                  check_for_updates=args.check_for_updates,
+                  max_wait=args.max_wait * 60 if args.wait else None)
         app.run()
     except CancelAppException:
         print("Abbruch.")
@@ -0,0 +1,94 @@
+"""
+Line based delta of two sorted CSV files, ie. the email addresses of the members between two sessions.
+
+Both files are streamed in a merge, so only the current line of each file is kept in memory.
+"""
+import os
+import logging
+from typing import Iterator, NamedTuple, Optional, TextIO
+
+
+class Delta(NamedTuple):
+    added: int
+    removed: int
+
+
+class _UnsortedError(Exception):
+    """ Input file isn't sorted """
+
+
+def _iter_sorted_lines(f: TextIO) -> Iterator[str]:
+    """
+    Returns:
+        Iterator of the non-empty lines without duplicates
+    Raises:
+        _UnsortedError: if the lines aren't sorted
+    """
+    previous = None
+    for line in f:
+        line = line.rstrip("\r\n")
+        if not line or line == previous:
+            continue
+        if previous is not None and line < previous:
+            raise _UnsortedError()
+        previous = line
+        yield line
+
+
+def _merge(old_file: TextIO, new_file: TextIO, added_file: TextIO, removed_file: TextIO) -> Delta:
+    added = 0
+    removed = 0
+    old_lines = _iter_sorted_lines(old_file)
+    new_lines = _iter_sorted_lines(new_file)
+    old = next(old_lines, None)
+    new = next(new_lines, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old < new):
+            removed_file.write(old + "\n")
+            removed += 1
+            old = next(old_lines, None)
+        elif old is None or new < old:
+            added_file.write(new + "\n")
+            added += 1
+            new = next(new_lines, None)
+        else:
+            old = next(old_lines, None)
+            new = next(new_lines, None)
+    return Delta(added, removed)
+
+
+def _compare_sets(old_file: TextIO, new_file: TextIO, added_file: TextIO, removed_file: TextIO) -> Delta:
+    old_lines = {line.rstrip("\r\n") for line in old_file} - {""}
+    new_lines = {line.rstrip("\r\n") for line in new_file} - {""}
+    added_lines = sorted(new_lines - old_lines)
+    removed_lines = sorted(old_lines - new_lines)
+    added_file.writelines(line + "\n" for line in added_lines)
+    removed_file.writelines(line + "\n" for line in removed_lines)
+    return Delta(len(added_lines), len(removed_lines))
+
+
+def write_delta(old_path: Optional[str], new_path: str, added_path: str, removed_path: str) -> Delta:
+    """
+    Write the lines only contained in the new file to added_path
+    and the lines only contained in the old file to removed_path.
+
+    Args:
+        old_path: previous version, None or a missing file: all lines are added
+        new_path: current version
+    Returns:
+        The number of added and removed lines
+    """
+    if old_path is None or not os.path.exists(old_path):
+        old_path = os.devnull
+
+    for compare in (_merge, _compare_sets):
+        with open(old_path, encoding="utf-8") as old_file, \
+                open(new_path, encoding="utf-8") as new_file, \
+                open(added_path, "w", encoding="utf-8", newline="\n") as added_file, \
+                open(removed_path, "w", encoding="utf-8", newline="\n") as removed_file:
+            try:
+                return compare(old_file, new_file, added_file, removed_file)
+            except _UnsortedError:
+                # ie. the database sorts differently than Python
+                logging.getLogger(__name__).warning(
+                    f"not sorted: '{old_path}' or '{new_path}', comparing in memory")
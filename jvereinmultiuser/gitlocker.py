@@ -1,9 +1,16 @@
 import os
+import re
+import sys
+import time
+import json
 import errno
+import shlex
+import hashlib
 import logging
 import subprocess
 from datetime import datetime
-from typing import Optional, Tuple, List, Any
+from typing import Optional, Tuple, List, Any, Callable, NamedTuple, Dict
+import jvereinmultiuser.process as process
 
 
 class IsLockedError(Exception):
@@ -14,6 +21,120 @@ class GitError(Exception):
     """ Git problem """
 
 
+class HistoryRewrittenError(GitError):
+    """ The branch of the remote repository has no common history with the local branch anymore """
+
+
+_LOCK_REF = "refs/jverein-multiuser/lock"
+# temporary branch to the newest archived commit while writing the history bundle,
+# restore the archive with 'git clone -b jverein-archive <bundle>'
+ARCHIVE_BRANCH = "jverein-archive"
+_ARCHIVE_REF = f"refs/heads/{ARCHIVE_BRANCH}"
+
+# Bundles for the transport on removable media, see export_bundle() and export_remote_bundle().
+# An upload bundle contains the branch, the lock tag and the lock journal of the lock holder,
+# a remote bundle the state of the remote repository: the branch (as _BUNDLE_REMOTE_REF) and the lock tags.
+BUNDLE_UPLOAD = "upload"
+BUNDLE_REMOTE = "remote"
+_BUNDLE_RELEASE_REF = "refs/jverein-multiuser/bundle/release"  # upload bundle: release the lock after applying
+_BUNDLE_REMOTE_REF = "refs/jverein-multiuser/bundle/remote"
+# local: head of the last exported upload bundle, until it has been applied to the remote repository
+_BUNDLE_EXPORTED_REF = "refs/jverein-multiuser/bundle/exported"
+
+# Every lock acquire, release and rejected attempt is appended as a JSON line to the lock journal of the instance:
+# a note on _LOCK_JOURNAL_TARGET in _LOCK_JOURNAL_PREFIX + lock name prefix. The note doesn't belong to a commit,
+# so it survives compact_history(). Only the instance itself writes its journal, so it's uploaded (forced)
+# with the atomic push of the lock tag, without fetching or merging anything first.
+_LOCK_JOURNAL_PREFIX = "refs/notes/jverein-multiuser-journal/"
+_LOCK_JOURNAL_REMOTE_PREFIX = "refs/jverein-multiuser/journal-remote/"  # the journals of the remote repository
+_LOCK_JOURNAL_TARGET = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"  # the empty tree, every repository knows it
+
+LOCK_ACQUIRED = "acquired"
+LOCK_RELEASED = "released"
+LOCK_REJECTED = "rejected"
+
+# ie. 'Receiving objects:  42% (21/50), 1.20 MiB | 512.00 KiB/s' or 'remote: Counting objects: 100% (3/3), done.'
+_PROGRESS_RE = re.compile(
+    r"^(?:remote: )?(?P<phase>[A-Za-z ]+):\s+(?P<percent>\d+)% \((?P<done>\d+)/(?P<total>\d+)\)"
+    r"(?:, (?P<transferred>[\d.]+ (?:bytes|[KMGT]iB))(?: \| (?P<rate>[\d.]+ (?:bytes|[KMGT]iB)/s))?)?"
+    r"(?P<finished>, done\.)?"
+)
+
+_SIZE_UNITS = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4}
+
+# The reference repository is shared by the local repositories of several clubs, they borrow its objects.
+# Its objects must never be pruned: a borrowing repository would be corrupted.
+_REFERENCE_REPO_CONFIG = [
+    ("gc.auto", "0"),
+    ("gc.pruneExpire", "never"),
+    ("gc.worktreePruneExpire", "never"),
+    ("gc.reflogExpire", "never"),
+    ("gc.reflogExpireUnreachable", "never"),
+]
+
+
+class LockEvent(NamedTuple):
+    time: str  # ISO 8601 with UTC offset
+    event: str  # LOCK_ACQUIRED, LOCK_RELEASED or LOCK_REJECTED
+    user: str  # author name
+    instance: str  # computer name
+    lock: str  # name of the lock tag, for LOCK_REJECTED: the lock tag of the holder
+    held_seconds: Optional[float] = None  # LOCK_RELEASED only
+
+
+class CommitStats(NamedTuple):
+    files: int  # changed files, including deleted ones
+    added_bytes: Dict[str, int]  # compressed size of the new objects by path, 0: object already in the repository
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.added_bytes.values())
+
+
+class CompactResult(NamedTuple):
+    old_head: str
+    archived_head: str  # newest archived commit, its tree is the tree of the new root commit
+    new_root: str
+    new_head: str
+    archived_commits: int
+    kept_commits: int  # commits after archived_head, rewritten onto new_root
+
+
+class BundleInfo(NamedTuple):
+    kind: str  # BUNDLE_UPLOAD or BUNDLE_REMOTE
+    head: str  # commit of the branch
+    lock_names: List[str]  # upload bundle: the lock of the holder, remote bundle: the locks of the remote repository
+    release: bool  # upload bundle: the lock is released when the bundle is applied
+    applied: bool = True  # import only: False if the bundle has been applied before
+
+
+class RemoteState(NamedTuple):
+    """
+    Last known state of the remote repository
+    """
+    lock_names: List[str]
+    locks_checked: Optional[float]  # time.time() when the lock tags were queried, None: unknown
+    heads: Dict[str, str]  # branch name -> commit hash
+    heads_checked: Optional[float]  # time.time() when the branches were queried, None: unknown
+
+    @property
+    def checked(self) -> Optional[float]:
+        """ time of the oldest part """
+        if self.locks_checked is None or self.heads_checked is None:
+            return None
+        return min(self.locks_checked, self.heads_checked)
+
+
+class GitProgress(NamedTuple):
+    phase: str  # ie. 'Receiving objects'
+    percent: int
+    done: int
+    total: int
+    transferred: Optional[str]  # ie. '1.20 MiB', only while transferring objects
+    rate: Optional[str]  # ie. '512.00 KiB/s'
+    finished: bool
+
+
 class GitLocker:
     """
     This class implements an alternating multi-user access to a Git repository.
@@ -21,8 +142,9 @@ class GitLocker:
     One GitLocker instance locks the repository by creating a tag on the remote repository,
     other GitLocker instances will recognize the tag and raise a GitError when trying to lock the repo.
 
-    There are possible race conditions when two GitLocker instances create a lock tag at the same time,
-    but that's acceptable for our purpose.
+    The lock tag is pushed in a single atomic push together with the lock reference (_LOCK_REF),
+    which must not exist on the remote repository yet. If two GitLocker instances try to lock
+    the repository at the same time, the remote repository accepts only one of the pushes.
     """
 
     def __init__(self,
@@ -31,7 +153,11 @@ class GitLocker:
                  remote_repo: str,
                  author_name: str,
                  author_email: str,
-                 instance_name: str):
+                 instance_name: str,
+                 ssh_control_dir: Optional[str] = None,
+                 progress_callback: Optional[Callable[[GitProgress], None]] = None,
+                 reference_repo: Optional[str] = None,
+                 remote_state_path: Optional[str] = None):
         """
         Args:
             git_cmd: Path to git executable, ie. '/usr/bin/git'
@@ -41,6 +167,16 @@ class GitLocker:
             author_email: The email that will be used for the commits, ie. 'john@example.org'
             instance_name: The name of this GitLocker instance (ie. computer name), ie. 'Johns MacBook'
                 For using multiple locks with the same author's name.
+            ssh_control_dir: Directory for the socket of a shared SSH connection, ie. '~/.jverein-multiuser'
+                If set, all git operations on an 'ssh://' remote repository share one SSH connection
+                until close() is called. Not supported on Windows.
+            progress_callback: Called with the progress of clone, fetch, pull and push, ie. to display it
+            reference_repo: Path of a shared object store, ie. '~/.jverein-multiuser/objects'
+                A bare repository which is created if necessary. The remote branches are fetched into it
+                before every clone, fetch and pull, the local repository borrows its objects.
+                Several local repositories (ie. of different clubs) can share one reference repository.
+            remote_state_path: JSON file caching the last known state of the remote repository,
+                see get_cached_remote_state(). It's updated by every operation that learns the remote state.
         Raises:
             NotADirectoryError
             ValueError
@@ -53,6 +189,11 @@ class GitLocker:
         self._author_name = author_name
         self._author_email = author_email
         self._instance_name = self._sanitize(instance_name)
+        self._progress_callback = progress_callback
+        self._reference_repo = os.path.expanduser(reference_repo) if reference_repo else None
+        self._remote_state_path = remote_state_path
+        self._pushed_bytes = 0
+        self._lock_journal_changed = False  # events have been recorded which haven't been pushed yet
 
         if not os.path.isdir(self._local_repo):
             raise NotADirectoryError(errno.ENOENT, os.strerror(errno.ENOENT), self._local_repo)
@@ -63,6 +204,24 @@ class GitLocker:
             raise ValueError("invalid author or instance name")
 
         self._lock_name_prefix = f"lock_{sanitized_author}_{sanitized_instance}"
+        self._lock_journal_ref = _LOCK_JOURNAL_PREFIX + self._lock_name_prefix
+        self._lock_journal_remote_ref = _LOCK_JOURNAL_REMOTE_PREFIX + self._lock_name_prefix
+
+        self._ssh_control_path = None
+        self._ssh_command = None
+        self._owns_ssh_master = False  # the master connection has been started by this instance
+        is_windows = sys.platform.startswith("win32") or sys.platform.startswith("cygwin")
+        if (ssh_control_dir and self._remote_repo.startswith("ssh://")
+                and not is_windows and "GIT_SSH_COMMAND" not in os.environ):
+            # ControlMaster=auto: the first connection becomes the master connection,
+            # ControlPersist: the master connection outlives the first git command
+            self._ssh_control_path = os.path.join(os.path.expanduser(ssh_control_dir), "ssh-control")
+            self._ssh_command = " ".join([
+                "ssh",
+                "-o", "ControlMaster=auto",
+                "-o", "ControlPersist=600",
+                "-o", shlex.quote(f"ControlPath={self._ssh_control_path}"),
+            ])
 
     @staticmethod
     def _sanitize(src_str: str) -> str:
@@ -85,29 +244,115 @@ class GitLocker:
 
         return sanitized_str
 
-    def _execute_git(self, args: List[str], ignore_err: Optional[str] = None) -> Tuple[int, str, str]:
+    def _execute_git(self,
+                     args: List[str],
+                     ignore_err: Optional[str] = None,
+                     keep_stdout: bool = True,
+                     progress: bool = False,
+                     repo: Optional[str] = None,
+                     env: Optional[Dict[str, str]] = None) -> Tuple[int, str, str]:
+        """
+        Args:
+            keep_stdout: False if the output isn't needed, only the last lines are kept in memory then
+            progress: parse the progress output (the command needs '--progress', stderr isn't a terminal)
+            repo: execute in this repository instead of the local repository
+            env: additional environment variables, ie. GIT_AUTHOR_DATE
+        """
         git_env = os.environ.copy()
         # we need the output in english to be able to parse it properly
         git_env["LANGUAGE"] = "en_US.UTF-8"
+        if self._ssh_command:
+            git_env["GIT_SSH_COMMAND"] = self._ssh_command
+        if env:
+            git_env.update(env)
 
         args = [self._git_cmd,
-                "-C", self._local_repo,
+                "-C", repo if repo else self._local_repo,
                 ] + args
-        self._logger.info(f"executing: '{' '.join(args)}'")
-        proc = subprocess.run(args, capture_output=True, env=git_env)
-        stdout_str = proc.stdout.decode()
-        stderr_str = proc.stderr.decode()
+        # the master connection is shared with other processes of the same working dir (ie. 'status' from cron),
+        # only the instance which started it may close it
+        socket_existed = self._ssh_control_path is not None and os.path.exists(self._ssh_control_path)
+        result = process.run(args, self._logger, env=git_env, ignore_err=ignore_err, keep_stdout=keep_stdout,
+                             on_stderr_line=self._handle_progress_line if progress else None)
+        if self._ssh_control_path and not socket_existed and os.path.exists(self._ssh_control_path):
+            self._owns_ssh_master = True
+        return result.returncode, result.stdout, result.stderr
+
+    @staticmethod
+    def _parse_progress(line: str) -> Optional[GitProgress]:
+        match = _PROGRESS_RE.match(line)
+        if match is None:
+            return None
+        return GitProgress(
+            phase=match.group("phase").strip(),
+            percent=int(match.group("percent")),
+            done=int(match.group("done")),
+            total=int(match.group("total")),
+            transferred=match.group("transferred"),
+            rate=match.group("rate"),
+            finished=match.group("finished") is not None
+        )
+
+    @staticmethod
+    def _parse_size(size: str) -> int:
+        """
+        Args:
+            size: as printed by git, ie. '1.23 MiB'
+        """
+        value, unit = size.split()
+        return round(float(value) * _SIZE_UNITS[unit])
+
+    @property
+    def pushed_bytes(self) -> int:
+        """ bytes sent by all pushes of this instance """
+        return self._pushed_bytes
 
-        ret = proc.returncode
-        if ignore_err and ignore_err in stderr_str:
-            ret = 0
+    def _handle_progress_line(self, line: str):
+        progress = self._parse_progress(line)
+        if progress is None:
+            return
+        if progress.finished and progress.transferred:
+            self._logger.info(f"{progress.phase}: {progress.total} objects, {progress.transferred}"
+                              + (f" ({progress.rate})" if progress.rate else ""))
+            if progress.phase == "Writing objects":
+                self._pushed_bytes += self._parse_size(progress.transferred)
+        if self._progress_callback:
+            self._progress_callback(progress)
+
+    @staticmethod
+    def _get_ssh_destination(remote_repo: str) -> Tuple[str, Optional[str]]:
+        """
+        Args:
+            remote_repo: ie. 'ssh://user@git.example.org:2222/~/jverein.git'
+        Returns:
+            The destination and the port for ssh, ie. ('user@git.example.org', '2222'),
+            the port is None if the URL doesn't contain one (ie. 'ssh://user@git.example.org:~/jverein.git')
+        """
+        netloc = remote_repo[len("ssh://"):].split("/")[0]
+        user_host, _, port = netloc.rpartition(":") if netloc.count(":") == 1 else (netloc, "", "")
+        if not port.isdigit():
+            return user_host or netloc, None
+        return user_host, port
 
-        log_level = logging.INFO if ret == 0 else logging.ERROR
-        self._logger.log(log_level, f"RETURNCODE: {proc.returncode}")
-        self._logger.log(log_level, f"STDOUT: {stdout_str}")
-        self._logger.log(log_level, f"STDERR: {stderr_str}")
+    def close(self):
+        """
+        Stop the shared SSH connection if this instance has started it.
+        The connections of running git commands (ie. of a concurrent session) are finished first,
+        a connection started by another process is left to ControlPersist.
+        """
+        if not self._owns_ssh_master or not os.path.exists(self._ssh_control_path):
+            return
 
-        return ret, stdout_str, stderr_str
+        destination, port = self._get_ssh_destination(self._remote_repo)
+        args = ["ssh", "-o", f"ControlPath={self._ssh_control_path}", "-O", "stop"]
+        if port:
+            args += ["-p", port]
+        args.append(destination)
+        self._logger.info(f"executing: '{' '.join(args)}'")
+        proc = subprocess.run(args, capture_output=True)
+        if proc.returncode != 0:
+            self._logger.warning(f"unable to stop the shared SSH connection: {proc.stderr.decode()}")
+        self._owns_ssh_master = False
 
     def _git_set_author_and_remote(self):
         ret = self._execute_git(
@@ -122,7 +367,87 @@ class GitLocker:
 
         self._execute_git(["remote", "set-url", "origin", self._remote_repo])
 
-    def stage_and_commit(self, commit_message: str):
+    def _get_reference_namespace(self) -> str:
+        """
+        Returns:
+            The ref namespace of the remote repository within the reference repository
+        """
+        remote_hash = hashlib.sha1(self._remote_repo.encode()).hexdigest()[:16]
+        return f"refs/remotes/{remote_hash}"
+
+    def _create_reference_repo_if_necessary(self) -> bool:
+        if os.path.isfile(os.path.join(self._reference_repo, "HEAD")):
+            return True
+
+        os.makedirs(self._reference_repo, exist_ok=True)
+        ret = self._execute_git(["init", "--bare", "-q"], repo=self._reference_repo)[0]
+        if ret != 0:
+            return False
+        for key, value in _REFERENCE_REPO_CONFIG:
+            ret = self._execute_git(["config", key, value], repo=self._reference_repo)[0]
+            if ret != 0:
+                return False
+        return True
+
+    def _update_reference_repo(self):
+        """
+        Fetch the branches of the remote repository into the reference repository.
+        Objects already stored for another remote repository aren't stored twice.
+
+        An error isn't fatal: the local repository fetches the missing objects itself then.
+        """
+        if not self._reference_repo:
+            return
+
+        if not self._create_reference_repo_if_necessary():
+            self._logger.warning(f"unable to create the reference repository '{self._reference_repo}'")
+            return
+
+        # the refs keep the objects reachable, even if the remote history is rewritten later on
+        ret = self._execute_git(
+            ["fetch", "--progress", "--no-tags", self._remote_repo,
+             f"+refs/heads/*:{self._get_reference_namespace()}/*"],
+            progress=True, repo=self._reference_repo)[0]
+        if ret != 0:
+            self._logger.warning(f"unable to update the reference repository '{self._reference_repo}'")
+
+    def _borrow_from_reference_repo(self):
+        """
+        Let an existing local repository borrow the objects of the reference repository
+        and drop the local copies of the borrowed objects.
+        """
+        if not self._reference_repo or not self.is_local_repo_available():
+            return
+
+        reference_objects_dir = os.path.join(os.path.abspath(self._reference_repo), "objects")
+        if not os.path.isdir(reference_objects_dir):
+            return
+
+        objects_dir = os.path.join(self._local_repo, ".git", "objects")
+        alternates_path = os.path.join(objects_dir, "info", "alternates")
+        alternates = []
+        if os.path.exists(alternates_path):
+            with open(alternates_path) as f:
+                # relative paths are relative to the objects directory
+                alternates = [os.path.normpath(os.path.join(objects_dir, line.strip())) for line in f if line.strip()]
+        if os.path.normpath(reference_objects_dir) in alternates:
+            return
+
+        self._logger.info(f"borrowing objects from the reference repository '{self._reference_repo}'")
+        os.makedirs(os.path.dirname(alternates_path), exist_ok=True)
+        with open(alternates_path, "a") as f:
+            f.write(reference_objects_dir + "\n")
+
+        # -l: objects available in the reference repository aren't packed again
+        ret = self._execute_git(["repack", "-a", "-d", "-l", "-q"], keep_stdout=False)[0]
+        if ret != 0:
+            self._logger.warning("unable to repack the local repository")
+
+    def stage_and_commit(self, commit_message: str) -> CommitStats:
+        """
+        Returns:
+            The number of changed files and the bytes the commit adds to the repository
+        """
         self._git_set_author_and_remote()
         self._execute_git(["status"])
 
@@ -130,42 +455,332 @@ class GitLocker:
         if ret != 0:
             raise GitError("Konnte die Änderungen nicht stagen.")
 
-        ret = self._execute_git(["commit", "-m", commit_message])[0]
+        ret = self._execute_git(["commit", "-m", commit_message], keep_stdout=False)[0]
         if ret != 0:
             raise GitError("Konnte die Änderungen nicht commiten.")
 
+        stats = self.get_commit_stats("HEAD")
+        self._logger.info(f"commit: {stats.files} files changed, {stats.total_bytes} bytes added")
+        return stats
+
+    def get_commit_stats(self, revision: str) -> CommitStats:
+        """
+        Count the changed files of the commit and the compressed size of the objects it adds, ie. of the files
+        not contained in its parents. 'git add' stores new objects as zlib compressed loose objects,
+        so their size is read from the file system. When pushing, git may compress them further as deltas.
+        """
+        ret, output = self._execute_git(["rev-list", "--objects", revision, "--not", f"{revision}^@"])[:2]
+        if ret != 0:
+            raise GitError("Konnte die Änderungen des Commits nicht ermitteln.")
+        new_objects = {line.split()[0] for line in output.splitlines() if line.strip()}
+
+        ret, output = self._execute_git(
+            ["diff-tree", "-r", "-z", "--no-renames", "--no-commit-id", "--root", revision])[:2]
+        if ret != 0:
+            raise GitError("Konnte die Änderungen des Commits nicht ermitteln.")
+
+        objects_dir = os.path.join(self._local_repo, ".git", "objects")
+        added_bytes = {}
+        files = 0
+        fields = output.split("\0")
+        # ':<old mode> <new mode> <old object> <new object> <status>', '<path>', ...
+        for meta, path in zip(fields[0::2], fields[1::2]):
+            meta_parts = meta.strip().split()
+            if len(meta_parts) < 5:
+                continue
+            files += 1
+            new_object = meta_parts[3]
+            if set(new_object) == {"0"}:
+                continue  # deleted
+            loose_path = os.path.join(objects_dir, new_object[:2], new_object[2:])
+            if new_object in new_objects and os.path.exists(loose_path):
+                added_bytes[path] = os.path.getsize(loose_path)
+            else:
+                added_bytes[path] = 0  # ie. a file restored from an older version
+        return CommitStats(files=files, added_bytes=added_bytes)
+
     def is_local_repo_available(self) -> bool:
         return os.path.exists(os.path.join(self._local_repo, ".git"))
 
-    def get_lock_info(self) -> Optional[str]:
+    def get_commit(self, revision: str) -> Optional[str]:
+        """
+        Args:
+            revision: ie. 'HEAD' or '@{upstream}'
+        Returns:
+            The commit hash or None if the revision doesn't exist (yet)
+        """
+        ret, output = self._execute_git(["rev-parse", "--verify", "-q", f"{revision}^{{commit}}"])[:2]
+        if ret != 0:
+            return None
+        return output.strip()
+
+    @staticmethod
+    def _format_lock_name(lock_name: str) -> str:
+        lock_name_parts = lock_name.split("_")[1:]  # delete lock_
+        lock_author = lock_name_parts[0].replace("-", " ")
+        lock_instance = lock_name_parts[1].replace("-", " ")
+        lock_date = lock_name_parts[2]
+        lock_time = lock_name_parts[3].replace("-", ":")
+        return f"{lock_author} ({lock_instance}) {lock_date} {lock_time}"
+
+    def _get_lock_names(self) -> List[str]:
         ret, output = self._execute_git(["tag", "-l", "lock*"])[:2]
         if ret != 0:
             raise GitError("Konnte nicht Tag prüfen. Bitte Log prüfen.")
+        return [line.strip() for line in output.splitlines() if line.strip()]
 
-        num_locks = output.count("\n")
-        if num_locks > 1:
+    def get_lock_info(self) -> Optional[str]:
+        lock_names = self._get_lock_names()
+        if len(lock_names) > 1:
             raise GitError("Achtung! Mehr als ein Lock! Das darf nicht passieren!")
-        elif num_locks == 1:
-            lock_name_parts = output.strip().split("_")[1:]  # delete lock_
-            lock_author = lock_name_parts[0].replace("-", " ")
-            lock_instance = lock_name_parts[1].replace("-", " ")
-            lock_date = lock_name_parts[2]
-            lock_time = lock_name_parts[3].replace("-", ":")
-            return f"{lock_author} ({lock_instance}) {lock_date} {lock_time}"
+        elif len(lock_names) == 1:
+            return self._format_lock_name(lock_names[0])
 
         return None
 
-    def is_locked_by_me(self) -> bool:
-        ret, output = self._execute_git(["tag", "-l", "lock*"])[:2]
+    def get_remote_lock_info(self) -> Optional[str]:
+        """
+        Like get_lock_info(), but queries the remote repository without fetching any objects.
+        """
+        return self.format_lock_names(self.get_remote_lock_names())
+
+    def get_ahead_behind(self, revision: str = "@{upstream}") -> Tuple[int, int]:
+        """
+        Returns:
+            The number of local commits missing in the revision and the number of commits of the revision
+            missing locally, ie. (unpushed, not pulled) for '@{upstream}'
+        """
+        ret, output = self._execute_git(["rev-list", "--left-right", "--count", f"HEAD...{revision}"])[:2]
         if ret != 0:
-            raise GitError("Konnte nicht Tag prüfen. Bitte Log prüfen.")
+            raise GitError("Konnte die Commits nicht vergleichen. Bitte Log prüfen.")
+        ahead, behind = output.split()
+        return int(ahead), int(behind)
 
-        num_locks = output.count("\n")
-        if num_locks > 1:
+    def get_commit_summary(self, revision: str) -> Optional[str]:
+        """
+        Returns:
+            Date, author and subject of the commit, ie. '2024-03-01 John Doe: Beiträge gebucht'
+        """
+        ret, output = self._execute_git(["log", "-1", "--format=%cd %an: %s", "--date=short", revision, "--"])[:2]
+        if ret != 0:
+            return None
+        return output.strip()
+
+    def get_remote_lock_names(self) -> List[str]:
+        """
+        Query the lock tags of the remote repository without fetching any objects.
+        """
+        ret, output = self._execute_git(["ls-remote", "--tags", "origin", "refs/tags/lock*"])[:2]
+        if ret != 0:
+            raise GitError("Konnte den Lock-Status nicht abfragen. Bitte Log prüfen.")
+
+        lock_names = []
+        for line in output.splitlines():
+            ref = line.split("\t")[-1].strip()
+            if ref.endswith("^{}"):
+                continue  # peeled annotated tag
+            lock_names.append(ref[len("refs/tags/"):])
+        self._save_remote_state(lock_names=lock_names)
+        return lock_names
+
+    def get_cached_remote_state(self) -> Optional[RemoteState]:
+        """
+        Returns:
+            The last known state of the remote repository without any network access, None if unknown
+        """
+        if not self._remote_state_path:
+            return None
+        try:
+            with open(self._remote_state_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            self._logger.warning(f"ignoring invalid remote state file '{self._remote_state_path}'")
+            return None
+        if data.get("remote") != self._remote_repo:
+            return None  # the remote repository has been changed in the configuration
+        return RemoteState(
+            lock_names=data.get("lock_names", []),
+            locks_checked=data.get("locks_checked"),
+            heads=data.get("heads", {}),
+            heads_checked=data.get("heads_checked")
+        )
+
+    def _save_remote_state(self, lock_names: Optional[List[str]] = None, heads: Optional[Dict[str, str]] = None):
+        """
+        Update the cached state of the remote repository, None: part unchanged
+        """
+        if not self._remote_state_path:
+            return
+        state = self.get_cached_remote_state() or RemoteState([], None, {}, None)
+        now = time.time()
+        if lock_names is not None:
+            state = state._replace(lock_names=lock_names, locks_checked=now)
+        if heads is not None:
+            state = state._replace(heads=heads, heads_checked=now)
+
+        data = state._asdict()
+        data["remote"] = self._remote_repo
+        temp_path = f"{self._remote_state_path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(temp_path, self._remote_state_path)
+        except OSError as e:
+            self._logger.warning(f"unable to write the remote state file: {e}")
+
+    def _get_remote_tracking_heads(self) -> Dict[str, str]:
+        ret, output = self._execute_git(
+            ["for-each-ref", "--format=%(refname:lstrip=3) %(objectname)", "refs/remotes/origin/"])[:2]
+        if ret != 0:
+            raise GitError("Konnte die Branches nicht abfragen. Bitte Log prüfen.")
+        heads = {}
+        for line in output.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[0] != "HEAD":
+                heads[parts[0]] = parts[1]
+        return heads
+
+    def _save_remote_state_from_local_refs(self, locks: bool = True, heads: bool = True):
+        """
+        Cache the remote state after an operation which synchronized the local refs with the remote repository.
+        """
+        if not self._remote_state_path:
+            return
+        self._save_remote_state(
+            lock_names=self._get_lock_names() if locks else None,
+            heads=self._get_remote_tracking_heads() if heads else None
+        )
+
+    def refresh_remote_state(self) -> RemoteState:
+        """
+        Query the branches and lock tags of the remote repository with a single 'git ls-remote',
+        without fetching any objects, and cache the result.
+        """
+        ret, output = self._execute_git(["ls-remote", "--heads", "--tags", "origin"])[:2]
+        if ret != 0:
+            raise GitError("Konnte den Status des Remote Repository nicht abfragen. Bitte Log prüfen.")
+
+        lock_names = []
+        heads = {}
+        for line in output.splitlines():
+            parts = line.split("\t")
+            if len(parts) != 2:
+                continue
+            commit, ref = parts[0].strip(), parts[1].strip()
+            if ref.startswith("refs/heads/"):
+                heads[ref[len("refs/heads/"):]] = commit
+            elif ref.startswith("refs/tags/lock") and not ref.endswith("^{}"):
+                lock_names.append(ref[len("refs/tags/"):])
+
+        self._save_remote_state(lock_names=lock_names, heads=heads)
+        return self.get_cached_remote_state() or RemoteState(lock_names, time.time(), heads, time.time())
+
+    def get_remote_head(self, state: RemoteState) -> Optional[str]:
+        """
+        Returns:
+            The commit of the current branch in the remote repository according to the state, None if unknown
+        """
+        branch = self.read_current_branch()
+        if branch is None:
+            return None
+        return state.heads.get(branch)
+
+    def _read_ref_file(self, ref: str) -> Optional[str]:
+        """
+        Returns:
+            The content of a loose or packed ref, ie. a commit hash or 'ref: refs/heads/master', None if not found
+        """
+        git_dir = os.path.join(self._local_repo, ".git")
+        try:
+            with open(os.path.join(git_dir, *ref.split("/")), "r") as f:
+                return f.read().strip() or None
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            pass
+        try:
+            with open(os.path.join(git_dir, "packed-refs"), "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[1] == ref and not line.startswith(("#", "^")):
+                        return parts[0]
+        except FileNotFoundError:
+            pass
+        return None
+
+    def read_current_branch(self) -> Optional[str]:
+        """
+        Like _get_current_branch(), but reads the files of the local repository instead of running git.
+
+        Returns:
+            None if HEAD is detached or the repository doesn't exist
+        """
+        head = self._read_ref_file("HEAD")
+        if head is None or not head.startswith("ref: refs/heads/"):
+            return None
+        return head[len("ref: refs/heads/"):]
+
+    def read_ref(self, ref: str) -> Optional[str]:
+        """
+        Resolve a ref by reading the files of the local repository, without running git (ie. for a fast 'status').
+
+        Args:
+            ref: 'HEAD' or a full ref name, ie. 'refs/remotes/origin/master'
+        Returns:
+            The commit hash, None if the ref doesn't exist
+        """
+        for _ in range(5):  # symbolic refs
+            value = self._read_ref_file(ref)
+            if value is None or not value.startswith("ref: "):
+                return value
+            ref = value[len("ref: "):]
+        return None
+
+    def is_own_lock(self, lock_name: str) -> bool:
+        return lock_name.startswith(self._lock_name_prefix)
+
+    @classmethod
+    def format_lock_names(cls, lock_names: List[str]) -> Optional[str]:
+        """
+        Returns:
+            The lock holders for display, ie. 'John Doe (Johns MacBook) 2024-03-01 10:15:00', None if not locked
+        """
+        if not lock_names:
+            return None
+        return ", ".join(cls._format_lock_name(lock_name) for lock_name in lock_names)
+
+    def wait_for_unlock(self, max_wait: float, initial_interval: float = 5.0, max_interval: float = 60.0) -> bool:
+        """
+        Poll the lock tags of the remote repository until there is no lock left.
+        The interval between two polls doubles after each poll.
+
+        Args:
+            max_wait: Maximum time to wait in seconds
+            initial_interval: Time between the first two polls in seconds
+            max_interval: Upper limit for the time between two polls in seconds
+        Returns:
+            True if the remote repository is unlocked, False if max_wait has been exceeded
+        """
+        self._git_set_author_and_remote()
+        deadline = time.monotonic() + max_wait
+        interval = initial_interval
+        while True:
+            if not self.get_remote_lock_names():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._logger.info(f"remote repository is locked, next poll in {min(interval, remaining):.0f}s")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+    def is_locked_by_me(self) -> bool:
+        lock_names = self._get_lock_names()
+        if len(lock_names) > 1:
             raise GitError(
                 "Achtung! Mehr als ein Lock! Das darf nicht passieren!")
-        elif num_locks == 1:
-            return output.strip().startswith(self._lock_name_prefix)
+        elif len(lock_names) == 1:
+            return lock_names[0].startswith(self._lock_name_prefix)
 
         return False
 
@@ -211,7 +826,10 @@ class GitLocker:
             initial_commit_data: Data of the file which will be committed if we cloned an empty repo
             initial_commit_file_dst_path: Relative path to which the data should be written to
         """
-        ret, output, error = self._execute_git(["clone", self._remote_repo, "."])
+        self._update_reference_repo()
+        reference_args = ["--reference-if-able", os.path.abspath(self._reference_repo)] if self._reference_repo else []
+        ret, output, error = self._execute_git(["clone", "--progress"] + reference_args + [self._remote_repo, "."],
+                                               progress=True)
         if ret != 0:
             raise GitError("Konnte nicht clonen. Bitte Log prüfen.")
 
@@ -221,16 +839,24 @@ class GitLocker:
             with open(dst_path, "wb") as f:
                 f.write(initial_commit_data)
             self.stage_and_commit("initial commit")
+        else:
+            # continue the own lock journal, ie. after setting up the working dir again
+            self._fetch_lock_journals()
 
     def pull(self):
         self._git_set_author_and_remote()
-        ret = self._execute_git(["pull"])[0]
+        self._update_reference_repo()
+        self._borrow_from_reference_repo()
+        ret = self._execute_git(["pull", "--progress"], keep_stdout=False, progress=True)[0]
         if ret != 0:
+            if self.get_commit("@{upstream}") and not self._has_common_history("HEAD", "@{upstream}"):
+                raise HistoryRewrittenError("Der Verlauf im Remote Repository wurde neu geschrieben.")
             raise GitError("Konnte nicht updaten. Bitte Log prüfen.")
 
         ret, out, err = self._execute_git(
             ["pull", "--prune", "origin", "+refs/tags/*:refs/tags/*"],
-            ignore_err="no candidates for merging among the refs"
+            ignore_err="no candidates for merging among the refs",
+            keep_stdout=False
         )
         # you provided a wildcard refspec which had no
         # matches on the remote end.
@@ -239,28 +865,142 @@ class GitLocker:
         if ret != 0:
             raise GitError("Konnte nicht updaten. Bitte Log prüfen.")
 
-    def pull_and_lock(self):
-        self.pull()
+        self._save_remote_state_from_local_refs()
+
+    def fetch(self):
+        """
+        Download the current state of the remote repository without changing the working directory.
+        """
+        self._git_set_author_and_remote()
+        self._update_reference_repo()
+        self._borrow_from_reference_repo()
+        # --no-tags: the lock tags are only updated by pull()
+        ret = self._execute_git(["fetch", "--progress", "--no-tags", "origin"], progress=True)[0]
+        if ret != 0:
+            raise GitError("Konnte nicht herunterladen. Bitte Log prüfen.")
+
+        self._save_remote_state_from_local_refs(locks=False)
+
+    def export_file(self, revision: str, path: str, dst_path: str) -> bool:
+        """
+        Write a file of the given revision to dst_path without changing the working directory.
+
+        Args:
+            revision: ie. 'HEAD' or '@{upstream}'
+            path: path of the file, relative to the repository
+            dst_path: destination file path
+        Returns:
+            False if the file doesn't exist in the given revision
+        """
+        args = [self._git_cmd, "-C", self._local_repo, "cat-file", "blob", f"{revision}:{path}"]
+        self._logger.info(f"executing: '{' '.join(args)}'")
+        with open(dst_path, "wb") as f:
+            proc = subprocess.run(args, stdout=f, stderr=subprocess.PIPE)
+        if proc.returncode != 0:
+            self._logger.info(f"STDERR: {proc.stderr.decode()}")
+            os.unlink(dst_path)
+            return False
+        return True
+
+    def _fetch_tags(self):
+        ret = self._execute_git(["fetch", "--prune", "origin", "+refs/tags/*:refs/tags/*"])[0]
+        if ret != 0:
+            raise GitError("Konnte Tags nicht herunterladen. Bitte Log prüfen.")
+
+    @staticmethod
+    def _is_rejected(push_output: str, ref: str) -> bool:
+        """
+        Args:
+            push_output: stdout of 'git push --porcelain'
+            ref: remote ref, ie. 'refs/tags/example'
+        """
+        for line in push_output.splitlines():
+            parts = line.split("\t")
+            if len(parts) >= 2 and parts[0] == "!" and parts[1].endswith(f":{ref}"):
+                return True
+        return False
 
-        # check lock after updating
-        lock_name = self.get_lock_info()
-        is_locked_by_me = self.is_locked_by_me()
-        if lock_name is not None and not is_locked_by_me:
-            raise IsLockedError(f"Ist bereits gelockt von: {lock_name}")
+    def lock(self) -> str:
+        """
+        Lock the remote repository with a single atomic push. Nothing is fetched.
+
+        Returns:
+            The name of the lock tag
+        Raises:
+            IsLockedError: if the remote repository is already locked
+        """
+        if self.is_locked_by_me():
+            raise IsLockedError(f"Ist bereits von Dir gelockt: {self.get_lock_info()}")
 
-        if lock_name is not None and is_locked_by_me:
-            raise IsLockedError(f"Ist bereits von Dir gelockt: {lock_name}")
+        self._git_set_author_and_remote()
 
-        # no lock acquired, create and push tag
         sanitized_datetime = datetime.now().isoformat("_").split(".")[0].replace(":", "-")
         lock_name = self._lock_name_prefix + "_" + sanitized_datetime
-        ret = self._execute_git(["tag", lock_name])[0]
+        ret = self._execute_git(["tag", "-a", "-m", lock_name, lock_name])[0]
         if ret != 0:
             raise GitError("Konnte kein Tag anlegen! Bitte Log prüfen")
 
-        ret = self._execute_git(["push", "origin", lock_name])[0]
+        # The annotated tag object is unique for every lock. The remote repository
+        # rejects the whole push if _LOCK_REF already exists.
+        journal_head = self._record_lock_event(LOCK_ACQUIRED, lock_name)
+        ret, output = self._execute_git([
+            "push", "--porcelain", "--atomic", f"--force-with-lease={_LOCK_REF}:",
+            "origin", f"refs/tags/{lock_name}", f"refs/tags/{lock_name}:{_LOCK_REF}"
+        ] + self._get_lock_journal_refspecs())[:2]
+        if ret != 0:
+            self._execute_git(["tag", "-d", lock_name])
+            self._reset_lock_journal(journal_head)
+            if not self._is_rejected(output, _LOCK_REF):
+                raise GitError("Konnte Tag nicht pushen! Bitte Log prüfen")
+
+            self._fetch_tags()
+            self._save_remote_state_from_local_refs(heads=False)
+            for holder_lock_name in self._get_lock_names():
+                self._record_lock_event(LOCK_REJECTED, holder_lock_name)
+            lock_info = self.get_lock_info()
+            if lock_info is None:
+                raise GitError(f"Die Lock-Referenz '{_LOCK_REF}' existiert, aber kein Lock-Tag. "
+                               f"Bitte die Referenz im Remote Repository manuell löschen.")
+            if self.is_locked_by_me():
+                raise IsLockedError(f"Ist bereits von Dir gelockt: {lock_info}")
+            raise IsLockedError(f"Ist bereits gelockt von: {lock_info}")
+
+        # remember the lock reference for unlock()
+        ret = self._execute_git(["update-ref", _LOCK_REF, f"refs/tags/{lock_name}"])[0]
         if ret != 0:
-            raise GitError("Konnte Tag nicht pushen! Bitte Log prüfen")
+            raise GitError("Konnte die Lock-Referenz nicht anlegen! Bitte Log prüfen")
+
+        self._set_lock_journal_pushed()
+        self._save_remote_state(lock_names=[lock_name])
+        return lock_name
+
+    def pull_and_lock(self):
+        """
+        Lock the remote repository first, then pull the current state.
+
+        Raises:
+            IsLockedError: if the remote repository is already locked
+            GitError: if the pull fails, the lock is released then
+            HistoryRewrittenError: the lock is kept, it's needed to adopt the rewritten history
+        """
+        lock_name = self.lock()
+        try:
+            self.pull()
+        except HistoryRewrittenError:
+            raise
+        except GitError:
+            # holding the lock means the local repository is up to date, don't keep it with a stale one
+            try:
+                self.unlock()
+            except GitError:
+                self._logger.exception("unable to release the lock after the failed pull")
+            raise
+
+        # lock tags of older versions of jverein-multiuser come without a lock reference
+        other_lock_names = [n for n in self._get_lock_names() if n != lock_name]
+        if other_lock_names:
+            self.unlock()
+            raise IsLockedError(f"Ist bereits gelockt von: {self._format_lock_name(other_lock_names[0])}")
 
     def push(self):
         if self.is_synced_with_remote_repo():
@@ -269,16 +1009,43 @@ class GitLocker:
         if self.need_to_commit():
             raise GitError("Working directory ist nicht clean!")
 
-        ret = self._execute_git(["push", "-u"])[0]  # set upstream. important for initial commit in an empty repo
+        ret = self._execute_git(["push", "--progress", "-u"], progress=True)[0]  # set upstream. important for initial commit in an empty repo
         if ret != 0:
             raise GitError("Konnte nicht pushen!")
 
-    def unlock(self):
-        ret, output = self._execute_git(["tag", "-l", "lock*"])[:2]
+        self._save_remote_state_from_local_refs(locks=False)
+
+    def _get_lock_ref_refspecs(self, lock_name: str) -> List[str]:
+        """
+        Returns the arguments for 'git push' to delete _LOCK_REF together with the lock tag.
+        """
+        ret, lock_ref_target = self._execute_git(["rev-parse", "--verify", "-q", _LOCK_REF])[:2]
         if ret != 0:
-            raise GitError("Konnte nicht Tag prüfen. Bitte Log prüfen.")
+            return []  # locked by an older version of jverein-multiuser
 
-        num_locks = output.count("\n")
+        lock_ref_target = lock_ref_target.strip()
+        lock_tag_target = self._execute_git(["rev-parse", "--verify", "-q", f"refs/tags/{lock_name}"])[1].strip()
+        if lock_ref_target != lock_tag_target:
+            self._logger.warning(f"ignoring stale lock reference {_LOCK_REF}")
+            self._execute_git(["update-ref", "-d", _LOCK_REF])
+            return []
+
+        return [f"--force-with-lease={_LOCK_REF}:{lock_ref_target}", f":{_LOCK_REF}"]
+
+    def _delete_local_lock(self, lock_name: str):
+        ret = self._execute_git(["tag", "-d", lock_name])[0]
+        if ret != 0:
+            raise GitError("Konnte lokalen Tag nicht löschen! Bitte Log prüfen")
+
+        self._execute_git(["update-ref", "-d", _LOCK_REF])
+
+    def _get_own_lock_name(self) -> str:
+        lock_names = self._get_lock_names()
+        if len(lock_names) > 1:
+            # only possible with lock tags of older versions of jverein-multiuser, see pull_and_lock()
+            lock_names = [n for n in lock_names if n.startswith(self._lock_name_prefix)]
+
+        num_locks = len(lock_names)
         if num_locks > 1:
             self._logger.error("> 1 lock acquired")
             raise GitError("Achtung! Mehr als ein Lock! Das darf nicht passieren!")
@@ -286,23 +1053,641 @@ class GitLocker:
             self._logger.error("0 locks acquired")
             raise GitError("Achtung! Kein Lock! Das darf nicht passieren!")
 
-        lock_name = output.split("\n")[0].strip()
+        return lock_names[0]
+
+    def get_lock_held_seconds(self) -> Optional[float]:
+        """
+        Returns:
+            The time since the own lock has been acquired, None if not locked by me
+        """
+        for lock_name in self._get_lock_names():
+            if not lock_name.startswith(self._lock_name_prefix):
+                continue
+            try:
+                locked = datetime.strptime(lock_name[len(self._lock_name_prefix) + 1:], "%Y-%m-%d_%H-%M-%S")
+            except ValueError:
+                return None  # lock tag of an older version of jverein-multiuser
+            return max(0.0, (datetime.now() - locked).total_seconds())
+        return None
+
+    def _record_lock_event(self, event: str, lock_name: str, held_seconds: Optional[float] = None) -> Optional[str]:
+        """
+        Append the event to the own lock journal. It's uploaded with the next push of a lock tag
+        (see _get_lock_journal_refspecs()) or by push_lock_journal().
+        The journal is only informational: errors are logged, but never raised.
+
+        Returns:
+            The commit of the journal before the event, for _reset_lock_journal()
+        """
+        previous_head = self.get_commit(self._lock_journal_ref)
+        if previous_head is None and self.get_commit(self._lock_journal_remote_ref) is not None:
+            # ie. a new working dir: continue the journal of the remote repository
+            self._execute_git(["update-ref", self._lock_journal_ref, self._lock_journal_remote_ref])
+        lock_event = LockEvent(
+            time=datetime.now().astimezone().isoformat(timespec="seconds"),
+            event=event,
+            user=self._author_name,
+            instance=self._instance_name,
+            lock=lock_name,
+            held_seconds=round(held_seconds) if held_seconds is not None else None
+        )
+        line = json.dumps({k: v for k, v in lock_event._asdict().items() if v is not None}, ensure_ascii=False)
+        ret, note = self._execute_git(["notes", f"--ref={self._lock_journal_ref}", "show", _LOCK_JOURNAL_TARGET],
+                                      ignore_err="no note found")[:2]
+        lines = note.splitlines() if ret == 0 else []
+        ret = self._execute_git(["notes", f"--ref={self._lock_journal_ref}", "add", "-f",
+                                 "-m", "\n".join(lines + [line]), _LOCK_JOURNAL_TARGET])[0]
+        if ret != 0:
+            self._logger.warning(f"unable to record lock event: {line}")
+        else:
+            self._lock_journal_changed = True
+        return previous_head
+
+    def _reset_lock_journal(self, journal_head: Optional[str]):
+        """
+        Drop the events recorded for a push which has failed, see _record_lock_event().
+        """
+        if journal_head is None:
+            self._execute_git(["update-ref", "-d", self._lock_journal_ref])
+        else:
+            self._execute_git(["update-ref", self._lock_journal_ref, journal_head])
+
+    def _get_lock_journal_refspecs(self) -> List[str]:
+        """
+        Returns the arguments for 'git push' to upload the own lock journal together with the lock tag.
+        """
+        if not self._has_unpushed_lock_journal():
+            return []
+        return [f"+{self._lock_journal_ref}:{self._lock_journal_ref}"]
+
+    def _has_unpushed_lock_journal(self) -> bool:
+        journal_head = self.get_commit(self._lock_journal_ref)
+        return journal_head is not None and journal_head != self.get_commit(self._lock_journal_remote_ref)
+
+    def _set_lock_journal_pushed(self):
+        if self.get_commit(self._lock_journal_ref) is not None:
+            self._execute_git(["update-ref", self._lock_journal_remote_ref, self._lock_journal_ref])
+        self._lock_journal_changed = False
+
+    def _fetch_lock_journals(self) -> bool:
+        """
+        Download the lock journals of all instances from the remote repository.
+
+        Returns:
+            False if they couldn't be fetched
+        """
+        ret = self._execute_git(["fetch", "--prune", "--no-tags", "origin",
+                                 f"+{_LOCK_JOURNAL_PREFIX}*:{_LOCK_JOURNAL_REMOTE_PREFIX}*"])[0]
+        if ret != 0:
+            self._logger.warning("unable to fetch the lock journals")
+            return False
+        return True
+
+    def push_lock_journal(self):
+        """
+        Upload the lock events of this instance which haven't been pushed with a lock tag, ie. rejected lock attempts.
+        Nothing is done if there aren't any.
+        Errors are logged, but never raised: the journal must not get in the way of locking.
+        """
+        if not self._lock_journal_changed:
+            return
+        refspecs = self._get_lock_journal_refspecs()
+        if not refspecs:
+            return
+        ret = self._execute_git(["push", "--porcelain", "origin"] + refspecs)[0]
+        if ret != 0:
+            self._logger.warning("unable to push the lock journal, it's pushed with the next lock event")
+            return
+        self._set_lock_journal_pushed()
+
+    def get_lock_events(self) -> List[LockEvent]:
+        """
+        Returns:
+            All events of the lock journals of the local and the remote repository, sorted by time
+        """
+        self._git_set_author_and_remote()
+        self._fetch_lock_journals()
+        ret, output = self._execute_git(["for-each-ref", "--format=%(refname)", _LOCK_JOURNAL_REMOTE_PREFIX])[:2]
+        journal_refs = set(output.split()) if ret == 0 else set()
+        if self.get_commit(self._lock_journal_ref) is not None:
+            journal_refs.add(self._lock_journal_ref)  # including the events which haven't been pushed yet
+        if not journal_refs:
+            return []
+
+        # every note is a blob in the tree of a notes commit: read them all at once
+        ret, output = self._execute_git(["grep", "-h", "--no-color", "-e", ""] + sorted(journal_refs))[:2]
+        if ret not in (0, 1):  # 1: no lines
+            raise GitError("Konnte das Lock-Journal nicht lesen. Bitte Log prüfen.")
+
+        events = set()
+        for line in output.splitlines():
+            try:
+                data = json.loads(line)
+                events.add(LockEvent(**data))
+            except (ValueError, TypeError):
+                self._logger.warning(f"ignoring invalid lock journal line: {line}")
+        return sorted(events, key=lambda e: (e.time, e.event, e.lock))
+
+    def _get_current_branch(self) -> str:
+        ret, output = self._execute_git(["symbolic-ref", "--short", "HEAD"])[:2]
+        if ret != 0:
+            raise GitError("Konnte den aktuellen Branch nicht ermitteln.")
+        return output.strip()
+
+    def unlock(self):
+        lock_name = self._get_own_lock_name()
+        held_seconds = self.get_lock_held_seconds()
 
         # delete lock remotely
-        ret = self._execute_git(["push", "--delete", "origin", lock_name])[0]
+        journal_head = self._record_lock_event(LOCK_RELEASED, lock_name, held_seconds)
+        ret = self._execute_git(
+            ["push", "--atomic", "origin", f":refs/tags/{lock_name}"] + self._get_lock_ref_refspecs(lock_name)
+            + self._get_lock_journal_refspecs())[0]
         if ret != 0:
+            self._reset_lock_journal(journal_head)
             raise GitError("Konnte entfernten Tag nicht löschen! Bitte Log prüfen")
 
         # delete lock locally (if deleting remotely succeeded)
-        ret = self._execute_git(["tag", "-d", lock_name])[0]
+        self._set_lock_journal_pushed()
+        self._delete_local_lock(lock_name)
+        self._save_remote_state(lock_names=[])
+
+    def push_and_unlock(self):
+        """
+        Push the committed changes and delete the lock in a single atomic push.
+        Either both succeed or nothing is changed on the remote repository.
+        """
+        if self.is_synced_with_remote_repo():
+            raise GitError("Keine Änderungen")
+
+        if self.need_to_commit():
+            raise GitError("Working directory ist nicht clean!")
+
+        lock_name = self._get_own_lock_name()
+        held_seconds = self.get_lock_held_seconds()
+        branch = self._get_current_branch()
+
+        journal_head = self._record_lock_event(LOCK_RELEASED, lock_name, held_seconds)
+        ret = self._execute_git(
+            ["push", "--progress", "--atomic", "-u", "origin", branch, f":refs/tags/{lock_name}"]
+            + self._get_lock_ref_refspecs(lock_name) + self._get_lock_journal_refspecs(), progress=True)[0]
         if ret != 0:
-            raise GitError("Konnte lokalen Tag nicht löschen! Bitte Log prüfen")
+            self._reset_lock_journal(journal_head)
+            raise GitError("Konnte nicht pushen!")
+
+        self._set_lock_journal_pushed()
+        self._delete_local_lock(lock_name)
+        self._save_remote_state(lock_names=[], heads=self._get_remote_tracking_heads())
+
+    def _has_common_history(self, revision1: str, revision2: str) -> bool:
+        return self._execute_git(["merge-base", revision1, revision2])[0] == 0
+
+    def is_ancestor(self, ancestor: str, revision: str) -> bool:
+        """
+        Returns:
+            True if ancestor is contained in the history of revision (or is the same commit)
+        """
+        ret = self._execute_git(["merge-base", "--is-ancestor", ancestor, revision])[0]
+        if ret not in (0, 1):
+            raise GitError("Konnte die Commits nicht vergleichen. Bitte Log prüfen.")
+        return ret == 0
+
+    def _write_history_bundle(self, revision: str, bundle_path: str):
+        """
+        Write the history up to and including revision to a bundle and verify it.
+        It can be restored with 'git clone -b jverein-archive <bundle_path>'.
+        """
+        ret = self._execute_git(["update-ref", _ARCHIVE_REF, revision])[0]
+        if ret != 0:
+            raise GitError("Konnte den Verlauf nicht archivieren. Bitte Log prüfen.")
+        try:
+            ret = self._execute_git(["bundle", "create", "-q", bundle_path, _ARCHIVE_REF], keep_stdout=False)[0]
+            if ret != 0:
+                raise GitError("Konnte den Verlauf nicht archivieren. Bitte Log prüfen.")
+        finally:
+            self._execute_git(["update-ref", "-d", _ARCHIVE_REF])
+
+        ret = self._execute_git(["bundle", "verify", "-q", bundle_path])[0]
+        ret_heads, heads = self._execute_git(["bundle", "list-heads", bundle_path])[:2]
+        if ret != 0 or ret_heads != 0 or f"{revision} {_ARCHIVE_REF}" not in heads.splitlines():
+            raise GitError(f"Das Archiv '{bundle_path}' ist fehlerhaft. Bitte Log prüfen.")
+
+    def _get_first_parent_commits(self, revision_range: str) -> List[dict]:
+        """
+        Returns:
+            The commits of the range along the first parents, oldest first, with their metadata
+        """
+        ret, output = self._execute_git([
+            "log", "--reverse", "--first-parent", "--date=raw",
+            "--format=%H%x00%T%x00%an%x00%ae%x00%ad%x00%cn%x00%ce%x00%cd%x00%B%x1e", revision_range
+        ])[:2]
+        if ret != 0:
+            raise GitError("Konnte den Verlauf nicht lesen. Bitte Log prüfen.")
+        keys = ["commit", "tree", "author_name", "author_email", "author_date",
+                "committer_name", "committer_email", "committer_date", "message"]
+        return [dict(zip(keys, record.lstrip("\n").split("\0")))
+                for record in output.split("\x1e") if record.strip()]
+
+    def _commit_tree(self, tree: str, parent: Optional[str], message: str, commit: Optional[dict] = None) -> str:
+        """
+        Create a commit object without touching the branch, with the author and dates of commit if given.
+        """
+        env = None
+        if commit:
+            env = {
+                "GIT_AUTHOR_NAME": commit["author_name"],
+                "GIT_AUTHOR_EMAIL": commit["author_email"],
+                "GIT_AUTHOR_DATE": commit["author_date"],
+                "GIT_COMMITTER_NAME": commit["committer_name"],
+                "GIT_COMMITTER_EMAIL": commit["committer_email"],
+                "GIT_COMMITTER_DATE": commit["committer_date"],
+            }
+        args = ["commit-tree", tree, "-m", message.rstrip("\n")]
+        if parent:
+            args += ["-p", parent]
+        ret, output = self._execute_git(args, env=env)[:2]
+        if ret != 0:
+            raise GitError("Konnte den Verlauf nicht neu schreiben. Bitte Log prüfen.")
+        return output.strip()
+
+    def compact_history(self, before: datetime, bundle_path: str) -> Optional[CompactResult]:
+        """
+        Archive the history before the given time to a bundle and rewrite the current branch:
+        the newest archived commit is replaced by a new root commit with the same tree,
+        the later commits are rewritten onto it (same trees, authors, dates and messages).
+        Only the local branch is changed, see push_rewritten_history_and_unlock().
+
+        Returns:
+            None if there's nothing to archive
+        """
+        self._git_set_author_and_remote()
+        old_head = self.get_commit("HEAD")
+        ret, archived_head = self._execute_git(
+            ["rev-list", "-1", "--first-parent", f"--before={before.isoformat()}", "HEAD"])[:2]
+        archived_head = archived_head.strip()
+        if ret != 0 or not archived_head or self.get_commit(f"{archived_head}^") is None:
+            return None  # no commit before the cutoff or only the root commit
+
+        ret, count = self._execute_git(["rev-list", "--count", archived_head])[:2]
+        archived_commits = int(count.strip()) if ret == 0 else 0
+        self._write_history_bundle(archived_head, bundle_path)
+
+        archived = self._get_first_parent_commits(f"{archived_head}^!")[0]
+        new_root = self._commit_tree(
+            archived["tree"], None,
+            f"Verlauf bis {archived['commit'][:12]} archiviert in {os.path.basename(bundle_path)}",
+            archived
+        )
+        new_head = new_root
+        kept_commits = self._get_first_parent_commits(f"{archived_head}..HEAD")
+        for commit in kept_commits:
+            new_head = self._commit_tree(commit["tree"], new_head, commit["message"], commit)
+
+        branch = self._get_current_branch()
+        ret = self._execute_git(["update-ref", "-m", "compact history", f"refs/heads/{branch}", new_head, old_head])[0]
+        if ret != 0:
+            raise GitError("Konnte den Branch nicht umstellen. Bitte Log prüfen.")
+
+        self._logger.info(f"history compacted: {archived_commits} commits archived, "
+                          f"{len(kept_commits)} commits rewritten onto {new_root}")
+        return CompactResult(
+            old_head=old_head,
+            archived_head=archived_head,
+            new_root=new_root,
+            new_head=new_head,
+            archived_commits=archived_commits,
+            kept_commits=len(kept_commits)
+        )
+
+    def push_rewritten_history_and_unlock(self, expected_remote_head: str):
+        """
+        Replace the branch of the remote repository and delete the lock in a single atomic push.
+        The push is rejected if the remote branch isn't at expected_remote_head anymore.
+        """
+        lock_name = self._get_own_lock_name()
+        held_seconds = self.get_lock_held_seconds()
+        branch = self._get_current_branch()
+
+        journal_head = self._record_lock_event(LOCK_RELEASED, lock_name, held_seconds)
+        ret = self._execute_git(
+            ["push", "--progress", "--atomic", "-u", f"--force-with-lease=refs/heads/{branch}:{expected_remote_head}",
+             "origin", branch, f":refs/tags/{lock_name}"]
+            + self._get_lock_ref_refspecs(lock_name) + self._get_lock_journal_refspecs(), progress=True)[0]
+        if ret != 0:
+            self._reset_lock_journal(journal_head)
+            raise GitError("Konnte nicht pushen!")
+
+        self._set_lock_journal_pushed()
+        self._delete_local_lock(lock_name)
+        self._save_remote_state(lock_names=[], heads=self._get_remote_tracking_heads())
+
+    def push_rewritten_history(self, expected_remote_head: str):
+        """
+        Replace the branch of the remote repository but keep the lock, like push() compared to push_and_unlock().
+        The push is rejected if the remote branch isn't at expected_remote_head anymore. The lock tag still
+        refers to the old history, its objects stay reachable until unlock().
+        """
+        branch = self._get_current_branch()
+        ret = self._execute_git(
+            ["push", "--progress", "-u", f"--force-with-lease=refs/heads/{branch}:{expected_remote_head}",
+             "origin", branch], progress=True)[0]
+        if ret != 0:
+            raise GitError("Konnte nicht pushen!")
+
+        self._save_remote_state(heads=self._get_remote_tracking_heads())
+
+    def adopt_rewritten_history(self, compacted_from: str):
+        """
+        Switch the local branch to the rewritten history of the remote repository (see compact_history()).
+
+        Args:
+            compacted_from: the last commit of the old history, it's contained in the rewritten history
+        Raises:
+            GitError: if the local branch contains commits which aren't part of the rewritten history
+        """
+        if self.get_commit(compacted_from) is None:
+            # compacted_from has never been downloaded: compare with the upstream before the rewrite
+            compacted_from = self.get_commit("@{upstream}@{1}")
+        if compacted_from is None or not self.is_ancestor("HEAD", compacted_from):
+            raise GitError("Es gibt lokale Commits, die im neu geschriebenen Verlauf fehlen. "
+                           "Bitte das Repository neu einrichten.")
+        if self.need_to_commit():
+            raise GitError("Working directory ist nicht clean!")
+        self.delete_local_changes()
+        self.prune_unreachable_objects()
+
+    def prune_unreachable_objects(self):
+        """
+        Delete the objects of the old history after compact_history() or adopt_rewritten_history(),
+        including the reflog entries which still refer to them.
+        """
+        ret = self._execute_git(["reflog", "expire", "--expire=now", "--all"])[0]
+        if ret == 0:
+            ret = self._execute_git(["gc", "--prune=now", "-q"], keep_stdout=False)[0]
+        if ret != 0:
+            self._logger.warning("unable to prune the old history")
+
+    def _list_bundle_heads(self, bundle_path: str) -> Dict[str, str]:
+        """
+        Returns:
+            ref -> object of the bundle
+        """
+        ret, output = self._execute_git(["bundle", "list-heads", bundle_path])[:2]
+        if ret != 0:
+            raise GitError(f"'{bundle_path}' ist kein gültiges Bundle. Bitte Log prüfen.")
+        heads = {}
+        for line in output.splitlines():
+            parts = line.split(" ", 1)
+            if len(parts) == 2:
+                heads[parts[1].strip()] = parts[0]
+        return heads
+
+    def _create_bundle(self, bundle_path: str, refs: List[str], exclude: List[str]) -> Dict[str, str]:
+        """
+        Write the refs to a bundle, without the history of the excluded revisions, and verify it.
+
+        Returns:
+            ref -> object of the bundle
+        """
+        temp_path = f"{bundle_path}.tmp"
+        ret = self._execute_git(["bundle", "create", "-q", temp_path] + refs + [f"^{rev}" for rev in exclude],
+                                keep_stdout=False)[0]
+        if ret != 0:
+            raise GitError("Konnte das Bundle nicht schreiben. Bitte Log prüfen.")
+        heads = self._list_bundle_heads(temp_path)
+        if sorted(heads) != sorted(refs):
+            os.unlink(temp_path)
+            raise GitError("Das Bundle ist unvollständig. Bitte Log prüfen.")
+        os.replace(temp_path, bundle_path)
+        return heads
+
+    def _unbundle(self, bundle_path: str):
+        """
+        Copy the objects of the bundle into the local repository, without creating any refs.
+        """
+        ret = self._execute_git(["bundle", "unbundle", bundle_path])[0]
+        if ret != 0:
+            raise GitError("Das Bundle setzt Commits voraus, die hier fehlen. Bitte Log prüfen.")
+
+    def export_bundle(self, bundle_path: str, release: bool = True) -> BundleInfo:
+        """
+        Write the commits missing in the remote repository together with the own lock to a bundle,
+        for an upload by import_bundle(), ie. on another computer. Like push() or push_and_unlock(),
+        but the lock stays held until the bundle has been applied, see check_exported_bundle().
+
+        Args:
+            release: release the lock when the bundle is applied. Without new commits,
+                the bundle only releases the lock, like unlock().
+        """
+        lock_name = self._get_own_lock_name()
+        if self.need_to_commit():
+            raise GitError("Working directory ist nicht clean!")
+        head = self.get_commit("HEAD")
+        upstream = self.get_commit("@{upstream}")
+        if not release and head == upstream:
+            raise GitError("Keine Änderungen")
+
+        refs = [f"refs/tags/{lock_name}"]
+        if head != upstream:
+            refs.append(f"refs/heads/{self._get_current_branch()}")  # a bundle omits refs without new commits
+        if self._get_lock_ref_refspecs(lock_name):
+            refs.append(_LOCK_REF)
+        if release and self.get_commit(_BUNDLE_EXPORTED_REF) is None:
+            # the lock holder stops working now, the event travels with the bundle
+            self._record_lock_event(LOCK_RELEASED, lock_name, self.get_lock_held_seconds())
+        exclude = [upstream] if upstream else []
+        if self._has_unpushed_lock_journal():
+            refs.append(self._lock_journal_ref)
+            if self.get_commit(self._lock_journal_remote_ref) is not None:
+                exclude.append(self._lock_journal_remote_ref)
+
+        try:
+            if release:
+                refs.append(_BUNDLE_RELEASE_REF)
+                ret = self._execute_git(["update-ref", _BUNDLE_RELEASE_REF, f"refs/tags/{lock_name}"])[0]
+                if ret != 0:
+                    raise GitError("Konnte das Bundle nicht schreiben. Bitte Log prüfen.")
+            self._create_bundle(bundle_path, refs, exclude)
+        finally:
+            self._execute_git(["update-ref", "-d", _BUNDLE_RELEASE_REF])
+
+        self._execute_git(["update-ref", _BUNDLE_EXPORTED_REF, head])
+        return BundleInfo(BUNDLE_UPLOAD, head, [lock_name], release)
+
+    def export_remote_bundle(self, bundle_path: str, since: Optional[str] = None) -> BundleInfo:
+        """
+        Download the state of the remote repository and write it to a bundle,
+        for import_bundle() on a computer without (a sufficient) connection to the remote repository.
+
+        Args:
+            since: a commit the importing repository already has, ie. its '@{upstream}',
+                the bundle only contains the later commits. None: the whole history.
+        """
+        self.fetch()
+        self._fetch_tags()
+        head = self.get_commit("@{upstream}")
+        if head is None:
+            raise GitError("Das Remote Repository ist leer.")
+        if since is not None and self.get_commit(since) is None:
+            raise GitError(f"Commit nicht gefunden: {since}")
+        if since is not None and self.get_commit(since) == head:
+            raise GitError("Keine Änderungen: der Commit ist bereits der aktuelle Stand des Remote Repository.")
+        lock_names = self._get_lock_names()
+
+        try:
+            ret = self._execute_git(["update-ref", _BUNDLE_REMOTE_REF, head])[0]
+            if ret != 0:
+                raise GitError("Konnte das Bundle nicht schreiben. Bitte Log prüfen.")
+            self._create_bundle(bundle_path, [_BUNDLE_REMOTE_REF] + [f"refs/tags/{n}" for n in lock_names],
+                                [since] if since else [])
+        finally:
+            self._execute_git(["update-ref", "-d", _BUNDLE_REMOTE_REF])
+        return BundleInfo(BUNDLE_REMOTE, head, lock_names, False)
+
+    def import_bundle(self, bundle_path: str) -> BundleInfo:
+        """
+        Apply a bundle of export_bundle() to the remote repository or a bundle of export_remote_bundle()
+        to the local repository.
+
+        Raises:
+            IsLockedError: if the lock of an upload bundle isn't held anymore
+        """
+        heads = self._list_bundle_heads(bundle_path)
+        if _BUNDLE_REMOTE_REF in heads:
+            return self._import_remote_bundle(bundle_path, heads)
+        return self._import_upload_bundle(bundle_path, heads)
+
+    def _import_upload_bundle(self, bundle_path: str, heads: Dict[str, str]) -> BundleInfo:
+        """
+        Push the commits of the bundle and release its lock (if requested) in a single atomic push,
+        like push_and_unlock(). The push is rejected if the lock of the bundle isn't held anymore.
+        """
+        lock_names = [ref[len("refs/tags/"):] for ref in heads if ref.startswith("refs/tags/lock")]
+        branch = self._get_current_branch()
+        head = heads.get(f"refs/heads/{branch}")  # None: no new commits, only release the lock
+        release = _BUNDLE_RELEASE_REF in heads
+        if len(lock_names) != 1 or (head is None and not release):
+            raise GitError(f"'{bundle_path}' ist kein Bundle von jverein-multiuser.")
+        lock_name = lock_names[0]
+        lock_tag = heads[f"refs/tags/{lock_name}"]
+
+        journal_refs = [ref for ref in heads if ref.startswith(_LOCK_JOURNAL_PREFIX)]
+        # the bundle requires the current state of the remote repository, including the lock journal
+        self.fetch()
+        if journal_refs:
+            self._fetch_lock_journals()
+        self._unbundle(bundle_path)
+        remote_lock_names = self.get_remote_lock_names()
+        if lock_name not in remote_lock_names:
+            if head is None or self.is_ancestor(head, "@{upstream}"):
+                self._logger.info(f"bundle has been applied before: {bundle_path}")
+                self._finish_exported_bundle(remote_lock_names)
+                return BundleInfo(BUNDLE_UPLOAD, head or self.get_commit("@{upstream}"), lock_names, release,
+                                  applied=False)
+            raise IsLockedError(f"Der Lock des Bundles ist nicht mehr vorhanden: {self._format_lock_name(lock_name)}")
+
+        # the lease fails if the lock tag has been deleted or replaced
+        args = ["push", "--progress", "--atomic", f"--force-with-lease=refs/tags/{lock_name}:{lock_tag}", "origin"]
+        if head is not None:
+            args.append(f"{head}:refs/heads/{branch}")
+        if release:
+            args.append(f":refs/tags/{lock_name}")
+            if _LOCK_REF in heads:
+                args[3:3] = [f"--force-with-lease={_LOCK_REF}:{heads[_LOCK_REF]}"]
+                args.append(f":{_LOCK_REF}")
+        else:
+            args.append(f"{lock_tag}:refs/tags/{lock_name}")  # unchanged, only for the lease
+        # the lock journal of the lock holder, only the holder writes it
+        args += [f"+{heads[ref]}:{ref}" for ref in journal_refs]
+        ret = self._execute_git(args, progress=True)[0]
+        if ret != 0:
+            raise GitError("Konnte das Bundle nicht hochladen. Bitte Log prüfen.")
+
+        if release:
+            remote_lock_names = [n for n in remote_lock_names if n != lock_name]
+            if lock_name in self._get_lock_names() and not self.is_own_lock(lock_name):
+                self._execute_git(["tag", "-d", lock_name])  # like the next pull()
+        self._finish_exported_bundle(remote_lock_names)
+        self._save_remote_state(lock_names=remote_lock_names, heads=self._get_remote_tracking_heads())
+        return BundleInfo(BUNDLE_UPLOAD, head or self.get_commit("@{upstream}"), lock_names, release)
+
+    def _import_remote_bundle(self, bundle_path: str, heads: Dict[str, str]) -> BundleInfo:
+        """
+        Update the remote-tracking branch and the lock tags from the bundle, like pull().
+        The local branch is only updated if it isn't locked by me.
+        """
+        head = heads[_BUNDLE_REMOTE_REF]
+        lock_names = [ref[len("refs/tags/"):] for ref in heads if ref.startswith("refs/tags/lock")]
+        self._unbundle(bundle_path)
+
+        branch = self._get_current_branch()
+        upstream = self.get_commit("@{upstream}")
+        if upstream is not None and not self.is_ancestor(upstream, head):
+            raise GitError("Das Bundle ist älter als der zuletzt heruntergeladene Stand.")
+        ret = self._execute_git(
+            ["update-ref", "-m", f"import {os.path.basename(bundle_path)}", f"refs/remotes/origin/{branch}", head])[0]
+        if ret != 0:
+            raise GitError("Konnte das Bundle nicht übernehmen. Bitte Log prüfen.")
+
+        for lock_name in self._get_lock_names():
+            if lock_name not in lock_names and not self.is_own_lock(lock_name):
+                self._execute_git(["tag", "-d", lock_name])
+        for lock_name in lock_names:
+            self._execute_git(["update-ref", f"refs/tags/{lock_name}", heads[f"refs/tags/{lock_name}"]])
+        # the own lock is only released by the remote repository if an exported bundle has been applied,
+        # it might have been acquired after the remote bundle has been written
+        self._finish_exported_bundle(lock_names)
+
+        if not self.is_locked_by_me() and not self.need_to_commit():
+            ret = self._execute_git(["merge", "--ff-only", "@{upstream}"], keep_stdout=False)[0]
+            if ret != 0:
+                raise GitError("Konnte nicht updaten. Bitte Log prüfen.")
+        return BundleInfo(BUNDLE_REMOTE, head, lock_names, False)
+
+    def has_exported_bundle(self) -> bool:
+        """
+        Returns:
+            True if an upload bundle has been exported, but not been applied to the remote repository yet
+        """
+        return self.get_commit(_BUNDLE_EXPORTED_REF) is not None
+
+    def _finish_exported_bundle(self, remote_lock_names: List[str]) -> bool:
+        """
+        Forget the exported upload bundle if the remote-tracking branch contains it,
+        and delete the own lock if it has been released by the bundle.
+
+        Args:
+            remote_lock_names: the lock tags of the remote repository
+        Returns:
+            True if the exported bundle has been applied
+        """
+        exported = self.get_commit(_BUNDLE_EXPORTED_REF)
+        upstream = self.get_commit("@{upstream}")
+        if exported is None or upstream is None or not self.is_ancestor(exported, upstream):
+            return False
+        for lock_name in self._get_lock_names():
+            if self.is_own_lock(lock_name) and lock_name not in remote_lock_names:
+                self._delete_local_lock(lock_name)
+        self._execute_git(["update-ref", "-d", _BUNDLE_EXPORTED_REF])
+        return True
+
+    def check_exported_bundle(self) -> bool:
+        """
+        Ask the remote repository whether the exported upload bundle has been applied in the meantime,
+        ie. on another computer, see has_exported_bundle().
+
+        Returns:
+            True if it has been applied
+        """
+        remote_lock_names = self.get_remote_lock_names()
+        self.fetch()
+        return self._finish_exported_bundle(remote_lock_names)
 
     def delete_local_changes(self):
-        ret = self._execute_git(["reset", "--hard", "@{upstream}"])[0]
+        ret = self._execute_git(["reset", "--hard", "@{upstream}"], keep_stdout=False)[0]
         if ret != 0:
             raise GitError("Konnte nicht Git auf den letzten Commit resetten.")
 
-        ret = self._execute_git(["clean", "-d", "-f"])[0]
+        ret = self._execute_git(["clean", "-d", "-f"], keep_stdout=False)[0]
         if ret != 0:
             raise GitError("Konnte nicht Git cleanen.")
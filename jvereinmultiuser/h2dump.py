@@ -0,0 +1,416 @@
+"""
+Streaming reader for SQL dumps created by H2's Script tool (ie. jameica/jverein/h2db/jverein.sql).
+
+Only 'CREATE TABLE' and 'INSERT INTO ... VALUES' statements are evaluated, all other statements are skipped.
+LOBs are written by Script in parts to the temporary table SYSTEM_LOB_STREAM in front of the INSERT statement
+using them, the value is 'SYSTEM_COMBINE_CLOB(<id>)' or 'SYSTEM_COMBINE_BLOB(<id>)'.
+The dump is read line by line and every row is yielded as soon as it is parsed, so the memory usage
+doesn't depend on the size of the dump.
+
+    for row in read_table("jverein.sql", "MITGLIED"):
+        ...
+"""
+import re
+import datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, TextIO, Tuple
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<comment>--[^\n]*)
+    |(?P<string>'(?:[^']|'')*'(?!'))
+    |(?P<quoted>"(?:[^"]|"")*")
+    |(?P<incomplete>['"])
+    |(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+    |(?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<symbol>.)
+""", re.VERBOSE | re.DOTALL)
+
+# http://www.h2database.com/html/functions.html#stringdecode
+_JAVA_ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|[0-7]{1,3}|.)", re.DOTALL)
+_JAVA_ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f"}
+
+_FLOAT_TYPES = {"DOUBLE", "FLOAT", "REAL", "FLOAT4", "FLOAT8"}
+_DECIMAL_TYPES = {"DECIMAL", "NUMERIC", "DEC", "NUMBER"}
+_CONSTRAINT_KEYWORDS = {"CONSTRAINT", "PRIMARY", "UNIQUE", "FOREIGN", "CHECK"}
+
+# temporary table with the parts of the LOBs (ID, PART, CDATA, BDATA) and the functions combining them
+_LOB_TABLE = "SYSTEM_LOB_STREAM"
+_COMBINE_CLOB = "SYSTEM_COMBINE_CLOB"
+_COMBINE_BLOB = "SYSTEM_COMBINE_BLOB"
+
+# Script writes the row count in front of the INSERT statements of every table
+_ROW_COUNT_RE = re.compile(r"^-- (?P<count>\d+) \+/- SELECT COUNT\(\*\) FROM (?P<table>[^;]+);")
+
+
+class H2DumpError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super(H2DumpError, self).__init__(self.message)
+
+
+class Table(NamedTuple):
+    name: str
+    columns: List[str]
+    types: List[str]
+
+
+def _tokenize(f: TextIO) -> Iterator[Tuple[str, str]]:
+    pending = ""
+    for line in f:
+        text = pending + line
+        pending = ""
+        pos = 0
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            kind = match.lastgroup
+            if kind == "incomplete":
+                # string literal continues on the next line
+                pending = text[pos:]
+                break
+            pos = match.end()
+            if kind not in ("space", "comment"):
+                yield kind, match.group()
+    if pending:
+        raise H2DumpError(f"Unvollständiger String im Dump: {pending[:40]!r}")
+
+
+class _Parser:
+    def __init__(self, tokens: Iterator[Tuple[str, str]]):
+        self._tokens = tokens
+        self._lookahead = None  # type: Optional[Tuple[str, str]]
+
+    def peek(self) -> Optional[Tuple[str, str]]:
+        if self._lookahead is None:
+            self._lookahead = next(self._tokens, None)
+        return self._lookahead
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise H2DumpError("Unerwartetes Ende des Dumps")
+        self._lookahead = None
+        return token
+
+    def next_is(self, *values: str) -> bool:
+        token = self.peek()
+        return token is not None and token[0] in ("word", "symbol") and token[1].upper() in values
+
+    def expect(self, value: str):
+        kind, text = self.next()
+        if text.upper() != value:
+            raise H2DumpError(f"'{value}' erwartet, '{text}' gefunden")
+
+    def skip_statement(self):
+        depth = 0
+        while self.peek() is not None:
+            kind, text = self.next()
+            if kind != "symbol":
+                continue
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+            elif text == ";" and depth <= 0:
+                return
+
+    def skip_parentheses(self):
+        """Skip tokens up to and including the ')' matching an already consumed '('."""
+        depth = 1
+        while depth > 0:
+            kind, text = self.next()
+            if kind == "symbol" and text == "(":
+                depth += 1
+            elif kind == "symbol" and text == ")":
+                depth -= 1
+
+    def identifier(self) -> str:
+        """
+        Returns:
+            The name of a (possibly schema qualified) identifier without schema
+        """
+        name = self._single_identifier()
+        while self.next_is("."):
+            self.next()
+            name = self._single_identifier()
+        return name
+
+    def _single_identifier(self) -> str:
+        kind, text = self.next()
+        if kind == "quoted":
+            return text[1:-1].replace('""', '"')
+        if kind == "word":
+            return text.upper()
+        raise H2DumpError(f"Bezeichner erwartet, '{text}' gefunden")
+
+
+def _java_decode(s: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == "u" and len(escape) == 5:
+            return chr(int(escape[1:], 16))
+        if escape[0] in "01234567":
+            return chr(int(escape, 8))
+        return _JAVA_ESCAPES.get(escape, escape)
+
+    decoded = _JAVA_ESCAPE_RE.sub(replace, s)
+    # characters outside the BMP are encoded as surrogate pairs
+    return decoded.encode("utf-16", "surrogatepass").decode("utf-16")
+
+
+def _unquote(s: str) -> str:
+    return s[1:-1].replace("''", "'")
+
+
+def _parse_time(s: str) -> datetime.time:
+    time_part, _, fraction = s.partition(".")
+    hour, minute, second = (int(part) for part in time_part.split(":"))
+    return datetime.time(hour, minute, second, int(fraction[:6].ljust(6, "0")) if fraction else 0)
+
+
+def _parse_timestamp(s: str) -> datetime.datetime:
+    date_part, _, time_part = s.strip().partition(" ")
+    date = datetime.date.fromisoformat(date_part)
+    if not time_part:
+        return datetime.datetime.combine(date, datetime.time())
+    return datetime.datetime.combine(date, _parse_time(time_part))
+
+
+def _parse_number(text: str, column_type: str):
+    if column_type in _FLOAT_TYPES:
+        return float(text)
+    if column_type in _DECIMAL_TYPES:
+        return Decimal(text)
+    if "e" in text or "E" in text:
+        return float(text)
+    if "." in text:
+        return Decimal(text)
+    return int(text)
+
+
+def _parse_lob(parser: _Parser, function: str, lobs: Dict[int, List[Tuple[int, Any]]]) -> Any:
+    parser.expect("(")
+    lob_id = int(parser.next()[1])
+    parser.expect(")")
+    parts = [data for _, data in sorted(lobs.pop(lob_id, []), key=lambda part: part[0])]  # no parts: empty
+    if function == _COMBINE_CLOB:
+        return "".join(parts)
+    return b"".join(bytes.fromhex(data) if isinstance(data, str) else data for data in parts)
+
+
+def _parse_value(parser: _Parser, column_type: str, lobs: Dict[int, List[Tuple[int, Any]]]) -> Any:
+    kind, text = parser.next()
+    if kind == "string":
+        return _unquote(text)
+    if kind == "number":
+        return _parse_number(text, column_type)
+    if kind == "symbol" and text == "-":
+        return -_parse_number(parser.next()[1], column_type)
+    if kind != "word":
+        raise H2DumpError(f"Wert erwartet, '{text}' gefunden")
+
+    word = text.upper()
+    if word == "NULL":
+        return None
+    if word in ("TRUE", "FALSE"):
+        return word == "TRUE"
+    if word == "STRINGDECODE":
+        parser.expect("(")
+        value = _java_decode(_unquote(parser.next()[1]))
+        parser.expect(")")
+        return value
+    if word == "X":
+        return bytes.fromhex(_unquote(parser.next()[1]))
+    if word in (_COMBINE_CLOB, _COMBINE_BLOB):
+        return _parse_lob(parser, word, lobs)
+    if word in ("DATE", "TIME", "TIMESTAMP"):
+        if parser.next_is("WITH"):
+            # ie. TIMESTAMP WITH TIME ZONE '2020-01-01 10:00:00+01': keep the literal
+            for _ in range(3):
+                parser.next()
+            return _unquote(parser.next()[1])
+        literal = _unquote(parser.next()[1])
+        if word == "DATE":
+            return datetime.date.fromisoformat(literal)
+        if word == "TIME":
+            return _parse_time(literal)
+        return _parse_timestamp(literal)
+    raise H2DumpError(f"Nicht unterstützter Wert: '{text}'")
+
+
+def _parse_create_table(parser: _Parser) -> Optional[Table]:
+    # CREATE [CACHED | MEMORY] [LOCAL | GLOBAL TEMPORARY] TABLE [IF NOT EXISTS] name(...)
+    while not parser.next_is("TABLE"):
+        if parser.peek() is None or parser.next_is("(", ";"):
+            return None  # not a table, ie. CREATE SEQUENCE
+        parser.next()
+    parser.next()
+    if parser.next_is("IF"):
+        for _ in range(3):
+            parser.next()
+    name = parser.identifier()
+    parser.expect("(")
+
+    columns = []
+    types = []
+    while True:
+        if parser.next_is(*_CONSTRAINT_KEYWORDS):
+            column = None
+        else:
+            column = parser.identifier()
+            columns.append(column)
+            types.append(parser.next()[1].upper())
+        # skip the rest of the column definition
+        while not parser.next_is(",", ")"):
+            kind, text = parser.next()
+            if kind == "symbol" and text == "(":
+                parser.skip_parentheses()
+        if parser.next()[1] == ")":
+            break
+    parser.skip_statement()
+    return Table(name, columns, types)
+
+
+def _parse_rows(parser: _Parser,
+                table: Table,
+                lobs: Dict[int, List[Tuple[int, Any]]]) -> Iterator[tuple]:
+    """
+    Parse the rest of an INSERT statement after the table name.
+    """
+    positions = list(range(len(table.columns)))
+    if parser.next_is("("):
+        parser.next()
+        positions = []
+        while True:
+            positions.append(table.columns.index(parser.identifier()))
+            if parser.next()[1] == ")":
+                break
+    parser.expect("VALUES")
+
+    while True:
+        parser.expect("(")
+        row = [None] * len(table.columns)  # type: List[Any]
+        for i, position in enumerate(positions):
+            if i > 0:
+                parser.expect(",")
+            row[position] = _parse_value(parser, table.types[position], lobs)
+        parser.expect(")")
+        yield tuple(row)
+        kind, text = parser.next()
+        if text == ";":
+            return
+        if text != ",":
+            raise H2DumpError(f"',' oder ';' erwartet, '{text}' gefunden")
+
+
+def _parse_insert(parser: _Parser,
+                  tables: Dict[str, Table],
+                  wanted: Optional[Set[str]],
+                  lobs: Dict[int, List[Tuple[int, Any]]]) -> Iterator[Tuple[Table, tuple]]:
+    """
+    Args:
+        lobs: LOB id -> (part, data), the LOBs written in front of the INSERT statement
+    """
+    parser.expect("INTO")
+    name = parser.identifier()
+    if name == _LOB_TABLE and name in tables:
+        if wanted is not None and not wanted:
+            parser.skip_statement()  # no rows at all are needed
+            return
+        for lob_id, part, cdata, bdata in _parse_rows(parser, tables[name], lobs):
+            lobs.setdefault(lob_id, []).append((part, cdata if cdata is not None else bdata))
+        return
+
+    try:
+        if wanted is not None and name.upper() not in wanted:
+            # the values aren't evaluated at all
+            parser.skip_statement()
+            return
+        table = tables.get(name)
+        if table is None:
+            raise H2DumpError(f"INSERT in unbekannte Tabelle '{name}'")
+        for row in _parse_rows(parser, table, lobs):
+            yield table, row
+    finally:
+        lobs.clear()  # the LOBs of this statement, they aren't used by the following ones
+
+
+def _read_dump(sql_path: str, wanted: Optional[Set[str]]) -> Iterator[Tuple[Table, Optional[tuple]]]:
+    """
+    Returns:
+        Iterator of (table, None) for every CREATE TABLE statement and (table, row) for every row
+    """
+    tables = {}  # type: Dict[str, Table]
+    lobs = {}  # type: Dict[int, List[Tuple[int, Any]]]
+    with open(sql_path, encoding="utf-8") as f:
+        parser = _Parser(_tokenize(f))
+        while parser.peek() is not None:
+            if parser.next_is("CREATE"):
+                parser.next()
+                table = _parse_create_table(parser)
+                if table is None:
+                    parser.skip_statement()
+                else:
+                    tables[table.name] = table
+                    if table.name != _LOB_TABLE:
+                        yield table, None
+            elif parser.next_is("INSERT"):
+                parser.next()
+                yield from _parse_insert(parser, tables, wanted, lobs)
+            else:
+                parser.skip_statement()
+
+
+def iter_rows(sql_path: str, table_names: Optional[Iterable[str]] = None) -> Iterator[Tuple[Table, tuple]]:
+    """
+    Args:
+        sql_path: path of the dump
+        table_names: only yield rows of these tables (case insensitive), default: all tables
+    Returns:
+        Iterator of (table, row), the values of a row are in the order of table.columns
+    Raises:
+        H2DumpError: if the dump can't be parsed
+    """
+    wanted = {name.upper() for name in table_names} if table_names is not None else None
+    for table, row in _read_dump(sql_path, wanted):
+        if row is not None:
+            yield table, row
+
+
+def read_table(sql_path: str, table_name: str) -> Iterator[tuple]:
+    """
+    Args:
+        sql_path: path of the dump
+        table_name: name of the table without schema, ie. 'MITGLIED' (case insensitive)
+    Returns:
+        Iterator of the rows of the table, the values are in the order of the CREATE TABLE statement
+    """
+    for _, row in iter_rows(sql_path, [table_name]):
+        yield row
+
+
+def read_tables(sql_path: str) -> List[Table]:
+    """
+    Returns:
+        All tables of the dump, including empty tables
+    """
+    return [table for table, row in _read_dump(sql_path, wanted=set()) if row is None]
+
+
+def count_rows(sql_path: str) -> Dict[str, int]:
+    """
+    Read the row counts from the comments written by H2's Script tool, without parsing the statements.
+
+    Returns:
+        Number of rows by table name without schema, tables without rows are missing
+    """
+    counts = {}
+    with open(sql_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("-- "):
+                continue
+            match = _ROW_COUNT_RE.match(line)
+            if match:
+                table = match.group("table").strip().split(".")[-1].strip("\"")
+                counts[table] = counts.get(table, 0) + int(match.group("count"))
+    return counts
@@ -1,8 +1,15 @@
 import os
 import sys
+import time
+import logging
 import pkgutil
-import subprocess
-from typing import Type
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Type
+import jvereinmultiuser.process as process
+
+# maximum runtime of a hook script in seconds
+DEFAULT_TIMEOUT = 600.0
 
 
 class GenericHook:
@@ -12,6 +19,27 @@ class GenericHook:
     win_script = None
 
 
+class PreLockHook(GenericHook):
+    name = "pre_lock"
+    linux_script = "linux_pre_lock.sh"
+    macos_script = "macos_pre_lock.sh"
+    win_script = "win_pre_lock.bat"
+
+
+class PostSetupHook(GenericHook):
+    name = "post_setup"
+    linux_script = "linux_post_setup.sh"
+    macos_script = "macos_post_setup.sh"
+    win_script = "win_post_setup.bat"
+
+
+class PostTeardownHook(GenericHook):
+    name = "post_teardown"
+    linux_script = "linux_post_teardown.sh"
+    macos_script = "macos_post_teardown.sh"
+    win_script = "win_post_teardown.bat"
+
+
 class PostUploadHook(GenericHook):
     name = "post_upload"
     linux_script = "linux_post_upload.sh"
@@ -19,15 +47,37 @@ class PostUploadHook(GenericHook):
     win_script = "win_post_upload.bat"
 
 
-_ALL_HOOKS = [PostUploadHook]
+class PostUnlockHook(GenericHook):
+    name = "post_unlock"
+    linux_script = "linux_post_unlock.sh"
+    macos_script = "macos_post_unlock.sh"
+    win_script = "win_post_unlock.bat"
+
+
+_ALL_HOOKS = [PreLockHook, PostSetupHook, PostTeardownHook, PostUploadHook, PostUnlockHook]
+
+
+class HookResult(NamedTuple):
+    script_path: str
+    returncode: Optional[int]  # None: killed after timeout
+    duration: float  # seconds
+    output: str  # last lines of stdout and stderr
 
 
 class HookExecutionError(Exception):
-    def __init__(self, message: str):
+    def __init__(self, message: str, results: Optional[List[HookResult]] = None):
         self.message = message
+        self.results = results if results else []
         super(HookExecutionError, self).__init__(self.message)
 
 
+def get_hook(name: str) -> Type[GenericHook]:
+    for hook in _ALL_HOOKS:
+        if hook.name == name:
+            return hook
+    raise ValueError(f"unknown hook: {name}")
+
+
 def _create_example_file_name(script_name):
     parts = script_name.split(".")
     parts.insert(-1, "example")
@@ -50,23 +100,82 @@ def create_example_files_if_necessary(local_repo_dir):
                 os.chmod(dst_script_path, 0o764)
 
 
-def run_hook(hook: Type[GenericHook], local_repo_dir: str):
+def _get_script_name(hook: Type[GenericHook]) -> str:
     if sys.platform.startswith("win32") or sys.platform.startswith("cygwin"):  # Windows
-        script_name = hook.win_script
+        return hook.win_script
     elif sys.platform.startswith("darwin"):  # macOS
-        script_name = hook.macos_script
+        return hook.macos_script
     else:  # Linux
-        script_name = hook.linux_script
-    script_path = os.path.join(local_repo_dir, "hooks", script_name)
+        return hook.linux_script
 
-    if not os.path.isfile(script_path):
-        return  # ignore non-existing hook
 
-    if not os.access(script_path, os.X_OK):
-        raise HookExecutionError(message=f"nicht ausführbar: '{script_path}'")
+def get_hook_scripts(hook: Type[GenericHook], local_repo_dir: str) -> List[str]:
+    """
+    Returns:
+        The paths of the hook script (ie. hooks/linux_post_upload.sh)
+        and of all scripts in the hook's directory (ie. hooks/linux_post_upload.d/)
+    """
+    script_name = _get_script_name(hook)
+    script_path = os.path.join(local_repo_dir, "hooks", script_name)
+    script_paths = [script_path] if os.path.isfile(script_path) else []
+
+    scripts_dir = os.path.join(local_repo_dir, "hooks", f"{os.path.splitext(script_name)[0]}.d")
+    if os.path.isdir(scripts_dir):
+        for file_name in sorted(os.listdir(scripts_dir)):
+            path = os.path.join(scripts_dir, file_name)
+            if os.path.isfile(path) and not file_name.startswith(".") and ".example." not in file_name:
+                script_paths.append(path)
+    return script_paths
+
+
+def _run_script(script_path: str, timeout: Optional[float]) -> HookResult:
+    start = time.monotonic()
+    result = process.run([script_path], logging.getLogger(__name__), timeout=timeout)
+    return HookResult(
+        script_path=script_path,
+        returncode=None if result.timed_out else result.returncode,
+        duration=time.monotonic() - start,
+        output="\n".join(output for output in (result.stdout, result.stderr) if output)
+    )
+
+
+def run_hook(hook: Type[GenericHook], local_repo_dir: str, timeout: Optional[float] = DEFAULT_TIMEOUT) -> List[HookResult]:
+    """
+    Run all scripts of the hook concurrently and wait for them to finish.
+
+    Args:
+        timeout: maximum runtime of each script in seconds, None: no limit
+    Raises:
+        HookExecutionError: if a script isn't executable, fails or times out
+            (the other scripts are executed nevertheless)
+    """
+    script_paths = get_hook_scripts(hook, local_repo_dir)
+    if not script_paths:
+        return []  # ignore non-existing hook
+
+    for script_path in script_paths:
+        if not os.access(script_path, os.X_OK):
+            raise HookExecutionError(message=f"nicht ausführbar: '{script_path}'")
 
     print(f"Führe Hook aus: {hook.name}")
-    proc = subprocess.run(script_path)
-    if proc.returncode != 0:
-        raise HookExecutionError(message=f"returncode {proc.returncode}")
-
+    with ThreadPoolExecutor(max_workers=len(script_paths)) as executor:
+        results = list(executor.map(lambda path: _run_script(path, timeout), script_paths))
+
+    errors = []
+    for result in results:
+        script_name = os.path.relpath(result.script_path, os.path.join(local_repo_dir, "hooks"))
+        if result.returncode is None:
+            status = f"Zeitüberschreitung nach {timeout:.0f} s"
+        elif result.returncode != 0:
+            status = f"returncode {result.returncode}"
+        else:
+            status = "OK"
+        print(f"    {script_name}: {status} ({result.duration:.1f} s)")
+        if result.output:
+            print(textwrap.indent(result.output, "        "))
+        if status != "OK":
+            errors.append(f"{script_name}: {status}")
+
+    if errors:
+        raise HookExecutionError(message=", ".join(errors), results=results)
+    return results
@@ -1,29 +1,19 @@
 import os
-import jks
 import sys
+import json
 import time
 import base64
+import hashlib
 import logging
 import textwrap
 import traceback
 import subprocess
 from time import sleep
-from Crypto.PublicKey import RSA
 import xml.etree.ElementTree as ET
-from typing import Dict, Optional, List
-from tempfile import NamedTemporaryFile
-
-# Attention!
-# Jameica uses raw RSA encryption without padding (textbook RSA).
-# pyca/cryptography doesn't support that:
-# https://github.com/pyca/cryptography/issues/3604
-# PyCyptodome also doesn't seem to support that (removed 'decrypt()'):
-# https://pycryptodome.readthedocs.io/en/latest/src/vs_pycrypto.html
-# -> so we need to use legacy PyCrypto
-
-# monkey-patch for PyCrypto & Python 3.8,
-# see https://github.com/dlitz/pycrypto/issues/283
-time.clock = time.process_time
+from typing import Dict, Optional, List, NamedTuple, Set
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+import jvereinmultiuser.process as process
+import jvereinmultiuser.h2dump as h2dump
 
 _USER_PROPERTIES_TEMPLATE = {
     "cfg/de.jost_net.JVerein.gui.action.FreiesFormularAction.properties": {
@@ -128,6 +118,80 @@ DEFAULT_PLUGIN_XML_PATH = _DEFAULT_PATHS[platform]["PLUGIN_XML"]
 DEFAULT_JAVA_PATH = _DEFAULT_PATHS[platform]["JAVA"]
 DEFAULT_H2_DIR = _DEFAULT_PATHS[platform]["H2_DIR"]
 
+# path of the jverein database dump, relative to the repository
+JVEREIN_DUMP_PATH = "jameica/jverein/h2db/jverein.sql"
+
+# http://www.h2database.com/html/grammar.html#csv_options, escaped like STRINGDECODE
+DEFAULT_CSV_OPTIONS = r"charset=UTF-8 lineSeparator=\n null= writeColumnHeader=false"
+
+
+class CsvExport(NamedTuple):
+    """
+    A CSV file written by H2's CSVWRITE from the jverein database
+
+    http://www.h2database.com/html/functions.html#csvwrite
+    http://www.h2database.com/html/grammar.html#csv_options
+    """
+    name: str
+    file: str  # file name in the dump directory
+    sql: str
+    options: str = DEFAULT_CSV_OPTIONS
+
+
+DEFAULT_EXPORTS = [
+    # Made for use with mailman's sync_members
+    # http://manpages.org/sync_members/8
+    CsvExport(
+        name="mitglieder-emails",
+        file="mitglieder-emails.csv",
+        sql=textwrap.dedent("""
+            SELECT LOWER(email) FROM mitglied
+                WHERE eintritt <= CURDATE()
+                    AND (austritt IS NULL OR austritt >= CURDATE())
+                ORDER BY LOWER(email)
+        """).strip(),
+        options=r'charset=UTF-8 escape=\" fieldDelimiter= lineSeparator=\n null= writeColumnHeader=false'
+    ),
+    # Made for use with custom sync members script
+    CsvExport(
+        name="mitglieder-emails-austritt",
+        file="mitglieder-emails-austritt.csv",
+        sql=textwrap.dedent("""
+            SELECT id, externemitgliedsnummer, LOWER(email), austritt FROM mitglied
+                WHERE eintritt <= CURDATE()
+                    AND (austritt IS NULL OR austritt >= CURDATE())
+                ORDER BY LOWER(email)
+        """).strip(),
+    ),
+]
+
+
+# class data sharing archives created at exit (-XX:ArchiveClassesAtExit) need Java 13 or later
+_CDS_MIN_JAVA_VERSION = 13
+
+
+class H2RestoreProfile(NamedTuple):
+    """
+    Settings for replaying a database dump with RunScript
+
+    http://www.h2database.com/html/performance.html#fast_import
+    """
+    url_options: str  # appended to the database URL, ie. ';LOG=0'
+    cache_size: Optional[int] = None  # cache size in KB, None: H2's default
+
+
+# LOG and UNDO_LOG aren't persisted and the cache size is only set for the RunScript JVM
+# (h2.cacheSizeDefault), so Jameica opens the restored database with its normal settings.
+# LOCK_MODE=0 is omitted on purpose, it would be persisted in the database.
+BULK_LOAD_RESTORE_PROFILE = H2RestoreProfile(url_options=";LOG=0;UNDO_LOG=0", cache_size=128 * 1024)
+PLAIN_RESTORE_PROFILE = H2RestoreProfile(url_options="")
+
+
+class DumpStats(NamedTuple):
+    database: str  # ie. 'jverein'
+    bytes: int
+    rows: int
+
 
 class JameicaVersionDiffersError(Exception):
     """ The current Jameica version is different than the expected one """
@@ -150,7 +214,18 @@ class JVereinManager:
                  jameica_exec_path: Optional[str] = None,
                  plugin_xml_path: Optional[str] = None,
                  java_path: Optional[str] = None,
-                 h2_jar_dir: Optional[str] = None):
+                 h2_jar_dir: Optional[str] = None,
+                 exports: Optional[List[CsvExport]] = None,
+                 restore_profile: H2RestoreProfile = BULK_LOAD_RESTORE_PROFILE,
+                 cds_dir: Optional[str] = None,
+                 teardown_journal_path: Optional[str] = None):
+        """
+        Args:
+            cds_dir: Directory for the class data sharing archive of the H2 tools, which speeds up
+                the start of the JVM. The archive is created by the first H2 invocation. None: no archive
+            teardown_journal_path: File recording the finished steps of teardown(), so an interrupted
+                teardown can be resumed. Must be outside of the repository. None: no journal
+        """
 
         self._logger = logging.getLogger(__name__)
 
@@ -170,6 +245,10 @@ class JVereinManager:
         self._jameica_dir = os.path.join(self._local_repo_dir, "jameica")
         self._dump_dir = os.path.join(self._local_repo_dir, "dump")
         self._keystore_path = os.path.join(self._jameica_dir, "cfg", "jameica.keystore")
+        self.exports = exports if exports is not None else list(DEFAULT_EXPORTS)
+        self.restore_profile = restore_profile
+        self._cds_dir = os.path.expanduser(cds_dir) if cds_dir else None
+        self._teardown_journal_path = teardown_journal_path
 
         self._databases = []
 
@@ -184,6 +263,57 @@ class JVereinManager:
                 return os.path.join(h2_dir, filename)
         return ""
 
+    def _get_java_version(self) -> Optional[str]:
+        """
+        Returns:
+            The version of the Java runtime from its 'release' file, ie. '17.0.2', None if unknown
+        """
+        release_path = os.path.join(os.path.dirname(os.path.dirname(self._java_path)), "release")
+        if not os.path.exists(release_path):
+            return None
+        props = self._load_properties_file(release_path)
+        return props.get("JAVA_VERSION") or None
+
+    def _get_cds_options(self) -> List[str]:
+        """
+        Returns:
+            The JVM options to use the class data sharing archive of the H2 jar and the Java runtime,
+            or to create it at exit if it doesn't exist yet
+        """
+        if not self._cds_dir or not self._h2_jar_path:
+            return []
+
+        java_version = self._get_java_version()
+        if java_version is None:
+            return []
+        major_version = java_version.split(".")[1] if java_version.startswith("1.") else java_version.split(".")[0]
+        if not major_version.isdigit() or int(major_version) < _CDS_MIN_JAVA_VERSION:
+            return []
+
+        # the archive is only valid for exactly this jar and Java runtime
+        jar_stat = os.stat(self._h2_jar_path)
+        jar_id = f"{os.path.abspath(self._h2_jar_path)}:{jar_stat.st_size}:{jar_stat.st_mtime_ns}"
+        archive_name = f"h2-{hashlib.sha1(jar_id.encode()).hexdigest()[:12]}-java{java_version}.jsa"
+        archive_path = os.path.join(self._cds_dir, archive_name)
+        if os.path.exists(archive_path):
+            return [f"-XX:SharedArchiveFile={archive_path}"]
+
+        os.makedirs(self._cds_dir, exist_ok=True)
+        for file_name in os.listdir(self._cds_dir):
+            if file_name.endswith(".jsa"):
+                self._logger.info(f"deleting outdated class data sharing archive '{file_name}'")
+                os.unlink(os.path.join(self._cds_dir, file_name))
+        return [f"-XX:ArchiveClassesAtExit={archive_path}"]
+
+    def _get_h2_command(self, tool: str, java_options: Optional[List[str]] = None) -> List[str]:
+        """
+        Args:
+            tool: main class, ie. 'org.h2.tools.RunScript'
+            java_options: additional JVM options, ie. system properties
+        """
+        java_options = java_options if java_options else []
+        return [self._java_path] + self._get_cds_options() + java_options + ["-cp", self._h2_jar_path, tool]
+
     def _insert_user_properties_into_properties_files(self):
         """
         Replace user specific values in the .properties files with
@@ -241,6 +371,23 @@ class JVereinManager:
         self.user_properties = new_user_properties
 
     def _decrypt_passphrase(self, encrypted_base64_passphrase: str, keystore_password: str) -> str:
+        # imported here: they're slow to import and only needed for the encrypted databases
+
+        # Attention!
+        # Jameica uses raw RSA encryption without padding (textbook RSA).
+        # pyca/cryptography doesn't support that:
+        # https://github.com/pyca/cryptography/issues/3604
+        # PyCyptodome also doesn't seem to support that (removed 'decrypt()'):
+        # https://pycryptodome.readthedocs.io/en/latest/src/vs_pycrypto.html
+        # -> so we need to use legacy PyCrypto
+
+        # monkey-patch for PyCrypto & Python 3.8,
+        # see https://github.com/dlitz/pycrypto/issues/283
+        time.clock = time.process_time
+
+        import jks
+        from Crypto.PublicKey import RSA
+
         encrypted_bytes = base64.b64decode(encrypted_base64_passphrase.encode('ascii'))
 
         try:
@@ -320,12 +467,15 @@ class JVereinManager:
         passphrase = self._decrypt_passphrase(encrypted_passphrase, master_password)
         self._databases.append((f"{db_path}", ";CIPHER=XTEA", username, passphrase))
 
-    def _register_all_databases(self, master_password: str):
+    def _register_jverein_database(self):
         self._register_database(
             db_path=os.path.join(self._jameica_dir, "jverein", "h2db", "jverein"),
             username="jverein",
             passphrase="jverein"
         )
+
+    def _register_all_databases(self, master_password: str):
+        self._register_jverein_database()
         self._register_encrypted_database(
             db_path=os.path.join(self._jameica_dir, "hibiscus", "h2db", "hibiscus"),
             username="hibiscus",
@@ -366,10 +516,7 @@ class JVereinManager:
         # http://h2database.com/html/tutorial.html#upgrade_backup_restore
 
         sql_file_path = f"{db_path}.sql"
-        ret, stdout, stderr = self._execute_subprocess([
-            self._java_path,
-            "-cp", self._h2_jar_path,
-            "org.h2.tools.Script",
+        ret, stdout, stderr = self._execute_subprocess(self._get_h2_command("org.h2.tools.Script") + [
             "-url", f"jdbc:h2:{db_path}{db_options}",
             "-user", username,
             "-password", passphrase,
@@ -382,22 +529,8 @@ class JVereinManager:
         os.unlink(full_db_path)
 
     def _execute_subprocess(self, args: List[str], cwd: Optional[str] = None, ignore_err: Optional[str] = None):
-        self._logger.info(f"executing: '{' '.join(args)}'")
-
-        proc = subprocess.run(args, capture_output=True, cwd=cwd)
-        stdout_str = proc.stdout.decode()
-        stderr_str = proc.stderr.decode()
-
-        ret = proc.returncode
-        if ignore_err and ignore_err in stderr_str:
-            ret = 0
-
-        log_level = logging.INFO if ret == 0 else logging.ERROR
-        self._logger.log(log_level, f"RETURNCODE: {proc.returncode}")
-        self._logger.log(log_level, f"STDOUT: {stdout_str}")
-        self._logger.log(log_level, f"STDERR: {stderr_str}")
-
-        return ret, stdout_str, stderr_str
+        result = process.run(args, self._logger, cwd=cwd, ignore_err=ignore_err)
+        return result.returncode, result.stdout, result.stderr
 
     def _dump_and_delete_all_databases(self):
         for db, options, username, passphrase in self._databases:
@@ -414,22 +547,52 @@ class JVereinManager:
             self._logger.warning(f"unable to restore database (file not found): {full_sql_path}")
             return
 
-        # http://h2database.com/html/tutorial.html#upgrade_backup_restore
+        self._restore_h2_database_from_file(db_path, db_options, username, passphrase, full_sql_path)
 
-        ret, stdout, stderr = self._execute_subprocess([
-            self._java_path,
-            "-cp", self._h2_jar_path,
-            "org.h2.tools.RunScript",
-            "-url", f"jdbc:h2:{db_path}{db_options}",
-            "-user", username,
-            "-password", passphrase,
-            "-script", full_sql_path
-        ])
+        os.unlink(full_sql_path)
 
-        if ret != 0:
-            raise Exception("Konnte Datenbank nicht wiederherstellen.")
+    def _restore_h2_database_from_file(self,
+                                       db_path: str,
+                                       db_options: str,
+                                       username: str,
+                                       passphrase: str,
+                                       sql_path: str):
+        """
+        Args:
+            db_path: absolute database path without extension
+            sql_path: path of the database dump
+        """
 
-        os.unlink(full_sql_path)
+        # http://h2database.com/html/tutorial.html#upgrade_backup_restore
+
+        db_file_paths = [f"{db_path}{ext}" for ext in (".mv.db", ".h2.db", ".trace.db")]
+        existing_paths = [path for path in db_file_paths if os.path.exists(path)]
+
+        profiles = [self.restore_profile]
+        if self.restore_profile != PLAIN_RESTORE_PROFILE and not existing_paths:
+            profiles.append(PLAIN_RESTORE_PROFILE)
+
+        for profile in profiles:
+            start = time.monotonic()
+            java_options = [f"-Dh2.cacheSizeDefault={profile.cache_size}"] if profile.cache_size else []
+            args = self._get_h2_command("org.h2.tools.RunScript", java_options) + [
+                "-url", f"jdbc:h2:{db_path}{db_options}{profile.url_options}",
+                "-user", username,
+                "-password", passphrase,
+                "-script", sql_path
+            ]
+            ret, stdout, stderr = self._execute_subprocess(args)
+            if ret == 0:
+                self._logger.info(f"restored '{db_path}' in {time.monotonic() - start:.1f} s")
+                return
+
+            # ie. a setting unknown to the H2 version: retry with the plain settings
+            self._logger.warning(f"unable to restore '{db_path}' with the settings '{profile.url_options}'")
+            for path in db_file_paths:
+                if path not in existing_paths and os.path.exists(path):
+                    os.unlink(path)
+
+        raise Exception("Konnte Datenbank nicht wiederherstellen.")
 
     def _restore_all_databases(self):
         for db, options, username, passphrase in self._databases:
@@ -454,89 +617,87 @@ class JVereinManager:
             temp_file.write(content.encode())
         return temp_file.name
 
-    def _execute_sql(self, sql_statement: str, table_name: str, error_str: str):
-        temp_file_path = None
-        try:
-            temp_file_path = self._write_temporary_file(content=sql_statement)
-
-            dump_dir = os.path.join(self._local_repo_dir, "dump")
-            try:
-                os.makedirs(dump_dir)
-            except FileExistsError:
-                pass
-            jverein_db_path = os.path.join(
-                self._jameica_dir, "jverein", "h2db", "jverein")
-            table_err_str = f"Table \"{table_name.upper()}\" not found"
-            ret, stdout, stderr = self._execute_subprocess(
-                [
-                    self._java_path,
-                    "-cp", self._h2_jar_path,
-                    "org.h2.tools.RunScript",
-                    "-url", f"jdbc:h2:{jverein_db_path}",
-                    "-user", "jverein",
-                    "-password", "jverein",
-                    "-script", temp_file_path
-                ],
-                cwd=dump_dir,
-                ignore_err=table_err_str
+    @staticmethod
+    def _quote_sql_string(value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+
+    def _create_export_script(self, exports: List[CsvExport]) -> str:
+        statements = []
+        for export in exports:
+            statements.append(
+                f"CALL CSVWRITE({self._quote_sql_string(export.file)}, "
+                f"{self._quote_sql_string(export.sql)}, "
+                f"STRINGDECODE({self._quote_sql_string(export.options)}));"
             )
+        return "\n".join(statements)
 
-            if ret != 0:
-                self._logger.error(error_str)
-
-            if table_err_str in stderr:
-                self._logger.warning(f"{error_str}: Mitglieder-Tabelle existiert nicht")
-        except Exception as e:
-            raise e
-        finally:
-            os.unlink(temp_file_path)
-
-    def _export_emails(self):
+    def run_exports(self,
+                    jverein_db_path: Optional[str] = None,
+                    output_dir: Optional[str] = None,
+                    exports: Optional[List[CsvExport]] = None) -> List[str]:
         """
-        Export email addresses of all current members to dump/mitglieder-emails.csv
+        Write all CSV exports with one H2 RunScript call.
+        A failing export doesn't stop the others, its previous CSV file is kept.
 
-        Made for use with mailman's sync_members
-        http://manpages.org/sync_members/8
-        """
-
-        sql_statement = textwrap.dedent(r"""
-            CALL CSVWRITE(
-                'mitglieder-emails.csv', 
-                'SELECT LOWER(email) FROM mitglied 
-                    WHERE eintritt <= CURDATE() 
-                        AND (austritt IS NULL OR austritt >= CURDATE())
-                    ORDER BY LOWER(email)', 
-                STRINGDECODE(
-                    'charset=UTF-8 escape=\" fieldDelimiter= lineSeparator=\n null= writeColumnHeader=false')
-            );
-        """.strip())
-
-        self._execute_sql(sql_statement=sql_statement,
-                          table_name="mitglied",
-                          error_str="Konnte E-Mails nicht exportieren")
-
-    def _export_emails_with_expiry_date(self):
+        Args:
+            jverein_db_path: absolute path of the jverein database without extension,
+                default: the jverein database in the repository
+            output_dir: directory for the CSV files, default: the dump directory in the repository
+            exports: default: self.exports
+        Returns:
+            The names of the successfully written files
         """
-        Export email addresses and resignation date of all current members to dump/mitglieder-emails-austritt.csv
+        requested_exports = exports if exports is not None else self.exports
+        if jverein_db_path is None:
+            jverein_db_path = os.path.join(self._jameica_dir, "jverein", "h2db", "jverein")
+        if output_dir is None:
+            output_dir = self._dump_dir
+
+        exports = []
+        for export in requested_exports:
+            if not export.file or os.path.basename(export.file) != export.file:
+                self._logger.error(f"Export '{export.name}': ungültiger Dateiname '{export.file}'")
+            else:
+                exports.append(export)
+        if not exports:
+            return []
 
-        Made for use with custom sync members script
-        """
+        try:
+            os.makedirs(output_dir)
+        except FileExistsError:
+            pass
 
-        sql_statement = textwrap.dedent(r"""
-            CALL CSVWRITE(
-                'mitglieder-emails-austritt.csv', 
-                'SELECT id, externemitgliedsnummer, LOWER(email), austritt FROM mitglied 
-                    WHERE eintritt <= CURDATE() 
-                        AND (austritt IS NULL OR austritt >= CURDATE()) 
-                    ORDER BY LOWER(email)', 
-                STRINGDECODE(
-                    'charset=UTF-8 lineSeparator=\n null= writeColumnHeader=false')
-            );
-        """.strip())
+        written_files = []
+        temp_file_path = None
+        try:
+            temp_file_path = self._write_temporary_file(content=self._create_export_script(exports))
+
+            # CSVWRITE writes into a temporary directory first:
+            # a file missing there afterwards tells us which export failed
+            with TemporaryDirectory(dir=output_dir) as temp_dir:
+                self._execute_subprocess(
+                    self._get_h2_command("org.h2.tools.RunScript") + [
+                        "-url", f"jdbc:h2:{jverein_db_path}",
+                        "-user", "jverein",
+                        "-password", "jverein",
+                        "-script", temp_file_path,
+                        "-continueOnError"
+                    ],
+                    cwd=temp_dir
+                )
+
+                for export in exports:
+                    temp_path = os.path.join(temp_dir, export.file)
+                    if os.path.exists(temp_path):
+                        os.replace(temp_path, os.path.join(output_dir, export.file))
+                        written_files.append(export.file)
+                    else:
+                        self._logger.error(f"Konnte Export '{export.name}' nicht erstellen")
+        finally:
+            if temp_file_path:
+                os.unlink(temp_file_path)
 
-        self._execute_sql(sql_statement=sql_statement,
-                          table_name="mitglied",
-                          error_str="Konnte E-Mails und Austrittsdaten nicht exportieren")
+        return written_files
 
     @property
     def current_jameica_version(self):
@@ -592,7 +753,7 @@ class JVereinManager:
             "-f", self._jameica_dir,
             "-p", master_password
         ]
-        self._logger.info(f"executing: {' '.join(args)}")
+        self._logger.info(f"executing: {process.format_args(args)}")
         env = os.environ.copy()
         try:
             del env["LD_LIBRARY_PATH"]
@@ -609,8 +770,104 @@ class JVereinManager:
 
         sleep(1)
 
+    def export_from_dump(self, sql_path: str, output_dir: str) -> List[str]:
+        """
+        Export the CSV files from a dump of the jverein database, without starting Jameica.
+        The dump is restored into a temporary database, the repository isn't touched.
+
+        Args:
+            sql_path: path of the jverein database dump
+            output_dir: directory for the CSV files
+        Returns:
+            The names of the successfully written files
+        """
+        with TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, "jverein")
+            self._restore_h2_database_from_file(db_path, "", "jverein", "jverein", sql_path)
+            return self.run_exports(jverein_db_path=db_path, output_dir=output_dir)
+
+    def get_dump_stats(self) -> List[DumpStats]:
+        """
+        Returns:
+            Size and number of rows of the dumps of the registered databases, ie. after teardown()
+        """
+        stats = []
+        for db, _, _, _ in self._databases:
+            sql_path = f"{db}.sql"
+            if not os.path.exists(sql_path):
+                continue
+            stats.append(DumpStats(
+                database=os.path.basename(db),
+                bytes=os.path.getsize(sql_path),
+                rows=sum(h2dump.count_rows(sql_path).values())
+            ))
+        return stats
+
+    def _read_teardown_journal(self) -> Set[str]:
+        if not self._teardown_journal_path:
+            return set()
+        try:
+            with open(self._teardown_journal_path, "r") as f:
+                return set(json.load(f)["finished_steps"])
+        except FileNotFoundError:
+            return set()
+        except (ValueError, KeyError, TypeError):
+            self._logger.warning(f"ignoring invalid teardown journal '{self._teardown_journal_path}'")
+            return set()
+
+    def _write_teardown_journal(self, finished_steps: Set[str]):
+        if not self._teardown_journal_path:
+            return
+        temp_path = f"{self._teardown_journal_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"finished_steps": sorted(finished_steps)}, f, indent=2)
+        os.replace(temp_path, self._teardown_journal_path)
+
+    def _finish_teardown_step(self, finished_steps: Set[str], step: str):
+        self._logger.info(f"teardown step finished: {step}")
+        finished_steps.add(step)
+        self._write_teardown_journal(finished_steps)
+
+    def has_unfinished_teardown(self) -> bool:
+        """
+        Returns:
+            True if a teardown has been interrupted, see resume_teardown()
+        """
+        return bool(self._teardown_journal_path) and os.path.exists(self._teardown_journal_path)
+
+    def resume_teardown(self, master_password: str):
+        """
+        Finish an interrupted teardown, the steps already finished are skipped.
+        """
+        self._register_all_databases(master_password)
+        self.teardown()
+
     def teardown(self):
-        self._reset_user_properties_in_properties_files()
-        self._export_emails()
-        self._export_emails_with_expiry_date()
-        self._dump_and_delete_all_databases()
+        """
+        Reset the user properties, write the CSV exports, dump and delete the databases.
+        Every finished step is recorded in a journal, so an interrupted teardown can be resumed.
+        """
+        finished_steps = self._read_teardown_journal()
+        if finished_steps:
+            self._logger.info(f"resuming teardown, finished steps: {sorted(finished_steps)}")
+        else:
+            self._write_teardown_journal(finished_steps)
+
+        if "properties" not in finished_steps:
+            self._reset_user_properties_in_properties_files()
+            self._finish_teardown_step(finished_steps, "properties")
+
+        exports = [export for export in self.exports if f"export:{export.name}" not in finished_steps]
+        if exports:
+            self.run_exports(exports=exports)
+            for export in exports:
+                self._finish_teardown_step(finished_steps, f"export:{export.name}")
+
+        for db, options, username, passphrase in self._databases:
+            step = f"dump:{os.path.relpath(db, self._local_repo_dir)}"
+            if step not in finished_steps:
+                self._dump_and_delete_h2_database(db, options, username, passphrase)
+                self._finish_teardown_step(finished_steps, step)
+
+        if self._teardown_journal_path:
+            os.unlink(self._teardown_journal_path)
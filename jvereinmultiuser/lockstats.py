@@ -0,0 +1,74 @@
+"""
+Hold times and contention of the lock, aggregated from the lock journal (see GitLocker.get_lock_events()).
+
+The share of time the lock has been held (utilization) together with the share of rejected lock attempts
+shows whether the single lock is a bottleneck.
+"""
+from datetime import datetime
+from typing import Dict, List
+from jvereinmultiuser.gitlocker import LockEvent, LOCK_ACQUIRED, LOCK_RELEASED, LOCK_REJECTED
+
+
+def _new_user_stats() -> dict:
+    return {
+        "acquired": 0,
+        "released": 0,
+        "held_seconds_total": 0,
+        "held_seconds_mean": None,
+        "held_seconds_max": None,
+        "rejected": 0,  # own lock attempts rejected
+        "blocked_others": 0,  # lock attempts of others rejected while holding the lock
+    }
+
+
+def aggregate(events: List[LockEvent]) -> dict:
+    """
+    Args:
+        events: sorted by time
+    Returns:
+        Totals and statistics per user, JSON serializable
+    """
+    holders = {}  # type: Dict[str, str]
+    for event in events:
+        if event.event in (LOCK_ACQUIRED, LOCK_RELEASED):
+            holders[event.lock] = event.user
+
+    users = {}  # type: Dict[str, dict]
+    for event in events:
+        stats = users.setdefault(event.user, _new_user_stats())
+        if event.event == LOCK_ACQUIRED:
+            stats["acquired"] += 1
+        elif event.event == LOCK_RELEASED:
+            stats["released"] += 1
+            if event.held_seconds is not None:
+                stats["held_seconds_total"] += event.held_seconds
+                stats["held_seconds_max"] = max(stats["held_seconds_max"] or 0, event.held_seconds)
+        elif event.event == LOCK_REJECTED:
+            stats["rejected"] += 1
+            # lock tags of older versions of jverein-multiuser have never been journaled
+            holder = holders.get(event.lock, event.lock)
+            users.setdefault(holder, _new_user_stats())["blocked_others"] += 1
+
+    for stats in users.values():
+        if stats["released"]:
+            stats["held_seconds_mean"] = round(stats["held_seconds_total"] / stats["released"])
+
+    acquired = sum(stats["acquired"] for stats in users.values())
+    rejected = sum(stats["rejected"] for stats in users.values())
+    held_seconds = sum(stats["held_seconds_total"] for stats in users.values())
+    result = {
+        "events": len(events),
+        "first": events[0].time if events else None,
+        "last": events[-1].time if events else None,
+        "acquired": acquired,
+        "rejected": rejected,
+        "rejection_rate": round(rejected / (acquired + rejected), 3) if acquired + rejected else None,
+        "held_seconds_total": held_seconds,
+        "utilization": None,
+        "users": users,
+    }
+    if len(events) > 1:
+        period = (datetime.fromisoformat(events[-1].time) - datetime.fromisoformat(events[0].time)).total_seconds()
+        if period > 0:
+            result["utilization"] = round(min(1.0, held_seconds / period), 3)
+    return result
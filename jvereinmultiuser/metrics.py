@@ -0,0 +1,170 @@
+"""
+Session metrics in the Prometheus text format, for the textfile collector of the node exporter
+(https://github.com/prometheus/node_exporter#textfile-collector).
+
+A textfile must contain every series only once, so the file holds the latest value of every series:
+gauges are replaced by the values of the current session, counters are added to the values of the
+previous sessions. The history over months is kept by Prometheus.
+
+    metrics = Metrics("jverein_multiuser.prom")
+    with metrics.measure("teardown"):
+        ...
+    metrics.set("jverein_multiuser_dump_bytes", 1234, database="jverein")
+    metrics.write()
+"""
+import os
+import re
+import time
+import logging
+import contextlib
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+GAUGE = "gauge"
+COUNTER = "counter"
+
+
+class _Metric(NamedTuple):
+    type: str
+    help: str
+
+
+_METRICS = {
+    "jverein_multiuser_sessions_total": _Metric(
+        COUNTER, "Sessions which recorded metrics"),
+    "jverein_multiuser_last_session_timestamp_seconds": _Metric(
+        GAUGE, "End of the last session which recorded metrics"),
+    "jverein_multiuser_phase_duration_seconds": _Metric(
+        GAUGE, "Duration of the phase in the last session which ran it"),
+    "jverein_multiuser_lock_hold_seconds": _Metric(
+        GAUGE, "Time between acquiring and releasing the last lock"),
+    "jverein_multiuser_lock_hold_seconds_total": _Metric(
+        COUNTER, "Time the lock has been held, summed up over all locks"),
+    "jverein_multiuser_locks_total": _Metric(
+        COUNTER, "Released locks"),
+    "jverein_multiuser_dump_bytes": _Metric(
+        GAUGE, "Size of the SQL dump of the database after the last teardown"),
+    "jverein_multiuser_dump_rows": _Metric(
+        GAUGE, "Rows in the SQL dump of the database after the last teardown"),
+    "jverein_multiuser_push_bytes": _Metric(
+        GAUGE, "Bytes sent by the pushes of the last session which pushed"),
+    "jverein_multiuser_push_bytes_total": _Metric(
+        COUNTER, "Bytes sent by all pushes"),
+    "jverein_multiuser_hook_duration_seconds": _Metric(
+        GAUGE, "Runtime of the hook script in its last run"),
+}
+
+_SAMPLE_RE = re.compile(r"^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})?\s+(?P<value>\S+)$")
+_LABEL_RE = re.compile(r'(?P<key>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)"')
+
+# series name and sorted labels
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _unescape(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), value)
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metrics:
+    def __init__(self, path: Optional[str]):
+        """
+        Args:
+            path: the textfile, ie. <working dir>/jverein_multiuser.prom, None: don't record anything
+        """
+        self._path = path
+        self._logger = logging.getLogger(__name__)
+        self._gauges = {}  # type: Dict[_Key, float]
+        self._counters = {}  # type: Dict[_Key, float]
+
+    @staticmethod
+    def _get_key(name: str, labels: Dict[str, str]) -> _Key:
+        if name not in _METRICS:
+            raise ValueError(f"unknown metric: {name}")
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def set(self, name: str, value: float, **labels: str):
+        """
+        Set a gauge to the value of this session.
+        """
+        key = self._get_key(name, labels)
+        if _METRICS[name].type != GAUGE:
+            raise ValueError(f"not a gauge: {name}")
+        self._gauges[key] = value
+
+    def add(self, name: str, value: float, **labels: str):
+        """
+        Increase a counter, the value is added to the previous sessions.
+        """
+        key = self._get_key(name, labels)
+        if _METRICS[name].type != COUNTER:
+            raise ValueError(f"not a counter: {name}")
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        """
+        Record the duration of the phase, unless it fails.
+        """
+        start = time.monotonic()
+        yield
+        self.set("jverein_multiuser_phase_duration_seconds", round(time.monotonic() - start, 3), phase=phase)
+
+    def _read(self) -> Dict[_Key, float]:
+        values = {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                for line in f:
+                    match = _SAMPLE_RE.match(line.strip())
+                    if match is None or match.group("name") not in _METRICS:
+                        continue  # comment or metric of an older version
+                    labels = {m.group("key"): _unescape(m.group("value"))
+                              for m in _LABEL_RE.finditer(match.group("labels") or "")}
+                    try:
+                        values[self._get_key(match.group("name"), labels)] = float(match.group("value"))
+                    except ValueError:
+                        self._logger.warning(f"ignoring invalid line in '{self._path}': {line.strip()}")
+        except FileNotFoundError:
+            pass
+        return values
+
+    def write(self):
+        """
+        Merge the metrics of this session into the textfile. Nothing is written if nothing has been recorded.
+        The file is replaced atomically, so the node exporter never reads a partial file.
+        """
+        if not self._path or not (self._gauges or self._counters):
+            return
+
+        self.add("jverein_multiuser_sessions_total", 1)
+        self.set("jverein_multiuser_last_session_timestamp_seconds", int(time.time()))
+
+        values = self._read()
+        values.update(self._gauges)
+        for key, value in self._counters.items():
+            values[key] = values.get(key, 0) + value
+
+        lines = []
+        for name in sorted({name for name, _ in values}):
+            lines.append(f"# HELP {name} {_METRICS[name].help}")
+            lines.append(f"# TYPE {name} {_METRICS[name].type}")
+            for key in sorted(key for key in values if key[0] == name):
+                labels = ",".join(f'{k}="{_escape(v)}"' for k, v in key[1])
+                lines.append(f"{name}{{{labels}}} {_format_value(values[key])}" if labels
+                             else f"{name} {_format_value(values[key])}")
+
+        temp_path = f"{self._path}.{os.getpid()}.tmp"  # the collector ignores files not ending with .prom
+        try:
+            with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(temp_path, self._path)
+        except OSError as e:
+            self._logger.warning(f"unable to write the metrics file: {e}")
+        self._gauges.clear()
+        self._counters.clear()
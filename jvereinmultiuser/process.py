@@ -0,0 +1,164 @@
+"""
+Run a subprocess and stream its output line by line into the log.
+
+Only a bounded tail of the output is kept in memory (the complete stdout only if requested),
+so the memory usage doesn't grow with the output of large git or H2 operations.
+"""
+import os
+import re
+import signal
+import logging
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# arguments followed by a password which must not be logged
+_SECRET_OPTIONS = {"-password", "-p"}
+
+DEFAULT_TAIL_LINES = 100
+
+_LINE_END_RE = re.compile(rb"\r\n|\r|\n")
+_CHUNK_SIZE = 8192
+
+# POSIX: a process started with a timeout gets a session of its own, the whole process group is killed on timeout.
+# Windows: it gets a process group of its own, the process tree is killed by taskkill.
+_KILL_PROCESS_GROUP = hasattr(os, "killpg")
+
+
+class ProcessResult(NamedTuple):
+    returncode: int
+    stdout: str  # complete output if keep_stdout, otherwise the last lines
+    stderr: str  # last lines
+    timed_out: bool = False
+
+
+def format_args(args: List[str]) -> str:
+    """
+    Returns:
+        The command line for the log, with masked passwords
+    """
+    masked = []
+    for i, arg in enumerate(args):
+        masked.append("***" if i > 0 and args[i - 1] in _SECRET_OPTIONS else arg)
+    return " ".join(masked)
+
+
+def _read_lines(stream, lines, logger: logging.Logger, prefix: str):
+    for raw_line in iter(stream.readline, b""):
+        line = raw_line.decode(errors="replace").rstrip("\r\n")
+        logger.debug(f"{prefix}: {line}")
+        lines.append(line)
+    stream.close()
+
+
+def _read_lines_with_updates(stream, lines, logger: logging.Logger, prefix: str, on_line: Callable[[str], None]):
+    """
+    Like _read_lines, but lines terminated by '\r' (ie. git's progress updates) are passed to on_line
+    as soon as they arrive. They are neither logged nor kept, they're overwritten by the next line anyway.
+    """
+    buffer = b""
+    while True:
+        chunk = stream.read1(_CHUNK_SIZE)
+        buffer += chunk
+        while True:
+            match = _LINE_END_RE.search(buffer)
+            if match is None or (chunk and match.group() == b"\r" and match.end() == len(buffer)):
+                break  # incomplete line or maybe '\r\n'
+            line = buffer[:match.start()].decode(errors="replace")
+            buffer = buffer[match.end():]
+            if not line:
+                continue
+            on_line(line)
+            if match.group() != b"\r":
+                logger.debug(f"{prefix}: {line}")
+                lines.append(line)
+        if not chunk:
+            break
+    if buffer:
+        line = buffer.decode(errors="replace")
+        on_line(line)
+        logger.debug(f"{prefix}: {line}")
+        lines.append(line)
+    stream.close()
+
+
+def _kill(proc: subprocess.Popen, timed_out: threading.Event):
+    timed_out.set()
+    try:
+        if _KILL_PROCESS_GROUP:
+            os.killpg(proc.pid, signal.SIGKILL)  # including the children, they would keep the pipes open
+        else:
+            # /T: including the children, proc.kill() would only stop the script itself
+            ret = subprocess.run(["taskkill", "/T", "/F", "/PID", str(proc.pid)],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+            if ret != 0:
+                proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass  # already finished
+
+
+def run(args: List[str],
+        logger: logging.Logger,
+        env: Optional[Dict[str, str]] = None,
+        cwd: Optional[str] = None,
+        ignore_err: Optional[str] = None,
+        keep_stdout: bool = False,
+        tail_lines: int = DEFAULT_TAIL_LINES,
+        timeout: Optional[float] = None,
+        on_stderr_line: Optional[Callable[[str], None]] = None) -> ProcessResult:
+    """
+    Args:
+        args: command line
+        logger: every output line is logged with level DEBUG
+        ignore_err: return 0 if this string is found in the last lines of stderr
+        keep_stdout: keep the complete stdout in memory, ie. if it needs to be parsed
+        tail_lines: number of lines kept in memory
+        timeout: kill the process (and its children) after this number of seconds
+        on_stderr_line: called for every line of stderr, including lines terminated by '\r' (progress updates)
+    """
+    logger.info(f"executing: '{format_args(args)}'")
+
+    # a process group of its own, so the whole group can be killed on timeout, see _kill()
+    popen_kwargs = {}
+    if timeout is not None:
+        if _KILL_PROCESS_GROUP:
+            popen_kwargs["start_new_session"] = True
+        else:
+            popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=cwd, **popen_kwargs)
+    timed_out = threading.Event()
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, _kill, args=(proc, timed_out))
+        timer.daemon = True
+        timer.start()
+    stdout_lines = [] if keep_stdout else deque(maxlen=tail_lines)
+    stderr_lines = deque(maxlen=tail_lines)
+
+    # read stderr in a separate thread: a full pipe would block the process
+    if on_stderr_line:
+        stderr_thread = threading.Thread(target=_read_lines_with_updates,
+                                         args=(proc.stderr, stderr_lines, logger, "STDERR", on_stderr_line))
+    else:
+        stderr_thread = threading.Thread(target=_read_lines, args=(proc.stderr, stderr_lines, logger, "STDERR"))
+    stderr_thread.start()
+    _read_lines(proc.stdout, stdout_lines, logger, "STDOUT")
+    stderr_thread.join()
+    proc.wait()
+    if timer:
+        timer.cancel()
+
+    stderr_str = "\n".join(stderr_lines)
+    returncode = proc.returncode
+    if ignore_err and ignore_err in stderr_str:
+        returncode = 0
+
+    log_level = logging.INFO if returncode == 0 else logging.ERROR
+    if timed_out.is_set():
+        logger.log(log_level, f"killed after timeout of {timeout} s")
+    logger.log(log_level, f"RETURNCODE: {proc.returncode}")
+    if returncode != 0 and stderr_str:
+        logger.log(log_level, f"STDERR (last lines): {stderr_str}")
+
+    return ProcessResult(returncode, "\n".join(stdout_lines), stderr_str, timed_out.is_set())
@@ -0,0 +1,11 @@
+#!/usr/bin/env bash
+
+# Dieses Script wird unter macOS ausgeführt, bevor der exklusive Zugriff angefordert wird
+# Zum Aktivieren diese Datei folgendermaßen umbenennen: macos_pre_lock.sh
+# Weitere Scripts für diesen Zeitpunkt können im Ordner macos_pre_lock.d abgelegt werden,
+# alle Scripts laufen dann parallel.
+# Das Script läuft ohne Terminal, seine Ausgabe wird erst am Ende angezeigt. Abfragen, z. B. nach
+# dem Passwort für ssh oder gpg, warten deshalb bis zur Zeitüberschreitung (timeout).
+# Stattdessen einen Agenten (ssh-agent, gpg-agent) oder Schlüssel ohne Passphrase verwenden.
+
+echo "Hallo aus macos_pre_lock.sh"
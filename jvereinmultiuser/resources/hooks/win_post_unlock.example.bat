@@ -0,0 +1,9 @@
+REM Dieses Script wird unter Windows ausgeführt, nachdem der exklusive Zugriff freigegeben wurde
+REM Zum Aktivieren dieses Script folgendermaßen umbenennen: win_post_unlock.bat
+REM Weitere Scripts für diesen Zeitpunkt können im Ordner win_post_unlock.d abgelegt werden,
+REM alle Scripts laufen dann parallel.
+REM Das Script läuft ohne Konsole, seine Ausgabe wird erst am Ende angezeigt. Abfragen, z. B. nach
+REM dem Passwort für ssh oder gpg, warten deshalb bis zur Zeitüberschreitung (timeout).
+REM Stattdessen einen Agenten (ssh-agent, gpg-agent) oder Schlüssel ohne Passphrase verwenden.
+
+ECHO "Hallo aus win_post_unlock.bat"
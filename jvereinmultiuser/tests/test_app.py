@@ -0,0 +1,261 @@
+import io
+import os
+import sys
+import json
+import logging
+import contextlib
+import tempfile
+import unittest
+import threading
+import subprocess
+from datetime import datetime
+from unittest import TestCase, mock
+
+from jvereinmultiuser.app import App, _add_log_file
+from jvereinmultiuser.gitlocker import GitLocker
+
+GIT_EXEC = "/usr/bin/git"
+
+# slow to import, they must only be imported where they're used
+LAZY_MODULES = ["requests", "jks", "Crypto"]
+
+
+class TestApp(TestCase):
+    def test_startup_imports(self):
+        script = "import sys, jvereinmultiuser.app; print(' '.join(sorted(sys.modules)))"
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", script],
+                              check=True, capture_output=True, text=True)
+        modules = proc.stdout.split()
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_get_size_group(self):
+        self.assertEqual("Plugins", App._get_size_group("jameica/plugins/jverein/jverein.jar"))
+        self.assertEqual("Datenbank-Dumps", App._get_size_group("jameica/jverein/h2db/jverein.sql"))
+        self.assertEqual("Jameica", App._get_size_group("jameica/cfg/de.willuhn.jameica.system.Config.properties"))
+        self.assertEqual("Exporte", App._get_size_group("dump/mitglieder-emails.csv"))
+        self.assertEqual("Sonstige", App._get_size_group("config.ini"))
+
+    def _create_working_dir(self, working_dir: str, remote_repo: str):
+        subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "-q", "--bare"], check=True)
+        local_repo = os.path.join(working_dir, "repo")
+        os.makedirs(local_repo)
+        g = GitLocker(GIT_EXEC, local_repo, remote_repo, "John Doe", "johndoe@example.org", "Laptop",
+                      remote_state_path=os.path.join(working_dir, "remote_state.json"))
+        g.do_initial_setup(b"example", "example")
+        g.push()
+        g.refresh_remote_state()
+        with open(os.path.join(working_dir, "user_config.ini"), "w") as f:
+            f.write(f"[Author]\nname = John Doe\nemail = johndoe@example.org\ncomputer = Laptop\n"
+                    f"[Repository]\nremote = {remote_repo}\n"
+                    f"[Paths]\nh2_dir = {os.path.join(working_dir, 'missing')}\n")
+
+    def test_status_from_cache(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            stdout = io.StringIO()
+            # neither Jameica (the H2 dir doesn't exist) nor git is needed
+            with mock.patch.object(GitLocker, "_execute_git", side_effect=AssertionError("git called")), \
+                    contextlib.redirect_stdout(stdout):
+                exit_code = App(working_dir=working_dir, check_for_updates=False).run_command("status")
+            result = json.loads(stdout.getvalue().splitlines()[-1])
+            self.assertEqual(0, exit_code, result)
+            self.assertFalse(result["locked"])
+            self.assertTrue(result["synced"])
+            self.assertFalse(result["behind"])
+            self.assertFalse(result["teardown_unfinished"])
+
+    def test_commands_without_jameica(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            # the H2 dir doesn't exist, only 'export' needs it
+            for command, expected_exit_code in (("lock", 0), ("sync", 0), ("export", 1), ("push", 0)):
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    exit_code = App(working_dir=working_dir, check_for_updates=False).run_command(
+                        command, commit_message="example files")
+                result = json.loads(stdout.getvalue().splitlines()[-1])
+                self.assertEqual(expected_exit_code, exit_code, (command, result))
+                if command == "export":
+                    self.assertIn("h2_dir", result["error"])
+
+    @staticmethod
+    def _run_command(working_dir: str, command: str, **kwargs):
+        """
+        Returns: exit code and the JSON result of the command
+        """
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exit_code = App(working_dir=working_dir, check_for_updates=False).run_command(command, **kwargs)
+        return exit_code, json.loads(stdout.getvalue().splitlines()[-1])
+
+    def test_push_without_changes(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            self._run_command(working_dir, "lock")
+            self._run_command(working_dir, "push", commit_message="example files")
+
+            # nothing to upload: the lock is released nevertheless
+            self.assertEqual(0, self._run_command(working_dir, "lock")[0])
+            exit_code, result = self._run_command(working_dir, "push", commit_message="nothing")
+            self.assertEqual(0, exit_code, result)
+            self.assertFalse(result["locked"])
+
+            # unless it's kept
+            self._run_command(working_dir, "lock")
+            exit_code, result = self._run_command(working_dir, "push", commit_message="nothing", keep_lock=True)
+            self.assertEqual(0, exit_code, result)
+            self.assertTrue(result["locked_by_me"])
+
+    def test_lock_exit_codes(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as other_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            self.assertEqual(0, self._run_command(working_dir, "lock")[0])
+            # the own lock isn't "locked by someone else"
+            exit_code, result = self._run_command(working_dir, "lock")
+            self.assertEqual(0, exit_code, result)
+            self.assertTrue(result["locked_by_me"])
+            self._run_command(working_dir, "push", commit_message="example files")
+
+            other = GitLocker(GIT_EXEC, other_repo, remote_repo, "Jane Roe", "janeroe@example.org", "Desktop")
+            other.do_initial_setup(b"", "")
+            other.pull_and_lock()
+            exit_code, result = self._run_command(working_dir, "lock")
+            self.assertEqual(3, exit_code, result)
+            self.assertIn("Jane Roe", result["error"])
+
+    def test_compact_keeps_own_lock(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            self._run_command(working_dir, "lock")
+            self._run_command(working_dir, "push", commit_message="example files", keep_lock=True)
+
+            exit_code, result = self._run_command(working_dir, "compact", before=datetime(2000, 1, 1))
+            self.assertEqual(0, exit_code, result)
+            self.assertFalse(result["compacted"])
+            exit_code, result = self._run_command(working_dir, "status")
+            self.assertTrue(result["locked_by_me"])
+
+            # without a lock before, it's released again
+            self._run_command(working_dir, "unlock")
+            self._run_command(working_dir, "compact", before=datetime(2000, 1, 1))
+            exit_code, result = self._run_command(working_dir, "status")
+            self.assertFalse(result["locked"])
+
+    def test_is_process_running(self):
+        finished = subprocess.Popen([sys.executable, "-c", ""])
+        finished.wait()
+        self.assertTrue(App._is_process_running(os.getpid()))
+        self.assertFalse(App._is_process_running(finished.pid))
+
+    def test_is_process_running_on_windows(self):
+        still_active, access_denied = 259, 5
+        exit_codes = {1: still_active, 2: 0}  # pid -> exit code, the handle is the pid
+        kernel32 = mock.Mock()
+        kernel32.OpenProcess.side_effect = lambda access, inherit, pid: pid if pid in exit_codes else 0
+
+        def get_exit_code_process(handle, exit_code):
+            exit_code._obj.value = exit_codes[handle]
+            return 1
+
+        kernel32.GetExitCodeProcess.side_effect = get_exit_code_process
+        with mock.patch.object(sys, "platform", "win32"), \
+                mock.patch("ctypes.WinDLL", return_value=kernel32, create=True), \
+                mock.patch("ctypes.get_last_error", side_effect=[0, access_denied], create=True):
+            self.assertTrue(App._is_process_running(1))
+            self.assertFalse(App._is_process_running(2))
+            self.assertFalse(App._is_process_running(3))  # doesn't exist
+            self.assertTrue(App._is_process_running(4))  # someone else's process
+        self.assertEqual(2, kernel32.CloseHandle.call_count)
+
+    @staticmethod
+    def _mock_update_check(answered: threading.Event) -> mock.Mock:
+        """
+        Returns: a replacement for the requests module, get() answers once 'answered' is set
+        """
+        requests = mock.Mock()
+        requests.get.side_effect = lambda *args, **kwargs: answered.wait(5.0) and mock.Mock(text="99.0")
+        return requests
+
+    def test_first_prompt_before_update_check(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            os.makedirs(os.path.join(working_dir, "missing"))  # an empty H2 dir
+            answered = threading.Event()
+            app = App(working_dir=working_dir)
+            update_check_pending = []
+
+            def answer(_prompt):
+                update_check_pending.append(app._update_check_thread.is_alive())
+                answered.set()
+                return "q"
+
+            stdout = io.StringIO()
+            with mock.patch.dict(sys.modules, {"requests": self._mock_update_check(answered)}), \
+                    mock.patch("builtins.input", side_effect=answer), \
+                    self.assertLogs("jvereinmultiuser.app", logging.INFO) as logs, \
+                    contextlib.redirect_stdout(stdout):
+                app.run()
+            # the first prompt doesn't wait for the network, the update is reported before the session ends
+            self.assertEqual([True], update_check_pending)
+            self.assertEqual(1, len([line for line in logs.output if "first prompt after" in line]))
+            self.assertIn("Es ist ein Update für jverein-multiuser verfügbar: 99.0", stdout.getvalue())
+
+    def test_update_check_before_waiting_for_unlock(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as other_repo:
+            self._create_working_dir(working_dir, remote_repo)
+            os.makedirs(os.path.join(working_dir, "missing"))  # an empty H2 dir
+            other = GitLocker(GIT_EXEC, other_repo, remote_repo, "Jane Roe", "janeroe@example.org", "Desktop")
+            other.do_initial_setup(b"", "")
+            other.pull_and_lock()
+            answered = threading.Event()
+            answered.set()
+
+            stdout = io.StringIO()
+            with mock.patch.dict(sys.modules, {"requests": self._mock_update_check(answered)}), \
+                    mock.patch("builtins.input", side_effect=AssertionError("prompted")), \
+                    contextlib.redirect_stdout(stdout):
+                App(working_dir=working_dir, max_wait=0.1).run()
+            output = stdout.getvalue()
+            self.assertLess(output.index("Es ist ein Update für jverein-multiuser verfügbar: 99.0"),
+                            output.index("Warte bis zu"))
+
+    def test_add_log_file(self):
+        root_logger = logging.getLogger()
+        handlers = list(root_logger.handlers)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # a new working dir is only created by the app, with its message
+            working_dir = os.path.join(temp_dir, "new")
+            _add_log_file(working_dir)
+            self.assertFalse(os.path.exists(working_dir))
+
+            log_dir = os.path.join(temp_dir, "logs")
+            try:
+                for _ in range(3):  # ie. 'status' from cron: the same file, no rollover
+                    _add_log_file(temp_dir, "commands.log")
+                    logging.getLogger(__name__).warning("status")
+                    self._remove_handlers(handlers)
+                self.assertEqual(["commands.log"], os.listdir(log_dir))
+
+                for _ in range(2):  # interactive sessions: a new file for each
+                    _add_log_file(temp_dir, new_session=True)
+                    logging.getLogger(__name__).warning("session")
+                    self._remove_handlers(handlers)
+                self.assertEqual(["commands.log", "jverein-multiuser.log", "jverein-multiuser.log.1"],
+                                 sorted(os.listdir(log_dir)))
+            finally:
+                self._remove_handlers(handlers)
+
+    @staticmethod
+    def _remove_handlers(keep):
+        root_logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            if handler not in keep:
+                root_logger.removeHandler(handler)
+                handler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from jvereinmultiuser.csvdelta import write_delta, Delta
+
+
+class TestCsvDelta(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._old_path = os.path.join(self._temp_dir.name, "old.csv")
+        self._new_path = os.path.join(self._temp_dir.name, "new.csv")
+        self._added_path = os.path.join(self._temp_dir.name, "added.csv")
+        self._removed_path = os.path.join(self._temp_dir.name, "removed.csv")
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+        super().tearDown()
+
+    def _write(self, path, lines):
+        with open(path, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read().splitlines()
+
+    def test_write_delta(self):
+        self._write(self._old_path, ["anna@example.org", "bob@example.org", "carl@example.org", "dora@example.org"])
+        self._write(self._new_path, ["anna@example.org", "bert@example.org", "dora@example.org", "emil@example.org"])
+
+        delta = write_delta(self._old_path, self._new_path, self._added_path, self._removed_path)
+        self.assertEqual(Delta(added=2, removed=2), delta)
+        self.assertEqual(["bert@example.org", "emil@example.org"], self._read(self._added_path))
+        self.assertEqual(["bob@example.org", "carl@example.org"], self._read(self._removed_path))
+
+    def test_write_delta_without_previous_version(self):
+        self._write(self._new_path, ["anna@example.org", "anna@example.org", "", "bob@example.org"])
+
+        delta = write_delta(None, self._new_path, self._added_path, self._removed_path)
+        self.assertEqual(Delta(added=2, removed=0), delta)
+        self.assertEqual(["anna@example.org", "bob@example.org"], self._read(self._added_path))
+        self.assertEqual([], self._read(self._removed_path))
+
+        delta = write_delta(self._old_path, self._new_path, self._added_path, self._removed_path)
+        self.assertEqual(Delta(added=2, removed=0), delta)
+
+    def test_write_delta_unsorted(self):
+        self._write(self._old_path, ["carl@example.org", "anna@example.org"])
+        self._write(self._new_path, ["bob@example.org", "anna@example.org"])
+
+        delta = write_delta(self._old_path, self._new_path, self._added_path, self._removed_path)
+        self.assertEqual(Delta(added=1, removed=1), delta)
+        self.assertEqual(["bob@example.org"], self._read(self._added_path))
+        self.assertEqual(["carl@example.org"], self._read(self._removed_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
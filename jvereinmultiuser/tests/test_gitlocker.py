@@ -3,15 +3,20 @@ import logging
 import tempfile
 import unittest
 import subprocess
-from unittest import TestCase
+from unittest import TestCase, mock
 
-from jvereinmultiuser.gitlocker import GitLocker, GitError, IsLockedError
+from datetime import datetime
+from jvereinmultiuser.gitlocker import (
+    GitLocker, GitError, IsLockedError, HistoryRewrittenError, GitProgress, ARCHIVE_BRANCH,
+    LOCK_ACQUIRED, LOCK_RELEASED, LOCK_REJECTED, BUNDLE_UPLOAD, BUNDLE_REMOTE)
 
 GIT_EXEC = "/usr/bin/git"
 AUTHOR_NAME = "John Doe"
 AUTHOR_EMAIL = "johndoe@example.org"
 INSTANCE_NAME = "John Doe's Computer"
 INSTANCE_NAME2 = f"Second Computer"
+AUTHOR_NAME2 = "Jane Roe"
+AUTHOR_EMAIL2 = "janeroe@example.org"
 
 
 # noinspection DuplicatedCode
@@ -48,6 +53,63 @@ class TestGitLocker(TestCase):
                 INSTANCE_NAME
             )
 
+    def test_ssh_connection_sharing(self):
+        with tempfile.TemporaryDirectory() as working_dir, tempfile.TemporaryDirectory() as local_repo:
+            g = GitLocker(
+                GIT_EXEC,
+                local_repo,
+                "ssh://user@git.example.org/~/jverein.git",
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME,
+                ssh_control_dir=working_dir
+            )
+            self.assertIn("ControlMaster=auto", g._ssh_command)
+            self.assertIn(f"ControlPath={os.path.join(working_dir, 'ssh-control')}", g._ssh_command)
+            g.close()  # no connection has been opened
+
+            # the master connection of another process (ie. an interactive session) is left open
+            open(os.path.join(working_dir, "ssh-control"), "w").close()
+            with mock.patch("jvereinmultiuser.gitlocker.subprocess.run") as run:
+                g.close()
+                run.assert_not_called()
+
+            # local remote repository
+            g = GitLocker(
+                GIT_EXEC,
+                local_repo,
+                working_dir,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME,
+                ssh_control_dir=working_dir
+            )
+            self.assertIsNone(g._ssh_command)
+
+    def test_get_ssh_destination(self):
+        self.assertEqual(("user@git.example.org", "2222"),
+                         GitLocker._get_ssh_destination("ssh://user@git.example.org:2222/~/jverein.git"))
+        self.assertEqual(("user@git.example.org", None),
+                         GitLocker._get_ssh_destination("ssh://user@git.example.org:~/jverein.git"))
+        self.assertEqual(("git.example.org", None), GitLocker._get_ssh_destination("ssh://git.example.org/jverein.git"))
+
+    def test_read_ref(self):
+        with tempfile.TemporaryDirectory() as remote_repo, tempfile.TemporaryDirectory() as local_repo:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            g = GitLocker(GIT_EXEC, local_repo, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME)
+            self.assertIsNone(g.read_ref("HEAD"))
+            g.do_initial_setup(b"example", "example")
+            g.push()
+
+            branch = g._get_current_branch()
+            self.assertEqual(branch, g.read_current_branch())
+            self.assertEqual(g.get_commit("HEAD"), g.read_ref("HEAD"))
+            self.assertEqual(g.get_commit("@{upstream}"), g.read_ref(f"refs/remotes/origin/{branch}"))
+            subprocess.run([GIT_EXEC, "-C", local_repo, "pack-refs", "--all"], check=True)
+            self.assertEqual(g.get_commit("HEAD"), g.read_ref("HEAD"))
+            self.assertEqual(g.get_commit("@{upstream}"), g.read_ref(f"refs/remotes/origin/{branch}"))
+            self.assertIsNone(g.read_ref("refs/heads/unknown"))
+
     def test_author(self):
         with tempfile.TemporaryDirectory() as remote_repo, tempfile.TemporaryDirectory() as local_repo:
             subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
@@ -353,6 +415,174 @@ class TestGitLocker(TestCase):
             g.stage_and_commit("local commit")
             self.assertRaises(GitError, g.push)
 
+    def test_parse_progress(self):
+        self.assertEqual(
+            GitProgress("Receiving objects", 42, 21, 50, "1.20 MiB", "512.00 KiB/s", False),
+            GitLocker._parse_progress("Receiving objects:  42% (21/50), 1.20 MiB | 512.00 KiB/s")
+        )
+        self.assertEqual(
+            GitProgress("Counting objects", 100, 3, 3, None, None, True),
+            GitLocker._parse_progress("remote: Counting objects: 100% (3/3), done.")
+        )
+        self.assertEqual(
+            GitProgress("Writing objects", 100, 3, 3, "250 bytes", "250.00 KiB/s", True),
+            GitLocker._parse_progress("Writing objects: 100% (3/3), 250 bytes | 250.00 KiB/s, done.")
+        )
+        self.assertIsNone(GitLocker._parse_progress("To /tmp/remote.git"))
+
+    def test_push_progress(self):
+        with tempfile.TemporaryDirectory() as remote_repo, tempfile.TemporaryDirectory() as local_repo:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            progress = []
+            g = GitLocker(
+                GIT_EXEC,
+                local_repo,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME,
+                progress_callback=progress.append
+            )
+            g.do_initial_setup(b"example content", "example")
+            g.push()
+
+            writing = [p for p in progress if p.phase == "Writing objects"]
+            self.assertTrue(writing)
+            self.assertTrue(writing[-1].finished)
+            self.assertEqual(100, writing[-1].percent)
+            self.assertIsNotNone(writing[-1].transferred)
+            self.assertGreater(g.pushed_bytes, 0)
+
+            self.assertIsNone(g.get_lock_held_seconds())
+            g.lock()
+            self.assertLess(g.get_lock_held_seconds(), 60)
+
+    def test_parse_size(self):
+        self.assertEqual(280, GitLocker._parse_size("280 bytes"))
+        self.assertEqual(1536, GitLocker._parse_size("1.50 KiB"))
+        self.assertEqual(3 * 1024 ** 2, GitLocker._parse_size("3.00 MiB"))
+
+    def _count_local_objects(self, repo):
+        output = subprocess.run([GIT_EXEC, "-C", repo, "count-objects", "-v"],
+                                check=True, capture_output=True, text=True).stdout
+        values = dict(line.split(": ") for line in output.splitlines())
+        return int(values["count"]) + int(values["in-pack"])
+
+    def test_reference_repo(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo, \
+                tempfile.TemporaryDirectory() as local_repo2, \
+                tempfile.TemporaryDirectory() as shared_dir:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init"], check=True)
+            with open(os.path.join(remote_repo, "plugin.jar"), "w") as f:
+                f.write("plugin content")
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "add", "--all"], check=True)
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "commit", "-m", "initial commit"], check=True)
+
+            # file://: a local path would be cloned by copying the objects directory
+            remote_url = f"file://{remote_repo}"
+            reference_repo = os.path.join(shared_dir, "objects")
+            g = GitLocker(
+                GIT_EXEC,
+                local_repo,
+                remote_url,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME,
+                reference_repo=reference_repo
+            )
+            g.do_initial_setup("", "")
+
+            # all objects are borrowed from the reference repository
+            self.assertTrue(os.path.exists(os.path.join(local_repo, "plugin.jar")))
+            self.assertEqual(0, self._count_local_objects(local_repo))
+            prune_expire = subprocess.run([GIT_EXEC, "-C", reference_repo, "config", "gc.pruneExpire"],
+                                          check=True, capture_output=True, text=True).stdout.strip()
+            self.assertEqual("never", prune_expire)
+
+            # a new commit is fetched into the reference repository before pulling
+            with open(os.path.join(remote_repo, "example"), "w") as f:
+                f.write("example content")
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "add", "--all"], check=True)
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "commit", "-m", "second commit"], check=True)
+            g.pull()
+            self.assertTrue(os.path.exists(os.path.join(local_repo, "example")))
+            self.assertEqual(0, self._count_local_objects(local_repo))
+
+            # an existing local repository without reference repository
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_url,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+            g2.do_initial_setup("", "")
+            self.assertNotEqual(0, self._count_local_objects(local_repo2))
+
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_url,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME,
+                reference_repo=reference_repo
+            )
+            g2.pull()
+            self.assertEqual(0, self._count_local_objects(local_repo2))
+            self.assertTrue(g2.is_synced_with_remote_repo())
+
+    def test_export_file(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2, \
+                tempfile.TemporaryDirectory() as export_dir:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+
+            with open(os.path.join(local_repo1, "example"), "w") as f:
+                f.write("new content")
+            g1.stage_and_commit("second commit")
+            g1.push()
+
+            # the working directory of g2 isn't changed
+            dst_path = os.path.join(export_dir, "example")
+            g2.fetch()
+            self.assertTrue(g2.export_file("@{upstream}", "example", dst_path))
+            with open(dst_path) as f:
+                self.assertEqual("new content", f.read())
+            with open(os.path.join(local_repo2, "example")) as f:
+                self.assertEqual("example content", f.read())
+            self.assertEqual(g1.get_commit("HEAD"), g2.get_commit("@{upstream}"))
+            self.assertNotEqual(g2.get_commit("HEAD"), g2.get_commit("@{upstream}"))
+
+            self.assertFalse(g2.export_file("@{upstream}", "missing", dst_path))
+            self.assertFalse(os.path.exists(dst_path))
+
     def test_pull_and_lock_single_user(self):
         with tempfile.TemporaryDirectory() as remote_repo, tempfile.TemporaryDirectory() as local_repo:
             subprocess.run([GIT_EXEC, "-C", remote_repo, "init"], check=True)
@@ -381,6 +611,37 @@ class TestGitLocker(TestCase):
             self.assertIsNone(g.get_lock_info())
             self.assertFalse(g.is_locked_by_me())
 
+    def test_pull_and_lock_with_failing_pull(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            g1 = GitLocker(GIT_EXEC, local_repo1, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME)
+            g2 = GitLocker(GIT_EXEC, local_repo2, remote_repo, AUTHOR_NAME2, AUTHOR_EMAIL2, INSTANCE_NAME2)
+            g1.do_initial_setup(b"version 0", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+            g1.pull_and_lock()
+            with open(os.path.join(local_repo1, "example"), "w") as f:
+                f.write("version 1")
+            g1.stage_and_commit("version 1")
+            g1.push_and_unlock()
+
+            # the lock is released, it would be held with an outdated local repository otherwise
+            pull = g2.pull
+            with mock.patch.object(g2, "pull", side_effect=GitError("Konnte nicht updaten.")):
+                self.assertRaises(GitError, g2.pull_and_lock)
+            self.assertFalse(g2.is_locked_by_me())
+            self.assertIsNone(g2.get_remote_lock_info())
+
+            # the lock is kept to adopt a rewritten history
+            with mock.patch.object(g2, "pull", side_effect=HistoryRewrittenError("neu geschrieben")):
+                self.assertRaises(HistoryRewrittenError, g2.pull_and_lock)
+            self.assertTrue(g2.is_locked_by_me())
+            pull()
+            self.assertEqual(g1.get_commit("HEAD"), g2.get_commit("HEAD"))
+            g2.unlock()
+
     def test_pull_and_lock_two_instances(self):
         with tempfile.TemporaryDirectory() as remote_repo, \
                 tempfile.TemporaryDirectory() as local_repo1, \
@@ -448,6 +709,542 @@ class TestGitLocker(TestCase):
             self.assertTrue(INSTANCE_NAME2 in g2.get_lock_info())
             self.assertTrue(g2.is_locked_by_me())
 
+    def test_lock_is_atomic(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+
+            # both instances have an up-to-date view of an unlocked repo, only one of them wins
+            g1.lock()
+            self.assertRaises(IsLockedError, g2.lock)
+            self.assertEqual(1, len(g2.get_remote_lock_names()))
+            self.assertTrue(AUTHOR_NAME in g2.get_lock_info())
+            self.assertFalse(g2.is_locked_by_me())
+
+            self.assertRaises(IsLockedError, g1.lock)
+            self.assertTrue(g1.is_locked_by_me())
+
+            g1.unlock()
+            self.assertEqual([], g2.get_remote_lock_names())
+            g2.pull_and_lock()
+            self.assertTrue(g2.is_locked_by_me())
+
+    def test_pull_and_lock_with_legacy_lock_tag(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+
+            # lock tag without lock reference, as created by older versions
+            legacy_lock_name = "lock_John-Doe_John-Does-Computer_2020-01-01_12-00-00"
+            subprocess.run([GIT_EXEC, "-C", local_repo1, "tag", legacy_lock_name], check=True)
+            subprocess.run([GIT_EXEC, "-C", local_repo1, "push", "origin", legacy_lock_name], check=True)
+
+            self.assertRaisesRegex(IsLockedError, "John Does Computer", g2.pull_and_lock)
+            self.assertEqual([legacy_lock_name], g2.get_remote_lock_names())
+
+    def test_push_and_unlock(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+
+            g1.pull_and_lock()
+
+            # no changes
+            self.assertRaises(GitError, g1.push_and_unlock)
+
+            # changes not committed
+            with open(os.path.join(local_repo1, "example2"), "w") as f:
+                f.write("example content")
+            self.assertRaises(GitError, g1.push_and_unlock)
+            self.assertEqual(1, len(g2.get_remote_lock_names()))
+
+            g1.stage_and_commit("second commit")
+            g1.push_and_unlock()
+            self.assertTrue(g1.is_synced_with_remote_repo())
+            self.assertIsNone(g1.get_lock_info())
+            self.assertEqual([], g2.get_remote_lock_names())
+
+            g2.pull_and_lock()
+            self.assertTrue(os.path.exists(os.path.join(local_repo2, "example2")))
+
+            # rejected push (remote has diverged): neither the branch nor the lock is changed
+            subprocess.run([GIT_EXEC, "-C", local_repo1, "commit", "--allow-empty", "-m", "diverged"], check=True)
+            subprocess.run([GIT_EXEC, "-C", local_repo1, "push"], check=True)
+            with open(os.path.join(local_repo2, "example3"), "w") as f:
+                f.write("example content")
+            g2.stage_and_commit("third commit")
+            self.assertRaises(GitError, g2.push_and_unlock)
+            self.assertTrue(g2.is_locked_by_me())
+            self.assertEqual(1, len(g1.get_remote_lock_names()))
+
+    def test_wait_for_unlock(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init"], check=True)
+            with open(os.path.join(remote_repo, "example"), "w") as f:
+                f.write("example content")
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "add", "--all"], check=True)
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "commit", "-m", "initial commit"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup("", "")
+            g2.do_initial_setup("", "")
+
+            self.assertEqual([], g2.get_remote_lock_names())
+            self.assertTrue(g2.wait_for_unlock(max_wait=0))
+
+            g1.pull_and_lock()
+            remote_lock_names = g2.get_remote_lock_names()
+            self.assertEqual(1, len(remote_lock_names))
+            self.assertTrue(remote_lock_names[0].startswith("lock_John-Doe_John-Does-Computer_"))
+            self.assertFalse(g2.wait_for_unlock(max_wait=0.3, initial_interval=0.1, max_interval=0.1))
+
+            g1.unlock()
+            self.assertTrue(g2.wait_for_unlock(max_wait=0.3, initial_interval=0.1, max_interval=0.1))
+            self.assertIsNone(g2.get_lock_info())  # nothing fetched yet
+
+    def test_remote_state(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+            self.assertEqual((0, 0), g2.get_ahead_behind())
+            self.assertIsNone(g2.get_remote_lock_info())
+
+            g1.pull_and_lock()
+            with open(os.path.join(local_repo1, "example"), "w") as f:
+                f.write("changed content")
+            g1.stage_and_commit("second commit")
+            self.assertEqual((1, 0), g1.get_ahead_behind())
+            g1.push()
+
+            g2.fetch()
+            self.assertEqual((0, 1), g2.get_ahead_behind())
+            self.assertTrue(g2.get_commit_summary("@{upstream}").endswith(f"{AUTHOR_NAME}: second commit"))
+            self.assertTrue(g2.get_remote_lock_info().startswith("John Doe (John Does Computer) "))
+            self.assertIsNone(g2.get_lock_info())  # the working directory is unchanged
+
+    def test_cached_remote_state(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2, \
+                tempfile.TemporaryDirectory() as working_dir:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            state_path = os.path.join(working_dir, "remote_state.json")
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2,
+                remote_state_path=state_path
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            self.assertIsNone(g2.get_cached_remote_state())
+
+            g2.do_initial_setup("", "")
+            g2.pull_and_lock()
+            state = g2.get_cached_remote_state()
+            self.assertEqual(1, len(state.lock_names))
+            self.assertTrue(g2.is_own_lock(state.lock_names[0]))
+            self.assertEqual(g2.get_commit("@{upstream}"), g2.get_remote_head(state))
+            self.assertIsNotNone(state.checked)
+
+            g2.unlock()
+            self.assertEqual([], g2.get_cached_remote_state().lock_names)
+
+            # changes of others are only visible after a refresh
+            g1.pull_and_lock()
+            with open(os.path.join(local_repo1, "example"), "w") as f:
+                f.write("changed content")
+            g1.stage_and_commit("second commit")
+            g1.push()
+            state = g2.get_cached_remote_state()
+            self.assertEqual([], state.lock_names)
+            self.assertEqual(g2.get_commit("@{upstream}"), g2.get_remote_head(state))
+
+            state = g2.refresh_remote_state()
+            self.assertEqual(g1._get_lock_names(), state.lock_names)
+            self.assertFalse(g2.is_own_lock(state.lock_names[0]))
+            self.assertEqual(g1.get_commit("HEAD"), g2.get_remote_head(state))
+            self.assertEqual(state, g2.get_cached_remote_state())
+
+            # a cache of another remote repository is ignored
+            g3 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                local_repo1,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME2,
+                remote_state_path=state_path
+            )
+            self.assertIsNone(g3.get_cached_remote_state())
+
+    def test_lock_journal(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+
+            g1 = GitLocker(
+                GIT_EXEC,
+                local_repo1,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+            g2 = GitLocker(
+                GIT_EXEC,
+                local_repo2,
+                remote_repo,
+                AUTHOR_NAME2,
+                AUTHOR_EMAIL2,
+                INSTANCE_NAME2
+            )
+
+            g1.do_initial_setup(b"example content", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+            self.assertEqual([], g2.get_lock_events())
+
+            lock_name = g1.lock()
+            # the event is uploaded with the lock tag
+            self.assertEqual([LOCK_ACQUIRED], [e.event for e in g2.get_lock_events()])
+            self.assertRaises(IsLockedError, g2.pull_and_lock)
+            # a rejected attempt isn't pushed with a lock tag
+            with mock.patch.object(g1, "_execute_git", wraps=g1._execute_git) as execute_git:
+                g1.push_lock_journal()
+            self.assertNotIn("push", [call.args[0][0] for call in execute_git.call_args_list])
+            g2.push_lock_journal()
+            g1.unlock()
+
+            events = g2.get_lock_events()
+            self.assertEqual([LOCK_ACQUIRED, LOCK_REJECTED, LOCK_RELEASED], [e.event for e in events])
+            self.assertEqual([AUTHOR_NAME, AUTHOR_NAME2, AUTHOR_NAME], [e.user for e in events])
+            self.assertEqual({lock_name}, {e.lock for e in events})
+            self.assertIsNotNone(events[2].held_seconds)
+            self.assertEqual(events, g1.get_lock_events())
+
+    def test_commit_stats(self):
+        with tempfile.TemporaryDirectory() as remote_repo, tempfile.TemporaryDirectory() as local_repo:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            g = GitLocker(
+                GIT_EXEC,
+                local_repo,
+                remote_repo,
+                AUTHOR_NAME,
+                AUTHOR_EMAIL,
+                INSTANCE_NAME
+            )
+            g.do_initial_setup(b"example content", "example")
+
+            plugin_data = os.urandom(100 * 1024)  # incompressible
+            os.makedirs(os.path.join(local_repo, "jameica", "plugins"))
+            with open(os.path.join(local_repo, "jameica", "plugins", "plugin.jar"), "wb") as f:
+                f.write(plugin_data)
+            with open(os.path.join(local_repo, "example"), "w") as f:
+                f.write("changed content")
+            stats = g.stage_and_commit("add plugin")
+            self.assertEqual(2, stats.files)
+            self.assertEqual({"jameica/plugins/plugin.jar", "example"}, set(stats.added_bytes))
+            self.assertGreater(stats.added_bytes["jameica/plugins/plugin.jar"], 100 * 1024)
+            self.assertLess(stats.added_bytes["example"], 100)
+
+            # a copy and a deleted file add nothing
+            with open(os.path.join(local_repo, "plugin-copy.jar"), "wb") as f:
+                f.write(plugin_data)
+            os.unlink(os.path.join(local_repo, "example"))
+            stats = g.stage_and_commit("copy plugin")
+            self.assertEqual(2, stats.files)
+            self.assertEqual({"plugin-copy.jar": 0}, stats.added_bytes)
+            self.assertEqual(0, stats.total_bytes)
+
+    def test_compact_history(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2, \
+                tempfile.TemporaryDirectory() as archive_dir:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            g1 = GitLocker(GIT_EXEC, local_repo1, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME)
+            g2 = GitLocker(GIT_EXEC, local_repo2, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME2)
+
+            g1.do_initial_setup(b"version 0", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+            bundle_path = os.path.join(archive_dir, "history.bundle")
+            self.assertIsNone(g1.compact_history(datetime.now(), bundle_path))  # only the root commit
+
+            # commits dated 2020, 2021, 2022 and now
+            g1.pull_and_lock()
+            for year in (2020, 2021, 2022, None):
+                with open(os.path.join(local_repo1, "example"), "w") as f:
+                    f.write(f"version {year}")
+                env = dict(os.environ)
+                if year:
+                    env["GIT_COMMITTER_DATE"] = env["GIT_AUTHOR_DATE"] = f"{year}-06-01T12:00:00"
+                subprocess.run([GIT_EXEC, "-C", local_repo1, "commit", "-a", "-m", f"commit {year}"],
+                               check=True, env=env)
+            g1.push()
+            old_head = g1.get_commit("HEAD")
+            old_tree = g1.get_commit_summary("HEAD")
+
+            result = g1.compact_history(datetime(2021, 12, 31), bundle_path)
+            self.assertEqual(old_head, result.old_head)
+            self.assertEqual(3, result.archived_commits)  # root, 2020, 2021
+            self.assertEqual(2, result.kept_commits)
+            self.assertEqual(old_tree, g1.get_commit_summary("HEAD"))  # same date, author and message
+            tree = subprocess.run([GIT_EXEC, "-C", local_repo1, "rev-parse", "HEAD^{tree}", f"{old_head}^{{tree}}"],
+                                  check=True, capture_output=True, text=True).stdout.split()
+            self.assertEqual(tree[0], tree[1])
+            count = subprocess.run([GIT_EXEC, "-C", local_repo1, "rev-list", "--count", "HEAD"],
+                                   check=True, capture_output=True, text=True).stdout
+            self.assertEqual("3", count.strip())
+
+            # the archive contains the old history
+            restored = os.path.join(archive_dir, "restored")
+            subprocess.run([GIT_EXEC, "clone", "-q", "-b", ARCHIVE_BRANCH, bundle_path, restored], check=True)
+            with open(os.path.join(restored, "example")) as f:
+                self.assertEqual("version 2021", f.read())
+
+            g1.push_rewritten_history_and_unlock(old_head)
+            self.assertIsNone(g1.get_lock_info())
+            g1.prune_unreachable_objects()
+            self.assertIsNone(g1.get_commit(old_head))
+
+            # the other user switches to the rewritten history
+            self.assertRaises(HistoryRewrittenError, g2.pull)
+            g2.adopt_rewritten_history(old_head)
+            self.assertEqual(result.new_head, g2.get_commit("HEAD"))
+            g2.pull()
+            # the lock journal doesn't belong to the history
+            self.assertEqual([LOCK_ACQUIRED, LOCK_RELEASED], [e.event for e in g2.get_lock_events()])
+
+    def test_compact_history_keeping_lock(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2, \
+                tempfile.TemporaryDirectory() as archive_dir:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            g1 = GitLocker(GIT_EXEC, local_repo1, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME)
+            g2 = GitLocker(GIT_EXEC, local_repo2, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME2)
+            g1.do_initial_setup(b"version 0", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+
+            g1.pull_and_lock()
+            env = dict(os.environ, GIT_COMMITTER_DATE="2020-06-01T12:00:00", GIT_AUTHOR_DATE="2020-06-01T12:00:00")
+            for version in (1, 2):
+                with open(os.path.join(local_repo1, "example"), "w") as f:
+                    f.write(f"version {version}")
+                subprocess.run([GIT_EXEC, "-C", local_repo1, "commit", "-a", "-m", f"version {version}"],
+                               check=True, env=env)
+            g1.push()
+            old_head = g1.get_commit("HEAD")
+            result = g1.compact_history(datetime(2021, 1, 1), os.path.join(archive_dir, "history.bundle"))
+
+            g1.push_rewritten_history(old_head)
+            self.assertTrue(g1.is_locked_by_me())
+            self.assertIsNotNone(g1.get_remote_lock_info())
+            self.assertTrue(g1.is_synced_with_remote_repo())
+            remote_head = subprocess.run([GIT_EXEC, "-C", remote_repo, "rev-parse", "HEAD"],
+                                         check=True, capture_output=True, text=True).stdout.strip()
+            self.assertEqual(result.new_head, remote_head)
+            self.assertRaises(IsLockedError, g2.lock)
+            g1.unlock()
+
+            self.assertRaises(HistoryRewrittenError, g2.pull)
+            g2.adopt_rewritten_history(old_head)
+            self.assertEqual(result.new_head, g2.get_commit("HEAD"))
+            self.assertEqual([LOCK_ACQUIRED, LOCK_REJECTED, LOCK_RELEASED], [e.event for e in g2.get_lock_events()])
+
+    def test_bundle_transport(self):
+        with tempfile.TemporaryDirectory() as remote_repo, \
+                tempfile.TemporaryDirectory() as local_repo1, \
+                tempfile.TemporaryDirectory() as local_repo2, \
+                tempfile.TemporaryDirectory() as bundle_dir:
+            subprocess.run([GIT_EXEC, "-C", remote_repo, "init", "--bare"], check=True)
+            # g1: offline laptop, g2: another user with a connection to the remote repository
+            g1 = GitLocker(GIT_EXEC, local_repo1, remote_repo, AUTHOR_NAME, AUTHOR_EMAIL, INSTANCE_NAME)
+            g2 = GitLocker(GIT_EXEC, local_repo2, remote_repo, AUTHOR_NAME2, AUTHOR_EMAIL2, INSTANCE_NAME2)
+            g1.do_initial_setup(b"version 0", "example")
+            g1.push()
+            g2.do_initial_setup("", "")
+
+            # the remote state travels to the laptop, only the commits it lacks
+            g2.pull_and_lock()
+            with open(os.path.join(local_repo2, "example"), "w") as f:
+                f.write("version 1")
+            g2.stage_and_commit("version 1")
+            g2.push()
+            remote_path = os.path.join(bundle_dir, "remote.bundle")
+            info = g2.export_remote_bundle(remote_path, since=g1.get_commit("@{upstream}"))
+            self.assertEqual(BUNDLE_REMOTE, info.kind)
+            self.assertEqual(1, len(info.lock_names))
+            self.assertRaises(GitError, g2.export_remote_bundle, remote_path, since=info.head)  # nothing new
+
+            g1.import_bundle(remote_path)
+            self.assertEqual(info.head, g1.get_commit("HEAD"))
+            self.assertEqual(g2.get_lock_info(), g1.get_lock_info())
+            g2.unlock()
+
+            # the laptop locks (a small push), works offline and exports its commits with the lock
+            g1.pull_and_lock()
+            with open(os.path.join(local_repo1, "example"), "w") as f:
+                f.write("version 2")
+            g1.stage_and_commit("version 2")
+            upload_path = os.path.join(bundle_dir, "upload.bundle")
+            info = g1.export_bundle(upload_path)
+            self.assertEqual(BUNDLE_UPLOAD, info.kind)
+            self.assertTrue(info.release)
+            self.assertTrue(g1.has_exported_bundle())
+            self.assertTrue(g1.is_locked_by_me())  # until the bundle has been applied
+
+            # someone else applies it: push and unlock in one step
+            info = g2.import_bundle(upload_path)
+            self.assertTrue(info.applied)
+            self.assertIsNone(g2.get_remote_lock_info())
+            self.assertEqual(info.head, g2.get_commit("@{upstream}"))
+            self.assertFalse(g2.import_bundle(upload_path).applied)  # applying it again does nothing
+            events = g2.get_lock_events()
+            self.assertEqual([LOCK_ACQUIRED, LOCK_RELEASED], [e.event for e in events if e.user == AUTHOR_NAME][-2:])
+
+            # the laptop learns that its bundle has been applied
+            self.assertTrue(g1.check_exported_bundle())
+            self.assertFalse(g1.has_exported_bundle())
+            self.assertFalse(g1.is_locked_by_me())
+            self.assertTrue(g1.is_synced_with_remote_repo())
+
+            # a bundle keeping the lock, applied after the lock has been lost
+            g1.pull_and_lock()
+            with open(os.path.join(local_repo1, "example"), "w") as f:
+                f.write("version 3")
+            g1.stage_and_commit("version 3")
+            g1.export_bundle(upload_path, release=False)
+            g1.unlock()
+            self.assertRaises(IsLockedError, g2.import_bundle, upload_path)
+
     def test_delete_local_changes(self):
         with tempfile.TemporaryDirectory() as remote_repo, tempfile.TemporaryDirectory() as local_repo:
             example_file = os.path.join(remote_repo, "example")
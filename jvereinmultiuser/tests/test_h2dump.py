@@ -0,0 +1,139 @@
+import os
+import datetime
+import tempfile
+import textwrap
+import unittest
+from decimal import Decimal
+from unittest import TestCase
+
+from jvereinmultiuser.h2dump import count_rows, iter_rows, read_table, read_tables, H2DumpError
+
+DUMP = textwrap.dedent(r"""
+    ;
+    CREATE USER IF NOT EXISTS "JVEREIN" SALT '5d8a2b' HASH 'e1f0' ADMIN;
+    CREATE SEQUENCE "PUBLIC"."SYSTEM_SEQUENCE_1" START WITH 3 BELONGS_TO_TABLE;
+    CREATE CACHED TABLE "PUBLIC"."MITGLIED"(
+        "ID" INTEGER DEFAULT (NEXT VALUE FOR "PUBLIC"."SYSTEM_SEQUENCE_1") NOT NULL NULL_TO_DEFAULT SEQUENCE "PUBLIC"."SYSTEM_SEQUENCE_1",
+        "NAME" VARCHAR(40) NOT NULL,
+        "EMAIL" VARCHAR(50),
+        "EINTRITT" DATE,
+        "BEITRAG" DECIMAL(10, 2),
+        "AKTIV" BOOLEAN,
+        "GEAENDERT" TIMESTAMP
+    );
+    ALTER TABLE "PUBLIC"."MITGLIED" ADD CONSTRAINT "PUBLIC"."CONSTRAINT_8" PRIMARY KEY("ID");
+    -- 3 +/- SELECT COUNT(*) FROM PUBLIC.MITGLIED;
+    INSERT INTO "PUBLIC"."MITGLIED" VALUES
+    (1, 'O''Brien', 'ob@example.com', DATE '2019-01-01', 12.50, TRUE, TIMESTAMP '2020-02-03 04:05:06.7'),
+    (2, STRINGDECODE('M\u00fcller\nZeile 2 \ud83d\ude00'), NULL, DATE '2020-06-15', 0, FALSE, NULL);
+    INSERT INTO "PUBLIC"."MITGLIED"("NAME", "ID") VALUES
+    ('Mehrzeilig
+    mit ; Semikolon', 3);
+    CREATE MEMORY TABLE PUBLIC.LEER(
+        ID BIGINT NOT NULL,
+        WERT DOUBLE,
+        DATEN VARBINARY
+    );
+    CREATE INDEX "PUBLIC"."IDX_NAME" ON "PUBLIC"."MITGLIED"("NAME");
+""")
+
+
+class TestH2Dump(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._sql_path = os.path.join(self._temp_dir.name, "jverein.sql")
+        with open(self._sql_path, "w", encoding="utf-8") as f:
+            f.write(DUMP)
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+        super().tearDown()
+
+    def test_read_tables(self):
+        tables = read_tables(self._sql_path)
+        self.assertEqual(["MITGLIED", "LEER"], [table.name for table in tables])
+        self.assertEqual(["ID", "NAME", "EMAIL", "EINTRITT", "BEITRAG", "AKTIV", "GEAENDERT"], tables[0].columns)
+        self.assertEqual(["INTEGER", "VARCHAR", "VARCHAR", "DATE", "DECIMAL", "BOOLEAN", "TIMESTAMP"],
+                         tables[0].types)
+        self.assertEqual(["ID", "WERT", "DATEN"], tables[1].columns)
+
+    def test_read_table(self):
+        rows = list(read_table(self._sql_path, "mitglied"))
+        self.assertEqual(3, len(rows))
+        self.assertEqual(
+            (1, "O'Brien", "ob@example.com", datetime.date(2019, 1, 1), Decimal("12.50"), True,
+             datetime.datetime(2020, 2, 3, 4, 5, 6, 700000)),
+            rows[0]
+        )
+        self.assertEqual("Müller\nZeile 2 \U0001F600", rows[1][1])
+        self.assertEqual(Decimal(0), rows[1][4])
+        self.assertIsNone(rows[1][2])
+        self.assertIs(False, rows[1][5])
+
+        # explicit column list, string spanning lines
+        self.assertEqual((3, "Mehrzeilig\nmit ; Semikolon", None, None, None, None, None), rows[2])
+
+        self.assertEqual([], list(read_table(self._sql_path, "LEER")))
+
+    def test_value_types(self):
+        with open(self._sql_path, "a", encoding="utf-8") as f:
+            f.write("INSERT INTO PUBLIC.LEER VALUES (-7, 1.5E3, X'0aff'), (8, 2, NULL);\n")
+        rows = list(read_table(self._sql_path, "LEER"))
+        self.assertEqual([(-7, 1500.0, b"\x0a\xff"), (8, 2.0, None)], rows)
+        self.assertIsInstance(rows[1][1], float)
+
+        tables = [table.name for table, _ in iter_rows(self._sql_path)]
+        self.assertEqual(["MITGLIED"] * 3 + ["LEER"] * 2, tables)
+
+    def test_lobs(self):
+        # written by H2 1.4's Script tool for CLOB/BLOB columns
+        with open(self._sql_path, "a", encoding="utf-8") as f:
+            f.write(textwrap.dedent("""\
+                CREATE CACHED LOCAL TEMPORARY TABLE IF NOT EXISTS SYSTEM_LOB_STREAM(ID INT NOT NULL, PART INT NOT NULL, CDATA VARCHAR, BDATA VARBINARY);
+                ALTER TABLE SYSTEM_LOB_STREAM ADD CONSTRAINT SYSTEM_LOB_STREAM_PRIMARY_KEY PRIMARY KEY(ID, PART);
+                CREATE ALIAS IF NOT EXISTS SYSTEM_COMBINE_CLOB FOR "org.h2.command.dml.ScriptCommand.combineClob";
+                CREATE ALIAS IF NOT EXISTS SYSTEM_COMBINE_BLOB FOR "org.h2.command.dml.ScriptCommand.combineBlob";
+                CREATE CACHED TABLE PUBLIC.MAIL(ID INTEGER NOT NULL, TEXT CLOB, ANHANG BLOB);
+                INSERT INTO SYSTEM_LOB_STREAM VALUES(0, 0, 'Hallo ', NULL);
+                INSERT INTO SYSTEM_LOB_STREAM VALUES(0, 1, STRINGDECODE('Welt\\n'), NULL);
+                INSERT INTO SYSTEM_LOB_STREAM VALUES(1, 0, NULL, '0aff');
+                INSERT INTO PUBLIC.MAIL VALUES
+                (1, SYSTEM_COMBINE_CLOB(0), SYSTEM_COMBINE_BLOB(1)),
+                (2, SYSTEM_COMBINE_CLOB(2), NULL);
+                DROP TABLE IF EXISTS SYSTEM_LOB_STREAM;
+                CALL SYSTEM_COMBINE_BLOB(-1);
+                DROP ALIAS IF EXISTS SYSTEM_COMBINE_CLOB;
+                DROP ALIAS IF EXISTS SYSTEM_COMBINE_BLOB;
+            """))
+        self.assertEqual([(1, "Hallo Welt\n", b"\x0a\xff"), (2, "", None)], list(read_table(self._sql_path, "MAIL")))
+        self.assertEqual(["MITGLIED", "LEER", "MAIL"], [table.name for table in read_tables(self._sql_path)])
+        self.assertEqual(["MITGLIED"] * 3 + ["MAIL"] * 2, [table.name for table, _ in iter_rows(self._sql_path)])
+
+    def test_skip_unwanted_tables(self):
+        # the rows of other tables aren't evaluated, even if they can't be parsed
+        with open(self._sql_path, "a", encoding="utf-8") as f:
+            f.write("INSERT INTO PUBLIC.LEER VALUES (1, SYSTEM_COMBINE_CLOB(7), UNBEKANNT(1));\n"
+                    "INSERT INTO PUBLIC.UNBEKANNT VALUES (1);\n")
+        self.assertEqual(3, len(list(read_table(self._sql_path, "MITGLIED"))))
+        self.assertRaises(H2DumpError, list, read_table(self._sql_path, "LEER"))
+
+    def test_count_rows(self):
+        self.assertEqual({"MITGLIED": 3}, count_rows(self._sql_path))
+
+        with open(self._sql_path, "a", encoding="utf-8") as f:
+            f.write('-- 2 +/- SELECT COUNT(*) FROM "PUBLIC"."LEER";\n')
+        self.assertEqual({"MITGLIED": 3, "LEER": 2}, count_rows(self._sql_path))
+
+    def test_invalid_dump(self):
+        with open(self._sql_path, "a", encoding="utf-8") as f:
+            f.write("INSERT INTO PUBLIC.UNBEKANNT VALUES (1);\n")
+        self.assertRaises(H2DumpError, list, iter_rows(self._sql_path))
+
+        with open(self._sql_path, "w", encoding="utf-8") as f:
+            f.write("CREATE TABLE T(A INT);\nINSERT INTO T VALUES ('unterminated);\n")
+        self.assertRaises(H2DumpError, list, iter_rows(self._sql_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
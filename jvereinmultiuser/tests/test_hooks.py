@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 import unittest
 import tempfile
@@ -22,9 +23,9 @@ class TestHooks(TestCase):
         with tempfile.TemporaryDirectory() as local_repo_dir:
             hooks.create_example_files_if_necessary(local_repo_dir)
             example_script_files = [
-                "linux_post_upload.example.sh",
-                "macos_post_upload.example.sh",
-                "win_post_upload.example.bat",
+                f"{platform}_{hook_name}.example.{extension}"
+                for hook_name in ["pre_lock", "post_setup", "post_teardown", "post_upload", "post_unlock"]
+                for platform, extension in [("linux", "sh"), ("macos", "sh"), ("win", "bat")]
             ]
             resources_hook_dir = os.path.join(os.path.dirname(__file__), "..", "resources", "hooks")
             number_of_files_in_resources_hook_dir = len(os.listdir(resources_hook_dir))
@@ -81,6 +82,47 @@ class TestHooks(TestCase):
             os.chmod(script_path, 0o764)
             self.assertRaisesRegex(hooks.HookExecutionError, "returncode 42", hooks.run_hook, hooks.PostUploadHook, local_repo_dir)
 
+    def test_hook_with_several_scripts(self):
+        with tempfile.TemporaryDirectory() as local_repo_dir:
+            script_name = hooks._get_script_name(hooks.PostUnlockHook)
+            scripts_dir = os.path.join(local_repo_dir, "hooks", f"{os.path.splitext(script_name)[0]}.d")
+            os.makedirs(scripts_dir)
+            for name in ["backup.sh", "notify.sh", "ignored.example.sh"]:
+                script_path = os.path.join(scripts_dir, name)
+                with open(script_path, "w") as f:
+                    f.write(textwrap.dedent(f"""
+                        #!/bin/bash
+                        sleep 1
+                        echo "{name}"
+                        """.lstrip()))
+                os.chmod(script_path, 0o764)
+
+            start = time.monotonic()
+            results = hooks.run_hook(hooks.PostUnlockHook, local_repo_dir)
+            # the scripts run concurrently
+            self.assertLess(time.monotonic() - start, 1.9)
+            self.assertEqual(["backup.sh", "notify.sh"], [os.path.basename(r.script_path) for r in results])
+            self.assertEqual(["backup.sh", "notify.sh"], [r.output for r in results])
+            self.assertEqual([0, 0], [r.returncode for r in results])
+            for result in results:
+                self.assertGreaterEqual(result.duration, 1.0)
+
+    def test_hook_timeout(self):
+        with tempfile.TemporaryDirectory() as local_repo_dir:
+            hooks_dir = os.path.join(local_repo_dir, "hooks")
+            script_path = os.path.join(hooks_dir, hooks._get_script_name(hooks.PreLockHook))
+            os.makedirs(hooks_dir)
+            with open(script_path, "w") as f:
+                f.write(textwrap.dedent(f"""
+                    #!/bin/bash
+                    sleep 30
+                    """.lstrip()))
+            os.chmod(script_path, 0o764)
+            start = time.monotonic()
+            self.assertRaisesRegex(hooks.HookExecutionError, "Zeitüberschreitung",
+                                   hooks.run_hook, hooks.PreLockHook, local_repo_dir, timeout=0.5)
+            self.assertLess(time.monotonic() - start, 10)
+
 
 if __name__ == '__main__':
     unittest.main()
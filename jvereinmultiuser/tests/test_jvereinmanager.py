@@ -4,11 +4,12 @@ import logging
 import textwrap
 import subprocess
 from datetime import date, timedelta
-from unittest import TestCase
+from unittest import TestCase, mock
 from tempfile import TemporaryDirectory
 
 from jvereinmultiuser.jvereinmanager import (
-    JVereinManager, JameicaVersionDiffersError, DEFAULT_JAVA_PATH, DEFAULT_H2_DIR)
+    JVereinManager, JameicaVersionDiffersError, CsvExport, H2RestoreProfile, DEFAULT_EXPORTS, DEFAULT_JAVA_PATH,
+    DEFAULT_H2_DIR)
 
 
 JAVA_PATH = DEFAULT_JAVA_PATH
@@ -225,8 +226,8 @@ class TestJVereinManager(TestCase):
             jdbc_path = os.path.join(repo_dir, "jameica", "jverein", "h2db", "jverein")
             self._set_up_jverein_database(jdbc_path)
 
-            j = JVereinManager(repo_dir)
-            j._export_emails()
+            j = JVereinManager(repo_dir, exports=[DEFAULT_EXPORTS[0]])
+            self.assertEqual(["mitglieder-emails.csv"], j.run_exports())
 
             expected_emails = textwrap.dedent("""\
                 johndoe@example.org
@@ -246,8 +247,8 @@ class TestJVereinManager(TestCase):
             jdbc_path = os.path.join(repo_dir, "jameica", "jverein", "h2db", "jverein")
             self._set_up_jverein_database(jdbc_path)
 
-            j = JVereinManager(repo_dir)
-            j._export_emails_with_expiry_date()
+            j = JVereinManager(repo_dir, exports=[DEFAULT_EXPORTS[1]])
+            self.assertEqual(["mitglieder-emails-austritt.csv"], j.run_exports())
 
             expected_emails = textwrap.dedent(f"""\
                 "4",,"johndoe@example.org","{(date.today() + timedelta(days=14)).isoformat()}"
@@ -258,6 +259,41 @@ class TestJVereinManager(TestCase):
             with open(os.path.join(repo_dir, "dump", "mitglieder-emails-austritt.csv")) as f:
                 self.assertEqual(expected_emails, f.read().strip())
 
+    def test_run_exports(self):
+        with TemporaryDirectory() as tmp_dir:
+            src_dir = os.path.join(os.path.dirname(__file__), "test_jvereinmanager_working_dir")
+            repo_dir = os.path.join(tmp_dir, "repo_dir")
+            shutil.copytree(src_dir, repo_dir)
+
+            jdbc_path = os.path.join(repo_dir, "jameica", "jverein", "h2db", "jverein")
+            self._set_up_jverein_database(jdbc_path)
+
+            dump_dir = os.path.join(repo_dir, "dump")
+            os.makedirs(dump_dir)
+            with open(os.path.join(dump_dir, "kaputt.csv"), "w") as f:
+                f.write("previous content")
+
+            exports = DEFAULT_EXPORTS + [
+                CsvExport(name="kaputt", file="kaputt.csv", sql="SELECT * FROM nicht_vorhanden"),
+                CsvExport(name="ungueltig", file="../ungueltig.csv", sql="SELECT 1"),
+                CsvExport(name="namen",
+                          file="namen.csv",
+                          sql="SELECT name FROM mitglied WHERE vorname LIKE 'J%' AND name <> 'O''Brien' ORDER BY id",
+                          options=r"charset=UTF-8 lineSeparator=\n writeColumnHeader=true"),
+            ]
+            j = JVereinManager(repo_dir, exports=exports)
+            self.assertEqual(["mitglieder-emails.csv", "mitglieder-emails-austritt.csv", "namen.csv"],
+                             j.run_exports())
+
+            # a failing export keeps its previous file and doesn't stop the others
+            with open(os.path.join(dump_dir, "kaputt.csv")) as f:
+                self.assertEqual("previous content", f.read())
+            self.assertFalse(os.path.exists(os.path.join(repo_dir, "ungueltig.csv")))
+            with open(os.path.join(dump_dir, "namen.csv")) as f:
+                self.assertEqual('"NAME"\n"Doe"\n"Doe"', f.read().strip())
+            self.assertEqual(["kaputt.csv", "mitglieder-emails-austritt.csv", "mitglieder-emails.csv", "namen.csv"],
+                             sorted(os.listdir(dump_dir)))
+
     def test__decrypt_passphrase_successful(self):
         encrypted_passphrase = "WmpFkXzBjV6B6ySu9cAH05GusKbdmoZdt+FvVnqP5RpwbP5pQD8nOZKujV7lTqtfrIwz08ASmAtk\r\nTCgJqvJsOE76W4lbUGSLgJWYbSK5W1svu93Ne1exRI6BHG8HvUXiocNpog7Uajuf+3hjn2kYYQLO\r\nnPZo29e8CP17ovqodcw3aKA5PaN4HH+jHR7WfUP/tgZrEBf0zgc9l0vkmLzA3bVVyu88SaY385jl\r\n4ASYWzxPY3xR2y81/MvPIEKio4YmWEUVur5fKYXupVg1ANp1GFK/bfS2hpK1jcm6zmKwR58kQfy1\r\nyMUCsIlhc7k48SFZoi1BQ+Aiza52qRdWtfzRzA\=\="
         master_password = "password"
@@ -366,6 +402,101 @@ class TestJVereinManager(TestCase):
 
             self.assertEqual(expected_compareable_content, actual_comparable_content)
 
+    def test_teardown_journal(self):
+        with TemporaryDirectory() as tmp_dir:
+            src_dir = os.path.join(os.path.dirname(__file__), "test_jvereinmanager_working_dir")
+            repo_dir = os.path.join(tmp_dir, "repo_dir")
+            shutil.copytree(src_dir, repo_dir)
+
+            db_dir = os.path.join(repo_dir, "jameica", "jverein", "h2db")
+            db_paths = [os.path.join(db_dir, "jverein"), os.path.join(db_dir, "second")]
+            os.makedirs(db_dir)
+            for db_path in db_paths:
+                with open(f"{db_path}.sql", "w") as f:
+                    f.write(EXAMPLE_JVEREIN_DATABASE)
+
+            journal_path = os.path.join(tmp_dir, "teardown_journal.json")
+            j = JVereinManager(repo_dir, exports=[], teardown_journal_path=journal_path)
+            for db_path in db_paths:
+                j._register_database(db_path, "jverein", "jverein")
+            j._restore_all_databases()
+            self.assertFalse(j.has_unfinished_teardown())
+
+            # crash while dumping the second database
+            dump_and_delete = j._dump_and_delete_h2_database
+
+            def dump_and_delete_or_crash(db_path, *args):
+                if db_path == db_paths[1]:
+                    raise RuntimeError("crash")
+                dump_and_delete(db_path, *args)
+
+            with mock.patch.object(j, "_dump_and_delete_h2_database", side_effect=dump_and_delete_or_crash):
+                self.assertRaises(RuntimeError, j.teardown)
+            self.assertTrue(j.has_unfinished_teardown())
+            self.assertFalse(os.path.exists(f"{db_paths[0]}.mv.db"))
+            self.assertTrue(os.path.exists(f"{db_paths[1]}.mv.db"))
+
+            # the finished steps are skipped
+            with mock.patch.object(j, "_reset_user_properties_in_properties_files") as reset_properties, \
+                    mock.patch.object(j, "_dump_and_delete_h2_database", wraps=dump_and_delete) as dump_calls:
+                j.teardown()
+            reset_properties.assert_not_called()
+            self.assertEqual([db_paths[1]], [call[0][0] for call in dump_calls.call_args_list])
+            self.assertFalse(os.path.exists(f"{db_paths[1]}.mv.db"))
+            self.assertFalse(j.has_unfinished_teardown())
+            self.assertFalse(os.path.exists(journal_path))
+
+    def test__restore_with_unsupported_profile(self):
+        with TemporaryDirectory() as tmp_dir:
+            sql_path = os.path.join(tmp_dir, "jverein.sql")
+            with open(sql_path, "w") as f:
+                f.write(EXAMPLE_JVEREIN_DATABASE)
+            db_path = os.path.join(tmp_dir, "jverein")
+
+            # falls back to the plain settings
+            j = JVereinManager(tmp_dir, restore_profile=H2RestoreProfile(url_options=";UNKNOWN_SETTING=1"))
+            j._restore_h2_database_from_file(db_path, "", "jverein", "jverein", sql_path)
+            self.assertTrue(os.path.exists(f"{db_path}.mv.db"))
+
+    def test__get_cds_options(self):
+        with TemporaryDirectory() as tmp_dir:
+            java_home = os.path.join(tmp_dir, "javaruntime")
+            os.makedirs(os.path.join(java_home, "bin"))
+            java_path = os.path.join(java_home, "bin", "java")
+            h2_dir = os.path.join(tmp_dir, "h2")
+            os.makedirs(h2_dir)
+            with open(os.path.join(h2_dir, "h2-1.4.199.jar"), "w") as f:
+                f.write("jar")
+            cds_dir = os.path.join(tmp_dir, "cds")
+
+            # unknown Java version
+            j = JVereinManager(tmp_dir, java_path=java_path, h2_jar_dir=h2_dir, cds_dir=cds_dir)
+            self.assertEqual([], j._get_cds_options())
+
+            with open(os.path.join(java_home, "release"), "w") as f:
+                f.write('JAVA_VERSION="1.8.0_292"\n')
+            self.assertEqual([], j._get_cds_options())
+
+            with open(os.path.join(java_home, "release"), "w") as f:
+                f.write('IMPLEMENTOR="Eclipse Adoptium"\nJAVA_VERSION="17.0.2"\n')
+            options = j._get_cds_options()
+            self.assertEqual(1, len(options))
+            self.assertTrue(options[0].startswith(f"-XX:ArchiveClassesAtExit={cds_dir}"))
+            archive_path = options[0].split("=", 1)[1]
+
+            # created by the JVM at exit
+            with open(archive_path, "w") as f:
+                f.write("archive")
+            self.assertEqual([f"-XX:SharedArchiveFile={archive_path}"], j._get_cds_options())
+
+            # another jar: a new archive, the outdated one is deleted
+            with open(os.path.join(h2_dir, "h2-1.4.200.jar"), "w") as f:
+                f.write("new jar")
+            j = JVereinManager(tmp_dir, java_path=java_path, h2_jar_dir=h2_dir, cds_dir=cds_dir)
+            options = j._get_cds_options()
+            self.assertTrue(options[0].startswith("-XX:ArchiveClassesAtExit="))
+            self.assertFalse(os.path.exists(archive_path))
+
     def test__check_jameica_version(self):
         with TemporaryDirectory() as tmp_dir:
             src_dir = os.path.join(os.path.dirname(__file__), "test_jvereinmanager_working_dir")
@@ -0,0 +1,49 @@
+import unittest
+from unittest import TestCase
+
+from jvereinmultiuser.gitlocker import LockEvent, LOCK_ACQUIRED, LOCK_RELEASED, LOCK_REJECTED
+from jvereinmultiuser.lockstats import aggregate
+
+LOCK_ANNA = "lock_Anna_Laptop_2024-03-01_10-00-00"
+LOCK_BEN = "lock_Ben_PC_2024-03-01_12-00-00"
+
+
+class TestLockStats(TestCase):
+    def test_aggregate(self):
+        events = [
+            LockEvent("2024-03-01T10:00:00+01:00", LOCK_ACQUIRED, "Anna", "Laptop", LOCK_ANNA),
+            LockEvent("2024-03-01T10:30:00+01:00", LOCK_REJECTED, "Ben", "PC", LOCK_ANNA),
+            LockEvent("2024-03-01T10:45:00+01:00", LOCK_REJECTED, "Ben", "PC", LOCK_ANNA),
+            LockEvent("2024-03-01T11:00:00+01:00", LOCK_RELEASED, "Anna", "Laptop", LOCK_ANNA, 3600),
+            LockEvent("2024-03-01T12:00:00+01:00", LOCK_ACQUIRED, "Ben", "PC", LOCK_BEN),
+            LockEvent("2024-03-01T12:30:00+01:00", LOCK_RELEASED, "Ben", "PC", LOCK_BEN, 1800),
+            LockEvent("2024-03-01T13:00:00+01:00", LOCK_REJECTED, "Anna", "Laptop", "lock_Alt_PC"),
+        ]
+        stats = aggregate(events)
+        self.assertEqual(7, stats["events"])
+        self.assertEqual(2, stats["acquired"])
+        self.assertEqual(3, stats["rejected"])
+        self.assertEqual(0.6, stats["rejection_rate"])
+        self.assertEqual(5400, stats["held_seconds_total"])
+        self.assertEqual(0.5, stats["utilization"])  # 1.5 of 3 hours
+
+        anna = stats["users"]["Anna"]
+        self.assertEqual((1, 1, 3600, 3600, 3600), (anna["acquired"], anna["released"], anna["held_seconds_total"],
+                                                    anna["held_seconds_mean"], anna["held_seconds_max"]))
+        self.assertEqual(2, anna["blocked_others"])
+        self.assertEqual(1, anna["rejected"])
+        self.assertEqual(2, stats["users"]["Ben"]["rejected"])
+        self.assertEqual(0, stats["users"]["Ben"]["blocked_others"])
+        # holder unknown to the journal
+        self.assertEqual(1, stats["users"]["lock_Alt_PC"]["blocked_others"])
+
+    def test_aggregate_empty(self):
+        stats = aggregate([])
+        self.assertEqual(0, stats["events"])
+        self.assertIsNone(stats["rejection_rate"])
+        self.assertIsNone(stats["utilization"])
+        self.assertEqual({}, stats["users"])
+
+
+if __name__ == '__main__':
+    unittest.main()
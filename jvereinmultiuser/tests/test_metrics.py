@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+from jvereinmultiuser.metrics import Metrics
+
+
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._temp_dir.name, "jverein_multiuser.prom")
+
+    def tearDown(self) -> None:
+        self._temp_dir.cleanup()
+        super().tearDown()
+
+    def _read_samples(self):
+        with open(self._path) as f:
+            return dict(line.rsplit(" ", 1) for line in f.read().splitlines() if not line.startswith("#"))
+
+    def test_write(self):
+        metrics = Metrics(self._path)
+        metrics.write()
+        self.assertFalse(os.path.exists(self._path))  # nothing recorded
+
+        with metrics.measure("teardown"):
+            pass
+        metrics.set("jverein_multiuser_dump_bytes", 1234, database="jverein")
+        metrics.add("jverein_multiuser_push_bytes_total", 100)
+        metrics.write()
+
+        samples = self._read_samples()
+        self.assertIn('jverein_multiuser_phase_duration_seconds{phase="teardown"}', samples)
+        self.assertEqual("1234", samples['jverein_multiuser_dump_bytes{database="jverein"}'])
+        self.assertEqual("100", samples["jverein_multiuser_push_bytes_total"])
+        self.assertEqual("1", samples["jverein_multiuser_sessions_total"])
+        with open(self._path) as f:
+            self.assertIn("# TYPE jverein_multiuser_push_bytes_total counter\n", f.read())
+
+        # next session: gauges are replaced, counters are added up, other series are kept
+        metrics = Metrics(self._path)
+        metrics.set("jverein_multiuser_dump_bytes", 2345, database="jverein")
+        metrics.add("jverein_multiuser_push_bytes_total", 50)
+        metrics.set("jverein_multiuser_hook_duration_seconds", 1.5, hook="post_upload", script='a "b"\\c.sh')
+        metrics.write()
+
+        samples = self._read_samples()
+        self.assertEqual("2345", samples['jverein_multiuser_dump_bytes{database="jverein"}'])
+        self.assertEqual("150", samples["jverein_multiuser_push_bytes_total"])
+        self.assertEqual("2", samples["jverein_multiuser_sessions_total"])
+        self.assertIn('jverein_multiuser_phase_duration_seconds{phase="teardown"}', samples)
+        self.assertEqual(
+            "1.5", samples['jverein_multiuser_hook_duration_seconds{hook="post_upload",script="a \\"b\\"\\\\c.sh"}'])
+
+        # escaped labels are read back unchanged
+        metrics = Metrics(self._path)
+        metrics.add("jverein_multiuser_locks_total", 1)
+        metrics.write()
+        self.assertEqual(
+            "1.5", self._read_samples()[
+                'jverein_multiuser_hook_duration_seconds{hook="post_upload",script="a \\"b\\"\\\\c.sh"}'])
+
+    def test_failed_phase(self):
+        metrics = Metrics(self._path)
+        with self.assertRaises(RuntimeError):
+            with metrics.measure("upload"):
+                raise RuntimeError()
+        metrics.write()
+        self.assertFalse(os.path.exists(self._path))
+
+    def test_unknown_metric(self):
+        metrics = Metrics(self._path)
+        self.assertRaises(ValueError, metrics.set, "jverein_multiuser_unknown", 1)
+        self.assertRaises(ValueError, metrics.set, "jverein_multiuser_locks_total", 1)  # counter
+        self.assertRaises(ValueError, metrics.add, "jverein_multiuser_dump_bytes", 1)  # gauge
+
+
+if __name__ == '__main__':
+    unittest.main()
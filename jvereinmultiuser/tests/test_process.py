@@ -0,0 +1,73 @@
+import sys
+import logging
+import unittest
+import threading
+from unittest import TestCase, mock
+
+import jvereinmultiuser.process as process
+
+PYTHON_EXEC = sys.executable
+
+
+class TestProcess(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        logging.basicConfig(format="[%(asctime)s] %(levelname)s: %(message)s",
+                            datefmt="%Y-%m-%d %H:%M:%S",
+                            level=logging.DEBUG)
+        self._logger = logging.getLogger(__name__)
+
+    def test_run_keeps_tail(self):
+        # enough output on both pipes to block the process if they weren't read concurrently
+        script = "import sys\nfor i in range(20000):\n    print(i)\n    print('err', i, file=sys.stderr)\n"
+        with self.assertLogs(self._logger, level=logging.DEBUG) as logs:
+            result = process.run([PYTHON_EXEC, "-c", script], self._logger, tail_lines=3)
+        self.assertEqual(0, result.returncode)
+        self.assertEqual("19997\n19998\n19999", result.stdout)
+        self.assertEqual("err 19997\nerr 19998\nerr 19999", result.stderr)
+        self.assertIn(f"{self._logger.name}:STDOUT: 0", [log.split(":", 1)[1] for log in logs.output])
+
+    def test_run_keep_stdout(self):
+        result = process.run([PYTHON_EXEC, "-c", "for i in range(500): print(i)"],
+                             self._logger, keep_stdout=True, tail_lines=3)
+        self.assertEqual([str(i) for i in range(500)], result.stdout.split("\n"))
+
+    def test_run_returncode(self):
+        script = "import sys\nprint('fatal: no candidates', file=sys.stderr)\nsys.exit(1)"
+        self.assertEqual(1, process.run([PYTHON_EXEC, "-c", script], self._logger).returncode)
+        self.assertEqual(0, process.run([PYTHON_EXEC, "-c", script], self._logger,
+                                        ignore_err="no candidates").returncode)
+
+    def test_run_progress_lines(self):
+        script = ("import sys\n"
+                  "for i in range(3):\n"
+                  "    sys.stderr.write(f'progress {i}\\r')\n"
+                  "    sys.stderr.flush()\n"
+                  "sys.stderr.write('progress 3, done.\\r\\nnext\\r\\nlast')\n")
+        lines = []
+        result = process.run([PYTHON_EXEC, "-c", script], self._logger, on_stderr_line=lines.append)
+        self.assertEqual(["progress 0", "progress 1", "progress 2", "progress 3, done.", "next", "last"], lines)
+        # the overwritten progress lines aren't kept
+        self.assertEqual("progress 3, done.\nnext\nlast", result.stderr)
+
+    def test_kill_process_tree_on_windows(self):
+        proc = mock.Mock(pid=42)
+        timed_out = threading.Event()
+        with mock.patch.object(process, "_KILL_PROCESS_GROUP", False), \
+                mock.patch.object(process.subprocess, "run", return_value=mock.Mock(returncode=0)) as run:
+            process._kill(proc, timed_out)
+        self.assertEqual(["taskkill", "/T", "/F", "/PID", "42"], run.call_args[0][0])
+        proc.kill.assert_not_called()
+        self.assertTrue(timed_out.is_set())
+
+    def test_format_args(self):
+        self.assertEqual(
+            "java -cp h2.jar org.h2.tools.Script -user jverein -password *** -script x.sql",
+            process.format_args(["java", "-cp", "h2.jar", "org.h2.tools.Script",
+                                 "-user", "jverein", "-password", "secret", "-script", "x.sql"])
+        )
+        self.assertEqual("jameica.sh -f dir -p ***", process.format_args(["jameica.sh", "-f", "dir", "-p", "secret"]))
+
+
+if __name__ == '__main__':
+    unittest.main()